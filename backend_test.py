@@ -2,12 +2,24 @@
 """
 Comprehensive Backend API Test Suite
 Tests the Node.js backend API endpoints for the Teacher Feedback Collection System
+
+Run with --load to drive concurrent virtual users through the same scenarios
+and report throughput and latency percentiles per endpoint. All virtual users
+share one address, so the server's per-client rate limit answers many of them
+with 429; those are reported separately and do not fail the run. Start the
+server with RATE_LIMIT_CLIENT_PER_SECOND=0 to measure it without the limit.
 """
 
 import requests
+import argparse
+import asyncio
 import json
+import math
+import subprocess
 import sys
-from typing import Dict, Any, Optional
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
 import uuid
 
 class BackendAPITester:
@@ -406,9 +418,184 @@ class BackendAPITester:
         return results
 
 
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    # The smallest value with at least pct% of the values at or below it
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+class LoadTester:
+    """Drives concurrent virtual users through the BackendAPITester scenarios.
+    
+    Each virtual user registers and logs in as its own admin, then repeatedly
+    creates a form, submits student feedback to it and reads the summary.
+    """
+
+    def __init__(self, base_url: str, users: int = 10, iterations: int = 5,
+                 submissions_per_form: int = 10, timeout: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.users = users
+        self.iterations = iterations
+        self.submissions_per_form = submissions_per_form
+        self.timeout = timeout
+        
+        # Reuse the functional suite's scenario data
+        scenario = BackendAPITester(base_url)
+        self.admin_user_data = scenario.admin_user_data
+        self.feedback_form_data = scenario.feedback_form_data
+        self.student_feedback_data = scenario.student_feedback_data
+        
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.rate_limited: Dict[str, int] = {}
+
+    async def request(self, client, endpoint: str, method: str, path: str,
+                      data: Optional[Dict] = None, token: Optional[str] = None):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=data, headers=headers)
+            ok = response.status_code == 200
+        except Exception:
+            response, ok = None, False
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - started)
+        if response is not None and response.status_code == 429:
+            # Shed by the server's rate limits on purpose; not a failure
+            self.rate_limited[endpoint] = self.rate_limited.get(endpoint, 0) + 1
+            return None
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return None
+        return response.json() if response.content else {}
+
+    async def virtual_user(self, client, user_index: int):
+        unique_id = f"{user_index}_{str(uuid.uuid4())[:8]}"
+        user_data = dict(
+            self.admin_user_data,
+            username=f"{self.admin_user_data['username']}_{unique_id}",
+            email=f"{unique_id}.{self.admin_user_data['email']}"
+        )
+        
+        if await self.request(client, "register", "POST", "/api/auth/register", user_data) is None:
+            return
+        login = await self.request(client, "login", "POST", "/api/auth/login", {
+            "username": user_data["username"], "password": user_data["password"]
+        })
+        if login is None:
+            return
+        token = login["access_token"]
+        
+        for iteration in range(self.iterations):
+            form = await self.request(client, "create-form", "POST", "/api/forms",
+                                      self.feedback_form_data, token)
+            if form is None:
+                continue
+            for submission in range(self.submissions_per_form):
+                feedback = dict(
+                    self.student_feedback_data,
+                    form_id=form["id"],
+                    student_id=f"{self.student_feedback_data['student_id']}_{submission}"
+                )
+                await self.request(client, "student-submit", "POST", "/api/feedback", feedback)
+            await self.request(client, "summary", "GET", f"/api/forms/{form['id']}/feedback",
+                               token=token)
+
+    async def run(self) -> Dict[str, Any]:
+        import httpx
+        
+        limits = httpx.Limits(max_connections=self.users, max_keepalive_connections=self.users)
+        started = time.perf_counter()
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits) as client:
+            await asyncio.gather(*(self.virtual_user(client, i) for i in range(self.users)))
+        elapsed = time.perf_counter() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, values in self.latencies.items():
+            values = sorted(values)
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "rate_limited": self.rate_limited.get(endpoint, 0),
+                "req_per_s": len(values) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+        total = sum(len(values) for values in self.latencies.values())
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "base_url": self.base_url,
+            "users": self.users,
+            "iterations": self.iterations,
+            "submissions_per_form": self.submissions_per_form,
+            "elapsed_s": elapsed,
+            "total_requests": total,
+            "total_req_per_s": total / elapsed if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_load_report(report: Dict[str, Any]):
+    print("=" * 60)
+    print("📊 LOAD TEST SUMMARY")
+    print("=" * 60)
+    print(f"{'Endpoint':<16}{'Reqs':>7}{'Errs':>6}{'429s':>6}{'Req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<16}{stats['requests']:>7}{stats['errors']:>6}{stats['rate_limited']:>6}{stats['req_per_s']:>9.1f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}")
+    print(f"\nOverall: {report['total_requests']} requests in {report['elapsed_s']:.2f}s "
+          f"({report['total_req_per_s']:.1f} req/s)")
+    rate_limited = sum(stats["rate_limited"] for stats in report["endpoints"].values())
+    if rate_limited:
+        print(f"{rate_limited} requests were rate limited (429); start the server with "
+              f"RATE_LIMIT_CLIENT_PER_SECOND=0 to load test without the per-client limit")
+
+
 def main():
     # Get backend URL from environment or use default
-    backend_url = "https://37229bc6-49d3-44df-9f81-66ed275eb5ea.preview.emergentagent.com"
+    default_url = "https://37229bc6-49d3-44df-9f81-66ed275eb5ea.preview.emergentagent.com"
+    
+    parser = argparse.ArgumentParser(description="Backend API test and load suite")
+    parser.add_argument("base_url", nargs="?", default=default_url)
+    parser.add_argument("--load", action="store_true", help="run the concurrent load mode")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=5, help="forms created per virtual user")
+    parser.add_argument("--submissions", type=int, default=10, help="student submissions per form")
+    parser.add_argument("--output", help="write load results as JSON to this file")
+    args = parser.parse_args()
+    backend_url = args.base_url
+    
+    if args.load:
+        print(f"Backend API Load Test")
+        print(f"Target URL: {backend_url}")
+        print(f"Virtual users: {args.users}, iterations: {args.iterations}, "
+              f"submissions per form: {args.submissions}")
+        print()
+        
+        tester = LoadTester(backend_url, args.users, args.iterations, args.submissions)
+        report = asyncio.run(tester.run())
+        print_load_report(report)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Results written to {args.output}")
+        sys.exit(0 if not any(stats["errors"] for stats in report["endpoints"].values()) else 1)
     
     print(f"Backend API Test Suite")
     print(f"Target URL: {backend_url}")
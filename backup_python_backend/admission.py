@@ -0,0 +1,269 @@
+"""Admission control and load shedding.
+
+``AdmissionMiddleware`` sorts every request into a route class (feedback
+submissions vs. everything else) and admits it through that class's
+``ConcurrencyLimiter``: at most ``limit`` requests run at once, up to
+``queue_size`` more wait, and anything beyond that (or waiting longer than
+``queue_timeout``) is shed immediately with 503 and ``Retry-After``. Because
+each class has its own limiter, a submission storm cannot starve the admin
+routes.
+
+Submissions are also rate limited with token buckets: per client address
+in the middleware, and per form in the submission routes (see
+``form_rate_limiter``). Exhausted buckets answer 429 with ``Retry-After``.
+"""
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+import metrics
+
+SUBMISSION = "submission"
+DEFAULT = "default"
+
+ADMISSION_SUBMISSION_CONCURRENCY = int(os.getenv("ADMISSION_SUBMISSION_CONCURRENCY", "32"))
+ADMISSION_SUBMISSION_QUEUE = int(os.getenv("ADMISSION_SUBMISSION_QUEUE", "128"))
+ADMISSION_SUBMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_SUBMISSION_QUEUE_TIMEOUT_MS", "2000"))
+# 0 disables the limit for routes outside the submission class
+ADMISSION_DEFAULT_CONCURRENCY = int(os.getenv("ADMISSION_DEFAULT_CONCURRENCY", "0"))
+ADMISSION_DEFAULT_QUEUE = int(os.getenv("ADMISSION_DEFAULT_QUEUE", "256"))
+ADMISSION_DEFAULT_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_DEFAULT_QUEUE_TIMEOUT_MS", "5000"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+
+# Token buckets: sustained rate per second and burst size; a rate of 0 disables the bucket.
+# Whole classrooms often share one address, so the per-client default is generous
+RATE_LIMIT_CLIENT_PER_SECOND = float(os.getenv("RATE_LIMIT_CLIENT_PER_SECOND", "20"))
+RATE_LIMIT_CLIENT_BURST = float(os.getenv("RATE_LIMIT_CLIENT_BURST", "100"))
+RATE_LIMIT_FORM_PER_SECOND = float(os.getenv("RATE_LIMIT_FORM_PER_SECOND", "100"))
+RATE_LIMIT_FORM_BURST = float(os.getenv("RATE_LIMIT_FORM_BURST", "500"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+admission_shed = metrics.registry.register(metrics.Counter(
+    "admission_shed_total",
+    "Requests rejected by admission control, by route class and reason",
+    ("route_class", "reason"),
+))
+
+
+class ConcurrencyLimiter:
+    """Bounded concurrency with a bounded, time-limited FIFO wait queue"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout_ms: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout_ms / 1000
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.active = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> Optional[str]:
+        """Wait for a slot; returns the shed reason if the request must be rejected"""
+        if self.limit <= 0 or (self.active < self.limit and not self._waiters):
+            self.active += 1
+            self.admitted += 1
+            return None
+        if len(self._waiters) >= self.queue_size:
+            self.shed_queue_full += 1
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.peak_waiting = max(self.peak_waiting, len(self._waiters))
+        try:
+            # release() hands its slot over by resolving the future
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._pass_on(waiter)
+            self.shed_timeout += 1
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            self._pass_on(waiter)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+        return None
+
+    def _pass_on(self, waiter: asyncio.Future):
+        """Release a slot handed over just as its waiter gave up, so it is not leaked"""
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "queue_timeout_ms": self.queue_timeout * 1000,
+            "active": self.active,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+        }
+
+
+class TokenBucketLimiter:
+    """Token buckets per key, keeping at most ``max_keys`` buckets (least recently used evicted)"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, key: str, cost: float = 1) -> Tuple[bool, float]:
+        """Take ``cost`` tokens; returns (allowed, seconds until retry).
+
+        A cost above the burst size is admitted once the bucket is full and
+        leaves it in debt, so large batches are throttled afterwards rather
+        than rejected forever.
+        """
+        return self.acquire_many({key: cost})
+
+    def acquire_many(self, costs: Dict[str, float]) -> Tuple[bool, float]:
+        """Take tokens from several buckets at once: all are charged, or none if any is short"""
+        if not self.enabled:
+            return True, 0.0
+        now = self._clock()
+        with self._lock:
+            allowed, retry_after = True, 0.0
+            refilled = {}
+            for key, cost in costs.items():
+                tokens, updated = self._buckets.pop(key, (self.burst, now))
+                refilled[key] = tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                needed = min(cost, self.burst)
+                if tokens < needed:
+                    allowed = False
+                    retry_after = max(retry_after, (needed - tokens) / self.rate)
+            for key, tokens in refilled.items():
+                self._buckets[key] = (tokens - costs[key] if allowed else tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        if allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+        return allowed, retry_after
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "keys": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+limiters = {
+    SUBMISSION: ConcurrencyLimiter(
+        SUBMISSION, ADMISSION_SUBMISSION_CONCURRENCY, ADMISSION_SUBMISSION_QUEUE,
+        ADMISSION_SUBMISSION_QUEUE_TIMEOUT_MS
+    ),
+    DEFAULT: ConcurrencyLimiter(
+        DEFAULT, ADMISSION_DEFAULT_CONCURRENCY, ADMISSION_DEFAULT_QUEUE,
+        ADMISSION_DEFAULT_QUEUE_TIMEOUT_MS
+    ),
+}
+client_rate_limiter = TokenBucketLimiter(RATE_LIMIT_CLIENT_PER_SECOND, RATE_LIMIT_CLIENT_BURST)
+form_rate_limiter = TokenBucketLimiter(RATE_LIMIT_FORM_PER_SECOND, RATE_LIMIT_FORM_BURST)
+
+
+def route_class(scope) -> str:
+    path = scope["path"].rstrip("/")
+    if scope["method"] == "POST" and path in ("/api/feedback", "/api/feedback/batch"):
+        return SUBMISSION
+    return DEFAULT
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+def stats() -> dict:
+    result = {name: limiter.stats() for name, limiter in limiters.items()}
+    result["client_rate_limit"] = client_rate_limiter.stats()
+    result["form_rate_limit"] = form_rate_limiter.stats()
+    return result
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", retry_after.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying per-route-class admission and per-client rate limits"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        name = route_class(scope)
+        if name == SUBMISSION:
+            client = scope.get("client")
+            allowed, retry_after = client_rate_limiter.acquire(client[0] if client else "")
+            if not allowed:
+                admission_shed.inc(name, "client_rate")
+                await _reject(send, 429, "Too many requests from this client", retry_after_header(retry_after))
+                return
+
+        limiter = limiters[name]
+        reason = await limiter.acquire()
+        if reason:
+            admission_shed.inc(name, reason)
+            await _reject(
+                send, 503, "Server is busy, please retry shortly",
+                retry_after_header(ADMISSION_RETRY_AFTER_SECONDS)
+            )
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
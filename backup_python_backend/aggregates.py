@@ -0,0 +1,296 @@
+"""Per-form running aggregates for student feedback.
+
+Each form has one document in ``form_aggregates`` holding running sums and
+counts per subject and per criterion. Submissions update it with a single
+atomic ``$inc`` so summaries never have to scan ``student_feedbacks``.
+
+Document shape::
+
+    {
+        "form_id": str,
+        "created_by": str,         # denormalized from the form for rollups
+        "department": str,
+        "year": str,
+        "section": str,
+        "is_active": bool,
+        "response_count": int,
+        "version": int,            # bumped on every submission and form change
+        "subjects": {
+            <subject>: {
+                "sum": float,      # sum of per-student subject averages
+                "count": int,
+                "criteria": {<criterion>: {"sum": int, "count": int}}
+            }
+        }
+    }
+
+Subject and criterion names are escaped with ``escape_key`` because they
+are used as field names in update paths.
+"""
+import argparse
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import ratings_codec
+
+logger = logging.getLogger(__name__)
+
+# Field names may not contain "." or "$" in update paths; use the full-width
+# equivalents as recommended by the MongoDB documentation
+_ESCAPES = str.maketrans({".": "\uff0e", "$": "\uff04"})
+_UNESCAPES = str.maketrans({"\uff0e": ".", "\uff04": "$"})
+
+
+def escape_key(key: str) -> str:
+    return key.translate(_ESCAPES)
+
+
+def unescape_key(key: str) -> str:
+    return key.translate(_UNESCAPES)
+
+
+def compute_averages(ratings: Dict[str, Dict[str, int]]) -> Dict[str, float]:
+    """Calculate the average rating for each subject"""
+    averages = {}
+    for subject, subject_ratings in ratings.items():
+        if subject_ratings:
+            averages[subject] = sum(subject_ratings.values()) / len(subject_ratings)
+    return averages
+
+
+def build_increments(feedbacks: Iterable[dict]) -> Dict[str, float]:
+    """Build a single ``$inc`` document covering all given feedbacks"""
+    inc: Dict[str, float] = {"response_count": 0}
+    for feedback in feedbacks:
+        inc["response_count"] += 1
+        for subject, average in feedback.get("averages", {}).items():
+            prefix = f"subjects.{escape_key(subject)}"
+            inc[f"{prefix}.sum"] = inc.get(f"{prefix}.sum", 0) + average
+            inc[f"{prefix}.count"] = inc.get(f"{prefix}.count", 0) + 1
+        for subject, criteria in feedback.get("ratings", {}).items():
+            for criterion, rating in criteria.items():
+                prefix = f"subjects.{escape_key(subject)}.criteria.{escape_key(criterion)}"
+                inc[f"{prefix}.sum"] = inc.get(f"{prefix}.sum", 0) + rating
+                inc[f"{prefix}.count"] = inc.get(f"{prefix}.count", 0) + 1
+    return inc
+
+
+# Form fields copied onto the aggregate so rollups never have to join forms
+FORM_DIMENSIONS = ("created_by", "department", "year", "section", "is_active")
+
+
+def form_dimensions(form_doc: dict) -> dict:
+    return {field: form_doc.get(field) for field in FORM_DIMENSIONS}
+
+
+def empty_aggregate(form_id: str, form_doc: Optional[dict] = None) -> dict:
+    aggregate = {"form_id": form_id, "response_count": 0, "version": 0, "subjects": {}}
+    if form_doc:
+        aggregate.update(form_dimensions(form_doc))
+    return aggregate
+
+
+async def create_form_aggregate(db, form_doc: dict):
+    """Create the zeroed aggregate document for a new form"""
+    await db.form_aggregates.insert_one(empty_aggregate(form_doc["id"], form_doc))
+
+
+async def sync_form_dimensions(db, form_doc: dict):
+    """Copy a form's department/year/section/owner/status onto its aggregate"""
+    await db.form_aggregates.update_one(
+        {"form_id": form_doc["id"]},
+        {"$set": form_dimensions(form_doc), "$inc": {"version": 1}}
+    )
+
+
+async def record_feedbacks(db, form_id: str, feedbacks: List[dict]):
+    """Fold newly inserted feedbacks into the form's aggregate document"""
+    if not feedbacks:
+        return
+    inc = build_increments(feedbacks)
+    inc["version"] = 1
+    result = await db.form_aggregates.update_one({"form_id": form_id}, {"$inc": inc})
+    if result.matched_count == 0:
+        # The form was archived meanwhile; restoring rebuilds its aggregate from every
+        # submission. Rebuilding here would race the other submissions' $inc
+        logger.warning(f"No aggregate for form {form_id}; {len(feedbacks)} submissions left to its next rebuild")
+
+
+async def record_inserted(db, feedbacks: List[dict]):
+    """Fold inserted feedbacks, possibly for several forms, into their aggregates"""
+    by_form: Dict[str, List[dict]] = {}
+    for feedback in feedbacks:
+        by_form.setdefault(feedback["form_id"], []).append(feedback)
+
+    # Packed submissions need their form's layouts to name the ratings
+    packed_form_ids = [
+        form_id for form_id, form_feedbacks in by_form.items()
+        if any(ratings_codec.is_packed(feedback) for feedback in form_feedbacks)
+    ]
+    if packed_form_ids:
+        forms = await ratings_codec.load_layout_forms(db, packed_form_ids)
+        for form_id in packed_form_ids:
+            by_form[form_id] = [
+                ratings_codec.decode_feedback(feedback, forms[form_id]) for feedback in by_form[form_id]
+            ]
+
+    for form_id, form_feedbacks in by_form.items():
+        await record_feedbacks(db, form_id, form_feedbacks)
+
+
+async def get_form_aggregate(db, form_id: str) -> dict:
+    """Fetch a form's aggregate, computing it from the submissions if it is missing"""
+    aggregate = await db.form_aggregates.find_one({"form_id": form_id})
+    if aggregate is None:
+        # Not stored: only rebuild_form_aggregate writes aggregates computed by a scan
+        form_doc = await db.feedback_forms.find_one({"id": form_id})
+        aggregate = await _compute_aggregate(db, form_id, form_doc)
+    return aggregate
+
+
+async def get_form_versions(db, owner_id: str) -> Dict[str, int]:
+    """Versions of an owner's active forms, read from the aggregates alone"""
+    cursor = db.form_aggregates.find(
+        {"created_by": owner_id, "is_active": True}, {"_id": 0, "form_id": 1, "version": 1}
+    )
+    return {aggregate["form_id"]: aggregate.get("version", 0) async for aggregate in cursor}
+
+
+async def get_response_counts(db, form_ids: List[str]) -> Dict[str, int]:
+    """Look up response counts for many forms in one batched query"""
+    counts = {form_id: 0 for form_id in form_ids}
+    if not form_ids:
+        return counts
+
+    cursor = db.form_aggregates.find(
+        {"form_id": {"$in": form_ids}}, {"form_id": 1, "response_count": 1}
+    )
+    found = set()
+    async for aggregate in cursor:
+        counts[aggregate["form_id"]] = aggregate.get("response_count", 0)
+        found.add(aggregate["form_id"])
+
+    # Forms created before aggregates existed fall back to a single $group
+    missing = [form_id for form_id in form_ids if form_id not in found]
+    if missing:
+        pipeline = [
+            {"$match": {"form_id": {"$in": missing}}},
+            {"$group": {"_id": "$form_id", "count": {"$sum": 1}}},
+        ]
+        async for row in db.student_feedbacks.aggregate(pipeline):
+            counts[row["_id"]] = row["count"]
+    return counts
+
+
+def summarize(aggregate: dict) -> Tuple[int, Dict[str, float], Dict[str, Dict[str, float]]]:
+    """Return total responses, subject averages and criterion averages"""
+    subject_averages = {}
+    criterion_averages = {}
+    for key, totals in aggregate.get("subjects", {}).items():
+        subject = unescape_key(key)
+        if totals.get("count"):
+            subject_averages[subject] = totals["sum"] / totals["count"]
+        criterion_averages[subject] = {
+            unescape_key(criterion): value["sum"] / value["count"]
+            for criterion, value in totals.get("criteria", {}).items()
+            if value.get("count")
+        }
+    return aggregate.get("response_count", 0), subject_averages, criterion_averages
+
+
+def _accumulate(aggregate: dict, feedback_doc: dict):
+    inc = build_increments([feedback_doc])
+    aggregate["response_count"] += inc.pop("response_count")
+    for path, value in inc.items():
+        node = aggregate
+        parts = path.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = node.get(parts[-1], 0) + value
+
+
+async def _compute_aggregate(db, form_id: str, form_doc: Optional[dict]) -> dict:
+    aggregate = empty_aggregate(form_id, form_doc)
+    cursor = db.student_feedbacks.find(
+        {"form_id": form_id}, {"ratings": 1, "averages": 1, ratings_codec.LAYOUT_FIELD: 1}
+    )
+    async for feedback_doc in cursor:
+        if ratings_codec.is_packed(feedback_doc):
+            if form_doc is None:
+                # Without the form there is no layout to decode against
+                continue
+            feedback_doc = ratings_codec.decode_feedback(feedback_doc, form_doc)
+        _accumulate(aggregate, feedback_doc)
+    return aggregate
+
+
+async def rebuild_form_aggregate(db, form_id: str, form_doc: Optional[dict] = None) -> dict:
+    """Recompute one form's aggregate from its raw submissions.
+
+    Submissions ``$inc`` the aggregate without coordinating with this scan:
+    one inserted before the scan whose ``$inc`` lands after the aggregate is
+    replaced would be counted twice. Only rebuild forms that take no
+    submissions meanwhile: at startup, before requests are served (see
+    ``create_missing_aggregates``), while an archive is restored, before its
+    form is reactivated, or from the command line with submissions paused.
+    """
+    if form_doc is None:
+        form_doc = await db.feedback_forms.find_one({"id": form_id})
+    previous = await db.form_aggregates.find_one({"form_id": form_id}, {"version": 1})
+    aggregate = await _compute_aggregate(db, form_id, form_doc)
+    # Keep the version moving forward so cached ETags are invalidated
+    aggregate["version"] = (previous.get("version", 0) if previous else 0) + 1
+    await db.form_aggregates.replace_one({"form_id": form_id}, aggregate, upsert=True)
+    return aggregate
+
+
+async def create_missing_aggregates(db) -> int:
+    """Build aggregates for forms created before aggregates existed; run before serving requests"""
+    existing = set(await db.form_aggregates.distinct("form_id"))
+    form_ids = [doc["id"] async for doc in db.feedback_forms.find({}, {"id": 1}) if doc["id"] not in existing]
+    for form_id in form_ids:
+        await rebuild_form_aggregate(db, form_id)
+    if form_ids:
+        logger.info(f"Built aggregates for {len(form_ids)} forms that had none")
+    return len(form_ids)
+
+
+async def rebuild_all_aggregates(db, form_ids: Optional[List[str]] = None) -> int:
+    """Recompute aggregates for the given forms, or for every form"""
+    if form_ids is None:
+        form_ids = [doc["id"] async for doc in db.feedback_forms.find({}, {"id": 1})]
+
+    for form_id in form_ids:
+        aggregate = await rebuild_form_aggregate(db, form_id)
+        logger.info(f"Rebuilt aggregate for form {form_id}: {aggregate['response_count']} responses")
+    return len(form_ids)
+
+
+async def _main(form_ids: Optional[List[str]]):
+    from database import database
+
+    await database.connect_to_mongo()
+    try:
+        count = await rebuild_all_aggregates(database.database, form_ids)
+        logger.info(f"Rebuilt {count} form aggregates")
+    finally:
+        await database.close_mongo_connection()
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    load_dotenv(Path(__file__).parent / '.env')
+
+    parser = argparse.ArgumentParser(description="Rebuild per-form feedback aggregates; pause submissions to the forms first")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--form-id", action="append", dest="form_ids",
+                        help="Form to rebuild (repeatable); defaults to all forms")
+    args = parser.parse_args()
+    asyncio.run(_main(args.form_ids))
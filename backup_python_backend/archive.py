@@ -0,0 +1,277 @@
+"""Hot/cold tiering for finished forms.
+
+Deactivated forms, and forms older than ``ARCHIVE_AFTER_DAYS`` that have
+had no submissions for as long, are moved out of the live collections so
+their submissions stop counting towards index sizes and the working set.
+
+An archived form is stored as one header document in ``form_archives``
+(the form and its aggregate) plus its submissions in
+``feedback_archive_chunks``: BSON-encoded batches of up to
+``ARCHIVE_CHUNK_SIZE`` submissions, zlib-compressed, one document each.
+
+Both directions are resumable. Archiving writes the header first, removes
+the form from ``feedback_forms`` so no new submissions are accepted, then
+moves submissions one chunk at a time (insert chunk, delete exactly those
+submissions). The aggregate is copied into the header as it is marked
+archived, and only then are the aggregate and term tables dropped.
+Submissions that still arrive through a stale form cache are swept into
+the archive by later runs. Restoring re-inserts the submissions, skipping
+any that are already back, rebuilds the aggregate and term tables from
+them, reactivates the form and only then deletes the archive. A run
+interrupted at any point is finished by running it again.
+
+Run ``python archive.py run`` from cron to archive eligible forms,
+``python archive.py list`` to see archives and
+``python archive.py restore --form-id ID`` to bring one back; admins can
+also restore their own forms through the API.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import bson
+from pymongo.errors import BulkWriteError
+
+import aggregates
+import terms
+from database import DUPLICATE_KEY_ERROR
+from pagination import FEEDBACK_SORT
+
+logger = logging.getLogger(__name__)
+
+# Forms created (or restored) this long ago with no submissions for as long are archived;
+# 0 archives inactive forms only
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+# Recently archived forms are checked for submissions that arrived through a stale form cache
+ARCHIVE_SWEEP_HOURS = int(os.getenv("ARCHIVE_SWEEP_HOURS", "24"))
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "1000"))
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "6"))
+
+ARCHIVING = "archiving"
+ARCHIVED = "archived"
+RESTORING = "restoring"
+
+
+def decode_chunk(data: bytes) -> List[dict]:
+    return bson.decode(zlib.decompress(data))["docs"]
+
+
+async def find_candidates(db, after_days: int = ARCHIVE_AFTER_DAYS, now: Optional[datetime] = None) -> List[str]:
+    """Ids of inactive forms and of forms idle for ``after_days``"""
+    form_ids = [doc["id"] async for doc in db.feedback_forms.find({"is_active": False}, {"_id": 0, "id": 1})]
+    if after_days > 0:
+        cutoff = (now or datetime.utcnow()) - timedelta(days=after_days)
+        cursor = db.feedback_forms.find(
+            {"is_active": True, "created_at": {"$lt": cutoff}}, {"_id": 0, "id": 1, "restored_at": 1}
+        )
+        async for form_doc in cursor:
+            if form_doc.get("restored_at") and form_doc["restored_at"] >= cutoff:
+                continue
+            # Still collecting responses this term: keep it hot
+            recent = await db.student_feedbacks.find_one(
+                {"form_id": form_doc["id"], "submitted_at": {"$gte": cutoff}}, {"_id": 1}
+            )
+            if recent is None:
+                form_ids.append(form_doc["id"])
+    return form_ids
+
+
+async def _move_submissions(db, form_id: str, header: dict) -> dict:
+    """Move a form's live submissions into compressed chunks, one chunk at a time"""
+    last_chunk = await db.feedback_archive_chunks.find_one(
+        {"form_id": form_id}, {"seq": 1}, sort=[("seq", -1)]
+    )
+    seq = last_chunk["seq"] + 1 if last_chunk else 0
+    totals = {key: header.get(key, 0) for key in ("submission_count", "chunk_count", "raw_bytes", "compressed_bytes")}
+
+    while True:
+        batch = await db.student_feedbacks.find({"form_id": form_id}).sort(FEEDBACK_SORT).limit(
+            ARCHIVE_CHUNK_SIZE
+        ).to_list(ARCHIVE_CHUNK_SIZE)
+        if not batch:
+            return totals
+
+        raw = bson.encode({"docs": batch})
+        data = zlib.compress(raw, ARCHIVE_COMPRESSION_LEVEL)
+        await db.feedback_archive_chunks.insert_one({
+            "form_id": form_id, "seq": seq, "count": len(batch), "data": data
+        })
+        # Delete exactly what was archived; anything submitted meanwhile goes in the next chunk
+        await db.student_feedbacks.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+
+        seq += 1
+        totals["submission_count"] += len(batch)
+        totals["chunk_count"] += 1
+        totals["raw_bytes"] += len(raw)
+        totals["compressed_bytes"] += len(data)
+        await db.form_archives.update_one({"form_id": form_id}, {"$set": totals})
+
+
+async def archive_form(db, form_id: str) -> Optional[dict]:
+    """Move one form and its submissions to the archive; returns the archive header"""
+    header = await db.form_archives.find_one({"form_id": form_id})
+
+    if header is None:
+        form_doc = await db.feedback_forms.find_one({"id": form_id})
+        if form_doc is None:
+            return None
+        header = {
+            "form_id": form_id,
+            "created_by": form_doc.get("created_by"),
+            "status": ARCHIVING,
+            "archived_at": datetime.utcnow(),
+            "form": form_doc,
+            "submission_count": 0,
+            "chunk_count": 0,
+            "raw_bytes": 0,
+            "compressed_bytes": 0,
+        }
+        await db.form_archives.insert_one(header)
+    elif header["status"] == RESTORING:
+        # A restore was interrupted; finish it rather than archiving half a form
+        return None
+
+    if header["status"] == ARCHIVING:
+        # Once the form is gone from the live collection no new submissions are accepted
+        await db.feedback_forms.delete_one({"id": form_id})
+        totals = await _move_submissions(db, form_id, header)
+
+        # Captured after the last submission moved, and in the same write that completes the archive
+        update = dict(totals, status=ARCHIVED, aggregate=await db.form_aggregates.find_one({"form_id": form_id}))
+        await db.form_archives.update_one({"form_id": form_id}, {"$set": update})
+        header.update(update)
+    else:
+        # Already archived: sweep in stragglers accepted through a stale form cache
+        totals = await _move_submissions(db, form_id, header)
+        await db.form_archives.update_one({"form_id": form_id}, {"$set": totals})
+        header.update(totals)
+
+    await db.form_aggregates.delete_one({"form_id": form_id})
+    await db.term_frequencies.delete_many({"form_id": form_id})
+    return header
+
+
+async def restore_form(db, form_id: str) -> Optional[int]:
+    """Bring an archived form back into the live collections; returns the submissions restored"""
+    header = await db.form_archives.find_one({"form_id": form_id})
+    if header is None:
+        return None
+    if header["status"] == ARCHIVING:
+        # Finish the interrupted archive first so every submission is in a chunk
+        header = await archive_form(db, form_id)
+    await db.form_archives.update_one({"form_id": form_id}, {"$set": {"status": RESTORING}})
+
+    restored = 0
+    cursor = db.feedback_archive_chunks.find({"form_id": form_id}).sort("seq", 1)
+    async for chunk in cursor:
+        feedback_docs = decode_chunk(chunk["data"])
+        try:
+            await db.student_feedbacks.insert_many(feedback_docs, ordered=False)
+        except BulkWriteError as e:
+            # Submissions already restored by an interrupted run are skipped
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+        restored += len(feedback_docs)
+
+    await terms.rebuild_form_terms(db, form_id)
+    if header.get("aggregate"):
+        # Continue from the archived version so ETags issued before archiving are not reused
+        await db.form_aggregates.replace_one({"form_id": form_id}, header["aggregate"], upsert=True)
+    # Rebuilt while the form takes no submissions, so none is counted twice
+    form_doc = dict(header["form"], is_active=True, restored_at=datetime.utcnow())
+    await aggregates.rebuild_form_aggregate(db, form_id, form_doc)
+
+    # The form goes back last, so it is only served once its data is complete. Restoring
+    # undoes a delete; restored_at keeps it from being archived again for its age straight away
+    await db.feedback_forms.replace_one({"id": form_id}, form_doc, upsert=True)
+
+    await db.feedback_archive_chunks.delete_many({"form_id": form_id})
+    await db.form_archives.delete_one({"form_id": form_id})
+    return restored
+
+
+async def archive_all(db, after_days: int = ARCHIVE_AFTER_DAYS, dry_run: bool = False) -> int:
+    """Archive every eligible form, finishing any interrupted archive first"""
+    form_ids = [doc["form_id"] async for doc in db.form_archives.find({"status": ARCHIVING}, {"form_id": 1})]
+    recent = db.form_archives.find(
+        {"status": ARCHIVED, "archived_at": {"$gte": datetime.utcnow() - timedelta(hours=ARCHIVE_SWEEP_HOURS)}},
+        {"form_id": 1}
+    )
+    async for doc in recent:
+        if await db.student_feedbacks.find_one({"form_id": doc["form_id"]}, {"_id": 1}):
+            form_ids.append(doc["form_id"])
+    form_ids += [form_id for form_id in await find_candidates(db, after_days) if form_id not in form_ids]
+    for form_id in form_ids:
+        if dry_run:
+            logger.info(f"Would archive form {form_id}")
+            continue
+        header = await archive_form(db, form_id)
+        if header:
+            ratio = header["compressed_bytes"] / header["raw_bytes"] if header["raw_bytes"] else 0
+            logger.info(
+                f"Archived form {form_id}: {header['submission_count']} submissions in "
+                f"{header['chunk_count']} chunks ({ratio:.0%} of original size)"
+            )
+    return len(form_ids)
+
+
+async def _main(command: str, form_ids: Optional[List[str]], after_days: int, dry_run: bool):
+    from database import database
+
+    await database.connect_to_mongo()
+    try:
+        db = database.database
+        if command == "run":
+            if form_ids:
+                for form_id in form_ids:
+                    await archive_form(db, form_id)
+                count = len(form_ids)
+            else:
+                count = await archive_all(db, after_days, dry_run)
+            logger.info(f"{'Found' if dry_run else 'Archived'} {count} forms")
+        elif command == "restore":
+            for form_id in form_ids or []:
+                restored = await restore_form(db, form_id)
+                if restored is None:
+                    logger.warning(f"Form {form_id} is not archived")
+                else:
+                    logger.info(f"Restored form {form_id} with {restored} submissions")
+        else:
+            cursor = db.form_archives.find(
+                {}, {"form_id": 1, "status": 1, "archived_at": 1, "submission_count": 1,
+                     "raw_bytes": 1, "compressed_bytes": 1, "form.title": 1}
+            ).sort("archived_at", 1)
+            async for header in cursor:
+                print(f"{header['form_id']}  {header['status']:<9}  {header['archived_at']:%Y-%m-%d}  "
+                      f"{header['submission_count']:>7} submissions  "
+                      f"{header['compressed_bytes']:>10} / {header['raw_bytes']} bytes  {header['form'].get('title')}")
+    finally:
+        await database.close_mongo_connection()
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    load_dotenv(Path(__file__).parent / '.env')
+
+    parser = argparse.ArgumentParser(description="Archive finished forms and restore them")
+    parser.add_argument("command", choices=["run", "restore", "list"])
+    parser.add_argument("--form-id", action="append", dest="form_ids",
+                        help="Form to archive or restore (repeatable); run defaults to all eligible forms")
+    parser.add_argument("--after-days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="Archive active forms idle this long; 0 archives inactive forms only")
+    parser.add_argument("--dry-run", action="store_true", help="List eligible forms without archiving")
+    args = parser.parse_args()
+    if args.command == "restore" and not args.form_ids:
+        parser.error("restore requires --form-id")
+    asyncio.run(_main(args.command, args.form_ids, args.after_days, args.dry_run))
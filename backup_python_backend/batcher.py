@@ -0,0 +1,150 @@
+"""Group-commit write buffer for feedback submissions.
+
+When enabled, ``submit_feedback`` hands each document to a
+``WriteBatcher`` instead of calling ``insert_one``. The batcher collects
+documents from concurrent requests and writes them with one unordered
+``insert_many`` every ``max_items`` documents or ``max_delay_ms``
+milliseconds, whichever comes first. Each caller waits on its own future,
+which resolves only once its batch has been acknowledged; per-document
+write errors such as duplicate keys are raised back to the caller that
+submitted the offending document.
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from database import DUPLICATE_KEY_ERROR
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_WRITE_BEHIND = os.getenv("FEEDBACK_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+FEEDBACK_WRITE_BEHIND_MAX_ITEMS = int(os.getenv("FEEDBACK_WRITE_BEHIND_MAX_ITEMS", "100"))
+FEEDBACK_WRITE_BEHIND_MAX_DELAY_MS = float(os.getenv("FEEDBACK_WRITE_BEHIND_MAX_DELAY_MS", "10"))
+
+
+class WriteBatcher:
+    def __init__(
+        self,
+        get_collection: Callable[[], object],
+        max_items: int = FEEDBACK_WRITE_BEHIND_MAX_ITEMS,
+        max_delay_ms: float = FEEDBACK_WRITE_BEHIND_MAX_DELAY_MS,
+        on_flush: Optional[Callable[[List[dict]], Awaitable[None]]] = None,
+    ):
+        self._get_collection = get_collection
+        self.max_items = max_items
+        self.max_delay = max_delay_ms / 1000
+        self._on_flush = on_flush
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Feedback write-behind enabled: up to {self.max_items} items "
+            f"or {self.max_delay * 1000:g} ms per batch"
+        )
+
+    async def stop(self):
+        """Flush everything queued so far and stop the background task"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+        # Documents queued while the final batch was being written
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                leftover.append(item)
+        if leftover:
+            await self._flush(leftover)
+
+    async def submit(self, document: dict):
+        """Queue a document and wait until its batch has been written"""
+        if not self.running:
+            raise RuntimeError("Write batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((document, future))
+        await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_items:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        documents = [document for document, _ in batch]
+        failures = {}
+        try:
+            await self._get_collection().insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                error_class = DuplicateKeyError if error.get("code") == DUPLICATE_KEY_ERROR else OperationFailure
+                failures[error["index"]] = error_class(error.get("errmsg"), error.get("code"), error)
+        except Exception as e:
+            logger.exception("Feedback batch insert failed")
+            failures = {index: e for index in range(len(batch))}
+
+        self.batches += 1
+        self.items += len(batch)
+        self.errors += len(failures)
+
+        inserted = [document for index, document in enumerate(documents) if index not in failures]
+        if inserted and self._on_flush:
+            try:
+                await self._on_flush(inserted)
+            except Exception:
+                logger.exception("Post-flush hook failed for feedback batch")
+
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in failures:
+                future.set_exception(failures[index])
+            else:
+                future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "max_items": self.max_items,
+            "max_delay_ms": self.max_delay * 1000,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
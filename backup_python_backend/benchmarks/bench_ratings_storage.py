@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Compare document size and scan throughput of dict vs packed ratings.
+
+Builds N synthetic submissions for a form with S subjects x C criteria,
+stores them once in the original dict format and once packed with
+``ratings_codec``, then reports the average BSON size per submission and
+the time to scan each set back and decode it to the API shape.
+
+Usage: python benchmarks/bench_ratings_storage.py [--responses N] [--subjects S] [--criteria C]
+Uses the same environment as the server: MONGO_URL and DB_NAME, or
+STORAGE_BACKEND=memory to run entirely in process.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import bson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import aggregates  # noqa: E402
+import ratings_codec  # noqa: E402
+from database import database  # noqa: E402
+from models import StudentFeedback  # noqa: E402
+
+
+def make_form(subject_count: int, criterion_count: int) -> dict:
+    subjects = [f"Subject {i} Name" for i in range(subject_count)]
+    criteria = [f"Criterion {j} Name" for j in range(criterion_count)]
+    return {
+        "id": f"bench-{uuid.uuid4()}",
+        "subjects": subjects,
+        "evaluation_criteria": criteria,
+        "rating_layouts": [ratings_codec.make_layout(subjects, criteria)],
+    }
+
+
+def make_feedbacks(form_doc: dict, responses: int) -> list:
+    rng = random.Random(42)
+    feedbacks = []
+    for i in range(responses):
+        ratings = {
+            subject: {criterion: rng.randint(1, 5) for criterion in form_doc["evaluation_criteria"]}
+            for subject in form_doc["subjects"]
+        }
+        feedbacks.append(StudentFeedback(
+            form_id=form_doc["id"],
+            student_id=f"STU{i:06d}",
+            ratings=ratings,
+            averages=aggregates.compute_averages(ratings),
+        ).dict())
+    return feedbacks
+
+
+async def scan(db, form_doc: dict) -> float:
+    started = time.perf_counter()
+    async for feedback_doc in db.student_feedbacks.find({"form_id": form_doc["id"]}, {"_id": 0}).batch_size(1000):
+        StudentFeedback(**ratings_codec.decode_feedback(feedback_doc, form_doc))
+    return time.perf_counter() - started
+
+
+async def run(responses: int, subject_count: int, criterion_count: int):
+    dict_form = make_form(subject_count, criterion_count)
+    packed_form = make_form(subject_count, criterion_count)
+    dict_docs = make_feedbacks(dict_form, responses)
+    packed_docs = [
+        ratings_codec.encode_feedback(dict(feedback_doc, form_id=packed_form["id"]), packed_form)
+        for feedback_doc in dict_docs
+    ]
+
+    dict_size = sum(len(bson.encode(doc)) for doc in dict_docs) / responses
+    packed_size = sum(len(bson.encode(doc)) for doc in packed_docs) / responses
+
+    await database.connect_to_mongo()
+    db = database.database
+    try:
+        for docs in (dict_docs, packed_docs):
+            for start in range(0, responses, 1000):
+                await db.student_feedbacks.insert_many(docs[start:start + 1000])
+        dict_scan = await scan(db, dict_form)
+        packed_scan = await scan(db, packed_form)
+    finally:
+        await db.student_feedbacks.delete_many({"form_id": {"$in": [dict_form["id"], packed_form["id"]]}})
+        await database.close_mongo_connection()
+
+    print(f"Responses: {responses} ({subject_count} subjects x {criterion_count} criteria)")
+    print(f"Dict format:   {dict_size:7.1f} bytes/doc  {dict_size * responses / 2**20:7.2f} MiB  "
+          f"scan {responses / dict_scan:9.0f} docs/s")
+    print(f"Packed format: {packed_size:7.1f} bytes/doc  {packed_size * responses / 2**20:7.2f} MiB  "
+          f"scan {responses / packed_scan:9.0f} docs/s")
+    print(f"Size reduction: {1 - packed_size / dict_size:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--responses", type=int, default=10_000)
+    parser.add_argument("--subjects", type=int, default=6)
+    parser.add_argument("--criteria", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.responses, args.subjects, args.criteria))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Compare the vectorized statistics engine with a pure-Python baseline.
+
+Inserts N synthetic submissions for a throwaway form, then times
+``stats.load_ratings`` + ``stats.compute_statistics`` against a baseline that
+walks the same documents with plain loops and the ``statistics`` module.
+Both the end-to-end time (including the read) and the compute-only time over
+data already in memory are reported, and the two results are cross-checked.
+
+Usage: python benchmarks/bench_stats.py [--responses N] [--subjects S] [--criteria C]
+Uses the same environment as the server: MONGO_URL and DB_NAME, or
+STORAGE_BACKEND=memory to run entirely in process.
+"""
+import argparse
+import asyncio
+import math
+import random
+import statistics as pystats
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import stats  # noqa: E402
+from database import database  # noqa: E402
+
+
+def python_percentile(sorted_values, pct):
+    """Linear interpolation, matching NumPy's default percentile method"""
+    position = (len(sorted_values) - 1) * pct / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def python_distribution(values):
+    if not values:
+        return {"count": 0, "mean": None, "std": None, "median": None}
+    ordered = sorted(values)
+    return {
+        "count": len(values),
+        "mean": pystats.fmean(values),
+        "std": pystats.pstdev(values),
+        "median": pystats.median(ordered),
+        "percentiles": {f"p{pct}": python_percentile(ordered, pct) for pct in stats.PERCENTILES},
+        "histogram": {str(rating): values.count(rating) for rating in range(1, 6)},
+    }
+
+
+def python_correlation(xs, ys):
+    pairs = [(x, y) for x, y in zip(xs, ys) if x is not None and y is not None]
+    if len(pairs) < 2:
+        return None
+    mean_x = pystats.fmean(x for x, _ in pairs)
+    mean_y = pystats.fmean(y for _, y in pairs)
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in pairs)
+    var_x = sum((x - mean_x) ** 2 for x, _ in pairs)
+    var_y = sum((y - mean_y) ** 2 for _, y in pairs)
+    if not var_x or not var_y:
+        return None
+    return cov / math.sqrt(var_x * var_y)
+
+
+def python_statistics(feedback_docs, subjects, criteria):
+    pair_values = {(subject, criterion): [] for subject in subjects for criterion in criteria}
+    student_means = {criterion: [] for criterion in criteria}
+    for feedback_doc in feedback_docs:
+        ratings = feedback_doc["ratings"]
+        for criterion in criteria:
+            given = [ratings[s][criterion] for s in subjects if criterion in ratings.get(s, {})]
+            student_means[criterion].append(sum(given) / len(given) if given else None)
+        for subject, subject_ratings in ratings.items():
+            for criterion, rating in subject_ratings.items():
+                if (subject, criterion) in pair_values:
+                    pair_values[(subject, criterion)].append(rating)
+
+    return {
+        "total_responses": len(feedback_docs),
+        "subjects": {
+            subject: {
+                "overall": python_distribution(
+                    [r for criterion in criteria for r in pair_values[(subject, criterion)]]
+                ),
+                "criteria": {
+                    criterion: python_distribution(pair_values[(subject, criterion)])
+                    for criterion in criteria
+                },
+            }
+            for subject in subjects
+        },
+        "criterion_correlations": {
+            a: {b: python_correlation(student_means[a], student_means[b]) for b in criteria}
+            for a in criteria
+        },
+    }
+
+
+def assert_close(a, b, path="stats"):
+    if isinstance(a, dict):
+        for key in b:
+            if key in a:
+                assert_close(a[key], b[key], f"{path}.{key}")
+    elif a is None or b is None:
+        assert a is None and b is None, f"{path}: {a} != {b}"
+    else:
+        assert math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9), f"{path}: {a} != {b}"
+
+
+async def run(responses: int, subject_count: int, criterion_count: int):
+    await database.connect_to_mongo()
+    db = database.database
+    subjects = [f"Subject {i}" for i in range(subject_count)]
+    criteria = [f"Criterion {j}" for j in range(criterion_count)]
+    form_doc = {"id": f"bench-{uuid.uuid4()}", "subjects": subjects, "evaluation_criteria": criteria}
+    rng = random.Random(42)
+
+    try:
+        docs = [
+            {
+                "id": str(uuid.uuid4()),
+                "form_id": form_doc["id"],
+                "student_id": f"STU{i:06d}",
+                "ratings": {s: {c: rng.randint(1, 5) for c in criteria} for s in subjects},
+            }
+            for i in range(responses)
+        ]
+        for start in range(0, responses, 1000):
+            await db.student_feedbacks.insert_many(docs[start:start + 1000])
+
+        started = time.perf_counter()
+        ratings = await stats.load_ratings(db, form_doc)
+        loaded = time.perf_counter()
+        vectorized = stats.compute_statistics(ratings, subjects, criteria)
+        numpy_done = time.perf_counter()
+
+        feedback_docs = await db.student_feedbacks.find(
+            {"form_id": form_doc["id"]}, {"_id": 0, "ratings": 1}
+        ).to_list(length=None)
+        fetched = time.perf_counter()
+        baseline = python_statistics(feedback_docs, subjects, criteria)
+        python_done = time.perf_counter()
+    finally:
+        await db.student_feedbacks.delete_many({"form_id": form_doc["id"]})
+        await database.close_mongo_connection()
+
+    assert_close(vectorized, baseline)
+
+    numpy_compute = numpy_done - loaded
+    python_compute = python_done - fetched
+    print(f"Responses: {responses} ({subject_count} subjects x {criterion_count} criteria)")
+    print(f"NumPy:       load {loaded - started:.3f}s  compute {numpy_compute:.4f}s  total {numpy_done - started:.3f}s")
+    print(f"Pure Python: load {fetched - numpy_done:.3f}s  compute {python_compute:.4f}s  total {python_done - numpy_done:.3f}s")
+    print(f"Compute speedup: {python_compute / numpy_compute:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--responses", type=int, default=10_000)
+    parser.add_argument("--subjects", type=int, default=5)
+    parser.add_argument("--criteria", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.responses, args.subjects, args.criteria))
+
+
+if __name__ == "__main__":
+    main()
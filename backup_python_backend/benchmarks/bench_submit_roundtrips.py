@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Count database round trips per feedback submission.
+
+Drives POST /api/feedback in-process and counts every collection call the
+route makes, broken down by collection and operation. With a warm form
+cache a submission costs one insert into student_feedbacks plus one $inc
+on its form aggregate; the form lookup and the duplicate check no longer
+touch the database. A submission with a comment adds one $inc upsert on
+its month's term table, so submissions with and without a comment are
+measured separately.
+
+Usage: python benchmarks/bench_submit_roundtrips.py [--submissions N]
+Uses the same environment as the server: MONGO_URL and DB_NAME, or
+STORAGE_BACKEND=memory to run entirely in process.
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+
+import admission  # noqa: E402
+import server  # noqa: E402
+from cache import form_cache  # noqa: E402
+from database import database  # noqa: E402
+
+COUNTED_METHODS = {
+    "find", "find_one", "insert_one", "insert_many", "update_one", "replace_one",
+    "find_one_and_update", "count_documents", "aggregate", "delete_one", "delete_many",
+}
+
+
+class CountingCollection:
+    def __init__(self, collection, counter: Counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in COUNTED_METHODS:
+            def counted(*args, **kwargs):
+                self._counter[(self._collection.name, name)] += 1
+                return attr(*args, **kwargs)
+            return counted
+        return attr
+
+
+class CountingDatabase:
+    def __init__(self, db, counter: Counter):
+        self._db = db
+        self.counter = counter
+
+    def __getattr__(self, name):
+        return CountingCollection(getattr(self._db, name), self.counter)
+
+    def __getitem__(self, name):
+        return self.__getattr__(name)
+
+
+async def run(submissions: int, cold: bool):
+    # Every submission comes from one client to one form; measure round trips, not rate limits
+    admission.client_rate_limiter.rate = 0
+    admission.form_rate_limiter.rate = 0
+    await database.connect_to_mongo()
+    real_db = database.database
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            unique_id = str(uuid.uuid4())[:8]
+            response = await client.post("/api/auth/register", json={
+                "username": f"bench_{unique_id}",
+                "email": f"bench.{unique_id}@university.edu",
+                "password": "SecurePassword123!",
+                "role": "admin"
+            })
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            form = (await client.post("/api/forms", headers=headers, json={
+                "title": "Round trip benchmark",
+                "year": "2024",
+                "section": "A",
+                "department": "Computer Science",
+                "subjects": ["Data Structures", "Algorithms"],
+                "evaluation_criteria": ["Teaching Quality", "Communication"]
+            })).json()
+
+            # Warm the cache the way a student opening the shareable link does
+            await client.get(f"/api/forms/{form['id']}")
+
+            results = []
+            for label, comments in [("without comment", None), ("with comment", "Office hours were really helpful")]:
+                counter = Counter()
+                database.database = CountingDatabase(real_db, counter)
+                started = time.perf_counter()
+                for i in range(submissions):
+                    if cold:
+                        form_cache.clear()
+                    response = await client.post("/api/feedback", json={
+                        "form_id": form["id"],
+                        "student_id": f"STU{len(results)}{i:06d}",
+                        "ratings": {
+                            "Data Structures": {"Teaching Quality": 5, "Communication": 4},
+                            "Algorithms": {"Teaching Quality": 4, "Communication": 5}
+                        },
+                        "comments": comments
+                    })
+                    assert response.status_code == 200, response.text
+                results.append((label, counter, time.perf_counter() - started))
+                database.database = real_db
+    finally:
+        database.database = real_db
+        await database.close_mongo_connection()
+
+    print(f"Submissions: {submissions} per case ({'cold' if cold else 'warm'} form cache)")
+    for label, counter, elapsed in results:
+        print(f"Submissions {label}:")
+        print(f"  Throughput: {submissions / elapsed:.1f} submissions/s")
+        print(f"  Round trips per submission: {sum(counter.values()) / submissions:.2f}")
+        for (collection, operation), count in sorted(counter.items()):
+            print(f"    {collection}.{operation}: {count / submissions:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=500)
+    parser.add_argument("--cold", action="store_true", help="clear the form cache before every submission")
+    args = parser.parse_args()
+    asyncio.run(run(args.submissions, args.cold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Measure CPU time per request on the feedback summary route.
+
+Loads N submissions into one form, then requests
+GET /api/forms/{form_id}/feedback repeatedly in-process, once with trusted
+reads (dicts built without validation, serialized with orjson when
+installed) and once with TRUSTED_READS off (FastAPI validates the same
+content through the route's response_model). Process CPU time is used
+rather than wall time so the figure is the server's own work.
+
+Usage: python benchmarks/bench_summary_cpu.py [--responses N] [--requests R]
+Uses the same environment as the server: MONGO_URL and DB_NAME, or
+STORAGE_BACKEND=memory to run entirely in process.
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+
+import serialization  # noqa: E402
+import server  # noqa: E402
+from database import database  # noqa: E402
+
+SUBJECTS = [f"Subject {i}" for i in range(6)]
+CRITERIA = [f"Criterion {j}" for j in range(5)]
+
+
+async def measure(client, url: str, headers: dict, requests: int) -> float:
+    # One warm-up request so both modes start from the same state
+    await client.get(url, headers=headers)
+    started = time.process_time()
+    for _ in range(requests):
+        response = await client.get(url, headers=headers)
+        assert response.status_code == 200, response.text
+    return (time.process_time() - started) / requests
+
+
+async def run(responses: int, requests: int):
+    await database.connect_to_mongo()
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            unique_id = str(uuid.uuid4())[:8]
+            response = await client.post("/api/auth/register", json={
+                "username": f"bench_{unique_id}",
+                "email": f"bench.{unique_id}@university.edu",
+                "password": "SecurePassword123!",
+                "role": "admin"
+            })
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            form = (await client.post("/api/forms", headers=headers, json={
+                "title": "Summary CPU benchmark",
+                "year": "2024",
+                "section": "A",
+                "department": "Computer Science",
+                "subjects": SUBJECTS,
+                "evaluation_criteria": CRITERIA
+            })).json()
+
+            for start in range(0, responses, server.FEEDBACK_BATCH_MAX_ITEMS):
+                batch = [
+                    {
+                        "form_id": form["id"],
+                        "student_id": f"STU{i:06d}",
+                        "ratings": {s: {c: (i + j) % 5 + 1 for j, c in enumerate(CRITERIA)} for s in SUBJECTS},
+                        "comments": "Clear explanations, more examples please"
+                    }
+                    for i in range(start, min(start + server.FEEDBACK_BATCH_MAX_ITEMS, responses))
+                ]
+                response = await client.post("/api/feedback/batch", json=batch)
+                assert response.status_code == 200, response.text
+
+            url = f"/api/forms/{form['id']}/feedback"
+            serialization.TRUSTED_READS = True
+            trusted = await measure(client, url, headers, requests)
+            serialization.TRUSTED_READS = False
+            validated = await measure(client, url, headers, requests)
+    finally:
+        await database.close_mongo_connection()
+
+    encoder = "orjson" if serialization.orjson is not None else "json"
+    print(f"Responses per summary: {responses} ({len(SUBJECTS)} subjects x {len(CRITERIA)} criteria)")
+    print(f"Validated reads:       {validated * 1000:8.1f} ms CPU/request")
+    print(f"Trusted reads ({encoder}): {trusted * 1000:8.1f} ms CPU/request")
+    print(f"CPU saved per request: {1 - trusted / validated:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--responses", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.responses, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Show that top-term queries cost the same however many responses a form has.
+
+For each response count, inserts synthetic commented submissions for a
+throwaway form spread over six months, folding them into the term tables
+with ``terms.record_comments`` exactly as the submission routes do. It then
+times ``terms.top_terms`` over the precomputed tables against the
+alternative of reading and tokenizing every comment on each request, and
+cross-checks the two results.
+
+Usage: python benchmarks/bench_terms.py [--responses N ...] [--repeat R]
+Uses the same environment as the server: MONGO_URL and DB_NAME, or
+STORAGE_BACKEND=memory to run entirely in process.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import terms  # noqa: E402
+from database import database  # noqa: E402
+
+VOCABULARY = (
+    "office hours lectures labs assignments exams feedback examples slides pace clear helpful "
+    "confusing engaging organized boring practical theory projects tutorials grading deadlines "
+    "textbook recordings quizzes explanations questions availability workload notes group"
+).split()
+FILLERS = ["the", "was", "very", "and", "too", "more", "with", "were", "really"]
+MONTHS = [datetime(2024, month, 15) for month in range(1, 7)]
+
+
+def synthetic_comment(rng: random.Random) -> str:
+    words = []
+    for _ in range(rng.randint(4, 16)):
+        words.append(rng.choice(VOCABULARY) if rng.random() < 0.6 else rng.choice(FILLERS))
+    return " ".join(words).capitalize() + "."
+
+
+def tokenize_all(comments) -> dict:
+    """The per-request alternative: tokenize every comment"""
+    term_counts, phrase_counts = Counter(), Counter()
+    for comment in comments:
+        found_terms, found_phrases = terms.extract(comment)
+        term_counts.update(found_terms)
+        phrase_counts.update(found_phrases)
+    return {"terms": terms._top(term_counts, 20), "phrases": terms._top(phrase_counts, 20)}
+
+
+async def measure(db, responses: int, repeat: int):
+    form_id = f"bench-{uuid.uuid4()}"
+    rng = random.Random(responses)
+    try:
+        for start in range(0, responses, 1000):
+            docs = [
+                {
+                    "id": str(uuid.uuid4()),
+                    "form_id": form_id,
+                    "student_id": f"STU{i:06d}",
+                    "ratings": {},
+                    "comments": synthetic_comment(rng),
+                    "submitted_at": rng.choice(MONTHS),
+                }
+                for i in range(start, min(start + 1000, responses))
+            ]
+            await db.student_feedbacks.insert_many(docs)
+            await terms.record_comments(db, docs)
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            precomputed = await terms.top_terms(db, [form_id])
+        table_time = (time.perf_counter() - started) / repeat
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            comments = [
+                doc["comments"] async for doc in
+                db.student_feedbacks.find({"form_id": form_id}, {"_id": 0, "comments": 1})
+            ]
+            scanned = tokenize_all(comments)
+        scan_time = (time.perf_counter() - started) / repeat
+    finally:
+        await db.student_feedbacks.delete_many({"form_id": form_id})
+        await db.term_frequencies.delete_many({"form_id": form_id})
+
+    assert precomputed["terms"] == scanned["terms"], "term counts differ"
+    assert precomputed["phrases"] == scanned["phrases"], "phrase counts differ"
+    return table_time, scan_time
+
+
+async def run(response_counts, repeat: int):
+    await database.connect_to_mongo()
+    try:
+        print(f"{'Responses':>10}  {'Term tables':>12}  {'Tokenize all':>13}  {'Speedup':>8}")
+        for responses in response_counts:
+            table_time, scan_time = await measure(database.database, responses, repeat)
+            print(f"{responses:>10}  {table_time * 1000:>10.2f}ms  {scan_time * 1000:>11.2f}ms  "
+                  f"{scan_time / table_time:>7.0f}x")
+    finally:
+        await database.close_mongo_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--responses", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.responses, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
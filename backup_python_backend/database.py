@@ -3,25 +3,52 @@ import os
 from typing import Optional
 import logging
 
+from indexes import index_manager
+from metrics import mongo_command_listener
+
 logger = logging.getLogger(__name__)
 
+# Server error codes, shared by both storage backends: unique index violations,
+# and a query (such as $text) needing an index that does not exist yet
+DUPLICATE_KEY_ERROR = 11000
+INDEX_NOT_FOUND = 27
+
 class Database:
+    """Holds the active storage backend.
+
+    ``database`` is either a Motor database or a ``memory_store``
+    ``MemoryDatabase``; both expose the same collection API to the routes.
+    """
     client: Optional[AsyncIOMotorClient] = None
     database = None
 
-    async def connect_to_mongo(self):
+    async def connect_to_mongo(self, build_indexes: bool = True):
         """Create database connection"""
         try:
-            mongo_url = os.environ.get('MONGO_URL')
-            if not mongo_url:
-                raise ValueError("MONGO_URL environment variable not set")
+            # STORAGE_BACKEND=memory runs everything in process without MongoDB
+            backend = os.environ.get('STORAGE_BACKEND', 'mongo')
+            if backend == 'memory':
+                from memory_store import MemoryClient
+                self.client = MemoryClient()
+                self.database = self.client[os.environ.get('DB_NAME', 'teacher_feedback')]
+                logger.info("Using in-memory storage engine")
+            elif backend == 'mongo':
+                mongo_url = os.environ.get('MONGO_URL')
+                if not mongo_url:
+                    raise ValueError("MONGO_URL environment variable not set")
+                
+                self.client = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_command_listener])
+                self.database = self.client[os.environ.get('DB_NAME', 'teacher_feedback')]
+                logger.info("Connected to MongoDB")
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
             
-            self.client = AsyncIOMotorClient(mongo_url)
-            self.database = self.client[os.environ.get('DB_NAME', 'teacher_feedback')]
-            logger.info("Connected to MongoDB")
-            
-            # Create indexes for better performance
-            await self.create_indexes()
+            # Build missing indexes; only the critical unique ones delay startup
+            if build_indexes:
+                try:
+                    await index_manager.ensure(self.database)
+                except Exception as e:
+                    logger.warning(f"Error creating indexes: {e}")
             
         except Exception as e:
             logger.error(f"Error connecting to MongoDB: {e}")
@@ -29,28 +56,9 @@ class Database:
 
     async def close_mongo_connection(self):
         """Close database connection"""
+        await index_manager.cancel()
         if self.client:
             self.client.close()
             logger.info("Disconnected from MongoDB")
 
-    async def create_indexes(self):
-        """Create database indexes"""
-        try:
-            # Users collection indexes
-            await self.database.users.create_index("username", unique=True)
-            await self.database.users.create_index("email", unique=True)
-            
-            # Feedback forms collection indexes
-            await self.database.feedback_forms.create_index("created_by")
-            await self.database.feedback_forms.create_index("is_active")
-            
-            # Student feedbacks collection indexes
-            await self.database.student_feedbacks.create_index("form_id")
-            await self.database.student_feedbacks.create_index("student_id")
-            await self.database.student_feedbacks.create_index([("form_id", 1), ("student_id", 1)], unique=True)
-            
-            logger.info("Database indexes created successfully")
-        except Exception as e:
-            logger.warning(f"Error creating indexes: {e}")
-
 database = Database()
\ No newline at end of file
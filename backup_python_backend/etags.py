@@ -0,0 +1,39 @@
+"""ETags for conditional GETs on admin dashboard routes.
+
+Every form's aggregate carries a ``version`` that is incremented on each
+submission and on every change to the form itself. A representation's ETag
+is derived from that version (or, for the form listing, from the owner's
+form versions) plus the request's query string, so a poll that finds
+nothing changed is answered with 304 before any submission is read.
+"""
+import hashlib
+from typing import Iterable, Optional, Tuple
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=8).hexdigest()
+
+
+def form_etag(form_id: str, version: int, query: str = "") -> str:
+    """Strong ETag for one form's representation"""
+    return f'"{form_id}-{version}-{_digest(query)}"'
+
+
+def forms_etag(versions: Iterable[Tuple[str, int]], query: str = "") -> str:
+    """Weak ETag for a listing, derived from every listed form's version"""
+    parts = [f"{form_id}:{version}" for form_id, version in sorted(versions)]
+    return f'W/"{_digest(query, *parts)}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for If-None-Match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in if_none_match.split(",")}
@@ -0,0 +1,224 @@
+"""Declarative index management.
+
+``DESIRED_INDEXES`` lists every index the queries rely on. At startup
+``IndexManager`` reads each collection's existing indexes, diffs them
+against the desired ones by key pattern and options, and builds only the
+missing ones, concurrently. Unique indexes the application depends on for
+correctness (duplicate users and submissions) are awaited before the app
+serves requests; everything else is built in a background task so startup
+is never blocked by a long index build.
+
+Run ``python indexes.py status`` to see the diff or
+``python indexes.py sync`` to build missing indexes and wait for them.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec:
+    def __init__(self, collection: str, keys: List[Tuple[str, Any]], unique: bool = False,
+                 critical: bool = False):
+        self.collection = collection
+        self.keys = keys
+        self.unique = unique
+        # Critical indexes enforce constraints the routes rely on and are built before serving
+        self.critical = critical
+
+    @property
+    def name(self) -> str:
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+    def matches(self, info: dict) -> bool:
+        text_fields = {field for field, direction in self.keys if direction == "text"}
+        if text_fields:
+            # Text indexes are reported by their internal "_fts" key; compare the indexed fields
+            return set(info.get("weights", {})) == text_fields
+        return list(map(tuple, info.get("key", []))) == self.keys and bool(info.get("unique")) == self.unique
+
+    def __repr__(self) -> str:
+        unique = " unique" if self.unique else ""
+        return f"{self.collection}.{self.name}{unique}"
+
+
+DESIRED_INDEXES = [
+    # Users: login and registration lookups, token subject lookups
+    IndexSpec("users", [("username", 1)], unique=True, critical=True),
+    IndexSpec("users", [("email", 1)], unique=True, critical=True),
+    IndexSpec("users", [("id", 1)]),
+
+    # Feedback forms: lookups by id, the owner's form list in each sort order, unfiltered
+    # and filtered by department, year or section (the created_at index also serves
+    # unsorted lookups by owner; a second filter is applied to the first one's matches)
+    IndexSpec("feedback_forms", [("id", 1)], unique=True, critical=True),
+    IndexSpec("feedback_forms", [("created_by", 1), ("is_active", 1), ("created_at", 1), ("id", 1)]),
+    IndexSpec("feedback_forms", [("created_by", 1), ("is_active", 1), ("title", 1), ("id", 1)]),
+    IndexSpec("feedback_forms", [("created_by", 1), ("is_active", 1), ("department", 1), ("created_at", 1), ("id", 1)]),
+    IndexSpec("feedback_forms", [("created_by", 1), ("is_active", 1), ("department", 1), ("title", 1), ("id", 1)]),
+    IndexSpec("feedback_forms", [("created_by", 1), ("is_active", 1), ("year", 1), ("created_at", 1), ("id", 1)]),
+    IndexSpec("feedback_forms", [("created_by", 1), ("is_active", 1), ("year", 1), ("title", 1), ("id", 1)]),
+    IndexSpec("feedback_forms", [("created_by", 1), ("is_active", 1), ("section", 1), ("created_at", 1), ("id", 1)]),
+    IndexSpec("feedback_forms", [("created_by", 1), ("is_active", 1), ("section", 1), ("title", 1), ("id", 1)]),
+    IndexSpec("feedback_forms", [("is_active", 1)]),
+
+    # Student feedbacks: one submission per student per form, keyset pages
+    IndexSpec("student_feedbacks", [("form_id", 1), ("student_id", 1)], unique=True, critical=True),
+    IndexSpec("student_feedbacks", [("form_id", 1), ("submitted_at", 1), ("id", 1)]),
+    IndexSpec("student_feedbacks", [("student_id", 1)]),
+    # Comment search; a collection can have only one text index. It is built in the
+    # background, and the search route answers 503 until it exists
+    IndexSpec("student_feedbacks", [("comments", "text")]),
+
+    # Form aggregates: one per form, list versions and the form list by response count per
+    # owner, unfiltered and filtered (the filtered ones also serve filtered rollups)
+    IndexSpec("form_aggregates", [("form_id", 1)], unique=True, critical=True),
+    IndexSpec("form_aggregates", [("created_by", 1), ("is_active", 1), ("response_count", 1), ("form_id", 1)]),
+    IndexSpec("form_aggregates", [("created_by", 1), ("is_active", 1), ("department", 1), ("response_count", 1), ("form_id", 1)]),
+    IndexSpec("form_aggregates", [("created_by", 1), ("is_active", 1), ("year", 1), ("response_count", 1), ("form_id", 1)]),
+    IndexSpec("form_aggregates", [("created_by", 1), ("is_active", 1), ("section", 1), ("response_count", 1), ("form_id", 1)]),
+
+    # Term tables: one per form and month, read by form and month range
+    IndexSpec("term_frequencies", [("form_id", 1), ("period", 1)], unique=True, critical=True),
+
+    # Archives: one header per form listed by owner, chunks read in order
+    IndexSpec("form_archives", [("form_id", 1)], unique=True, critical=True),
+    IndexSpec("form_archives", [("created_by", 1), ("archived_at", 1)]),
+    IndexSpec("form_archives", [("status", 1), ("archived_at", 1)]),
+    IndexSpec("feedback_archive_chunks", [("form_id", 1), ("seq", 1)], unique=True, critical=True),
+]
+
+
+class IndexManager:
+    def __init__(self, specs: List[IndexSpec] = DESIRED_INDEXES):
+        self.specs = specs
+        self._task: Optional[asyncio.Task] = None
+        self.pending: List[str] = []
+        self.built: List[str] = []
+        self.failed: Dict[str, str] = {}
+        self.last_duration_ms: Optional[float] = None
+
+    async def diff(self, db) -> Tuple[List[IndexSpec], Dict[str, List[str]]]:
+        """Return the missing specs and, per collection, existing indexes nobody asked for"""
+        collections = sorted({spec.collection for spec in self.specs})
+        infos = await asyncio.gather(*(db[name].index_information() for name in collections))
+        existing = dict(zip(collections, infos))
+
+        missing = []
+        extra = {}
+        for collection in collections:
+            specs = [spec for spec in self.specs if spec.collection == collection]
+            for spec in specs:
+                if not any(spec.matches(info) for info in existing[collection].values()):
+                    missing.append(spec)
+            unused = [
+                name for name, info in existing[collection].items()
+                if name != "_id_" and not any(spec.matches(info) for spec in specs)
+            ]
+            if unused:
+                extra[collection] = unused
+        return missing, extra
+
+    async def _build(self, db, spec: IndexSpec):
+        started = time.perf_counter()
+        try:
+            await db[spec.collection].create_index(spec.keys, unique=spec.unique)
+        except Exception as e:
+            self.failed[repr(spec)] = str(e)
+            logger.warning(f"Failed to build index {spec!r}: {e}")
+        else:
+            self.built.append(repr(spec))
+            logger.info(f"Built index {spec!r} in {(time.perf_counter() - started) * 1000:.0f} ms")
+        finally:
+            self.pending.remove(repr(spec))
+
+    async def _build_all(self, db, specs: List[IndexSpec]):
+        started = time.perf_counter()
+        self.pending.extend(repr(spec) for spec in specs)
+        await asyncio.gather(*(self._build(db, spec) for spec in specs))
+        self.last_duration_ms = (time.perf_counter() - started) * 1000
+
+    async def ensure(self, db, wait: bool = False):
+        """Build missing indexes: critical ones now, the rest in the background unless ``wait``"""
+        missing, extra = await self.diff(db)
+        for collection, names in extra.items():
+            logger.info(f"Indexes on {collection} not in DESIRED_INDEXES: {', '.join(names)}")
+        if not missing:
+            logger.info("All desired indexes exist")
+            return
+
+        critical = [spec for spec in missing if spec.critical]
+        background = [spec for spec in missing if not spec.critical]
+        if critical:
+            await self._build_all(db, critical)
+        if background:
+            if wait:
+                await self._build_all(db, background)
+            else:
+                self._task = asyncio.create_task(self._build_all(db, background))
+
+    async def wait(self):
+        if self._task is not None:
+            await self._task
+
+    async def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "desired": len(self.specs),
+            "pending": len(self.pending),
+            "built": len(self.built),
+            "failed": len(self.failed),
+            "failures": dict(self.failed),
+            "last_build_ms": self.last_duration_ms,
+        }
+
+
+index_manager = IndexManager()
+
+
+async def _main(command: str):
+    from database import database
+
+    await database.connect_to_mongo(build_indexes=False)
+    try:
+        if command == "status":
+            missing, extra = await index_manager.diff(database.database)
+            for spec in missing:
+                print(f"missing  {spec!r}")
+            for collection, names in extra.items():
+                for name in names:
+                    print(f"extra    {collection}.{name}")
+            if not missing and not extra:
+                print("All desired indexes exist")
+        else:
+            await index_manager.ensure(database.database, wait=True)
+            logger.info(f"Index sync finished: {index_manager.stats()}")
+    finally:
+        await database.close_mongo_connection()
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    load_dotenv(Path(__file__).parent / '.env')
+
+    parser = argparse.ArgumentParser(description="Diff and build the database indexes")
+    parser.add_argument("command", choices=["status", "sync"])
+    args = parser.parse_args()
+    asyncio.run(_main(args.command))
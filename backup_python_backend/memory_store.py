@@ -0,0 +1,1101 @@
+"""In-process storage engine with the Motor collection API used by the server.
+
+Selected with ``STORAGE_BACKEND=memory``. It lets the whole API, its
+benchmarks and CI runs work without a MongoDB service, and isolates route
+logic from network and database cost when profiling.
+
+Documents are stored BSON round-tripped, exactly as the driver would store
+and return them (naive UTC datetimes truncated to milliseconds, ObjectId
+``_id`` values, copies on every read). Only what the application's queries
+use is supported, and anything else raises ``OperationFailure`` rather than
+being approximated:
+
+* collections: ``find``, ``find_one``, ``insert_one``, ``insert_many``,
+  ``update_one``, ``replace_one``, ``delete_one``, ``delete_many``,
+  ``count_documents``, ``distinct``, ``aggregate``, ``find_one_and_update``,
+  ``create_index``, ``index_information``
+* cursors: ``sort``, ``skip``, ``limit``, ``batch_size``, ``to_list``,
+  ``explain`` and ``async for``
+* query operators: equality on (dotted) paths and array members, ``$gt``,
+  ``$gte``, ``$lt``, ``$lte``, ``$in``, ``$exists``, ``$or`` and ``$text``
+  against a text index
+* update operators: ``$set``, ``$unset``, ``$inc``, ``$push``
+* aggregation: ``$match``, ``$group`` with ``$sum``, ``$project`` with
+  ``$objectToArray``, ``$unwind`` and ``$facet``
+
+When adding a query shape to the application, add it here and to
+``tests/test_memory_store.py``, which runs against this engine and, with
+``TEST_MONGO_URL`` set, against MongoDB.
+
+Unique indexes are enforced and raise the same ``DuplicateKeyError`` /
+``BulkWriteError`` as PyMongo. Equality and ``$in`` conditions on ``_id``
+or on the leading field of an index are served from that index, as is a
+top-level ``$or`` whose branches are all indexed. Text indexes keep an inverted
+word index, so ``$text`` only visits documents containing a search term.
+``cursor.explain()`` reports the chosen plan in MongoDB's ``queryPlanner``
+shape.
+"""
+import copy
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import bson
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+from database import DUPLICATE_KEY_ERROR
+_MISSING = object()
+
+
+def _round_trip(document: dict) -> dict:
+    """Copy a document the way a write and read through the driver would"""
+    return bson.decode(bson.encode(document))
+
+
+# Query helpers
+
+def _path_values(value: Any, parts: List[str]) -> List[Any]:
+    """All values reachable at a dotted path, fanning out through arrays"""
+    if not parts:
+        return [value]
+    head, rest = parts[0], parts[1:]
+    if isinstance(value, dict):
+        if head not in value:
+            return []
+        return _path_values(value[head], rest)
+    if isinstance(value, list):
+        if head.isdigit():
+            index = int(head)
+            return _path_values(value[index], rest) if index < len(value) else []
+        results = []
+        for item in value:
+            if isinstance(item, (dict, list)):
+                results.extend(_path_values(item, parts))
+        return results
+    return []
+
+
+def get_path(document: dict, path: str, default: Any = None) -> Any:
+    """Value at a dotted path without array fan-out"""
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        elif isinstance(value, list):
+            value = [get_path(item, part, _MISSING) for item in value if isinstance(item, dict)]
+            value = [item for item in value if item is not _MISSING]
+        else:
+            return default
+    return value
+
+
+def _type_rank(value: Any) -> int:
+    if value is None or value is _MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+class _SortKey:
+    """Orders arbitrary BSON values following MongoDB's type ordering"""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return compare_values(self.value, other.value) < 0
+
+    def __eq__(self, other):
+        return compare_values(self.value, other.value) == 0
+
+
+def compare_values(a: Any, b: Any) -> int:
+    rank_a, rank_b = _type_rank(a), _type_rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+    if rank_a == 1:
+        return 0
+    if rank_a == 4:
+        a, b = list(a.items()), list(b.items())
+        for (key_a, value_a), (key_b, value_b) in zip(a, b):
+            result = compare_values(key_a, key_b) or compare_values(value_a, value_b)
+            if result:
+                return result
+        return (len(a) > len(b)) - (len(a) < len(b))
+    if rank_a == 5:
+        for item_a, item_b in zip(a, b):
+            result = compare_values(item_a, item_b)
+            if result:
+                return result
+        return (len(a) > len(b)) - (len(a) < len(b))
+    return (a > b) - (a < b)
+
+
+def _comparable(a: Any, b: Any) -> bool:
+    return _type_rank(a) == _type_rank(b)
+
+
+def _values_equal(candidate: Any, expected: Any) -> bool:
+    if isinstance(candidate, bool) != isinstance(expected, bool):
+        return False
+    return _type_rank(candidate) == _type_rank(expected) and compare_values(candidate, expected) == 0
+
+
+def _match_equal(values: List[Any], expected: Any) -> bool:
+    if expected is None and not values:
+        return True
+    for value in values:
+        if _values_equal(value, expected):
+            return True
+        if isinstance(value, list) and not isinstance(expected, list):
+            if any(_values_equal(item, expected) for item in value):
+                return True
+    return False
+
+
+def _expand(values: List[Any]) -> List[Any]:
+    """Values plus the members of any array values, for comparison operators"""
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def _match_operator(values: List[Any], operator: str, operand: Any) -> bool:
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        for value in _expand(values):
+            if not _comparable(value, operand):
+                continue
+            result = compare_values(value, operand)
+            if ((operator == "$gt" and result > 0) or (operator == "$gte" and result >= 0)
+                    or (operator == "$lt" and result < 0) or (operator == "$lte" and result <= 0)):
+                return True
+        return False
+    if operator == "$in":
+        return any(_match_equal(values, option) for option in operand)
+    if operator == "$exists":
+        return bool(values) == bool(operand)
+    raise OperationFailure(f"unknown operator: {operator}")
+
+
+def _match_condition(values: List[Any], condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        return all(_match_operator(values, operator, operand) for operator, operand in condition.items())
+    return _match_equal(values, condition)
+
+
+def matches(document: dict, query: Optional[dict]) -> bool:
+    """Whether a document satisfies a MongoDB query filter"""
+    if not query:
+        return True
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif key.startswith("$"):
+            raise OperationFailure(f"unknown top level operator: {key}")
+        elif not _match_condition(_path_values(document, key.split(".")), condition):
+            return False
+    return True
+
+
+# Update helpers
+
+def _set_path(document: dict, path: str, value: Any):
+    parts = path.split(".")
+    node = document
+    for part in parts[:-1]:
+        if isinstance(node, list):
+            node = node[int(part)]
+            continue
+        child = node.get(part)
+        if not isinstance(child, (dict, list)):
+            child = node[part] = {}
+        node = child
+    if isinstance(node, list):
+        node[int(parts[-1])] = value
+    else:
+        node[parts[-1]] = value
+
+
+def _unset_path(document: dict, path: str):
+    parts = path.split(".")
+    node = get_path(document, ".".join(parts[:-1])) if len(parts) > 1 else document
+    if isinstance(node, dict):
+        node.pop(parts[-1], None)
+
+
+def _numeric(value: Any, path: str):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise OperationFailure(f"Cannot apply $inc to a value of non-numeric type at {path}")
+
+
+def apply_update(document: dict, update: dict):
+    """Apply update operators to a document in place"""
+    if not update or not all(key.startswith("$") for key in update):
+        raise ValueError("update only works with $ operators")
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            current = get_path(document, path, _MISSING)
+            if operator == "$set":
+                _set_path(document, path, copy.deepcopy(value))
+            elif operator == "$unset":
+                _unset_path(document, path)
+            elif operator == "$inc":
+                _numeric(value, path)
+                if current is _MISSING:
+                    _set_path(document, path, value)
+                else:
+                    _numeric(current, path)
+                    _set_path(document, path, current + value)
+            elif operator == "$push":
+                target = [] if current is _MISSING else current
+                if not isinstance(target, list):
+                    raise OperationFailure(f"The field '{path}' must be an array")
+                target.append(copy.deepcopy(value))
+                _set_path(document, path, target)
+            else:
+                raise OperationFailure(f"Unknown modifier: {operator}")
+
+
+def _upsert_seed(query: dict) -> dict:
+    """Fields from a filter's equality conditions, used to seed an upsert"""
+    seed = {}
+    for key, condition in (query or {}).items():
+        if key.startswith("$") or (isinstance(condition, dict) and any(op.startswith("$") for op in condition)):
+            continue
+        _set_path(seed, key, copy.deepcopy(condition))
+    return seed
+
+
+# Projection
+
+def apply_projection(document: dict, projection: Optional[Any]) -> dict:
+    if not projection:
+        return document
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    include_id = bool(projection.get("_id", 1))
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    including = any(
+        (value is True or (isinstance(value, (int, float)) and not isinstance(value, bool) and value))
+        or isinstance(value, dict)
+        for value in fields.values()
+    )
+
+    if including:
+        result = {}
+        if include_id and "_id" in document:
+            result["_id"] = document["_id"]
+        for path, value in fields.items():
+            if isinstance(value, dict) and "$meta" in value:
+                if "$meta" in document:
+                    result[path] = document["$meta"].get(value["$meta"])
+                continue
+            if not value:
+                continue
+            _copy_path(document, result, path.split("."))
+        return result
+
+    result = copy.deepcopy(document)
+    if not include_id:
+        result.pop("_id", None)
+    for path in fields:
+        _unset_path(result, path)
+    return result
+
+
+def _copy_path(source: Any, target: dict, parts: List[str]):
+    head, rest = parts[0], parts[1:]
+    if not isinstance(source, dict) or head not in source:
+        return
+    value = source[head]
+    if not rest:
+        target[head] = copy.deepcopy(value)
+    elif isinstance(value, dict):
+        _copy_path(value, target.setdefault(head, {}), rest)
+    elif isinstance(value, list):
+        items = []
+        for item in value:
+            if isinstance(item, dict):
+                projected = {}
+                _copy_path(item, projected, rest)
+                items.append(projected)
+        target[head] = items
+
+
+# Aggregation expressions
+
+def evaluate(expression: Any, document: dict) -> Any:
+    if isinstance(expression, str):
+        if expression.startswith("$$"):
+            raise OperationFailure(f"Unsupported variable: {expression}")
+        if expression.startswith("$"):
+            return get_path(document, expression[1:])
+        return expression
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+    if isinstance(expression, dict):
+        if len(expression) == 1:
+            operator, argument = next(iter(expression.items()))
+            if operator == "$objectToArray":
+                return [{"k": key, "v": value} for key, value in (evaluate(argument, document) or {}).items()]
+            if operator.startswith("$"):
+                raise OperationFailure(f"Unsupported expression operator: {operator}")
+        return {key: evaluate(value, document) for key, value in expression.items()}
+    return expression
+
+
+# Aggregation stages
+
+def _group(documents: List[dict], spec: dict) -> List[dict]:
+    spec = dict(spec)
+    key_expression = spec.pop("_id")
+    groups: Dict[Any, dict] = {}
+    for document in documents:
+        key = evaluate(key_expression, document)
+        group = groups.setdefault(_hashable(key), {"_id": key})
+        for field, accumulator in spec.items():
+            (operator, argument), = accumulator.items()
+            if operator != "$sum":
+                raise OperationFailure(f"Unsupported accumulator: {operator}")
+            value = evaluate(argument, document)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                group[field] = group.get(field, 0) + value
+            else:
+                group.setdefault(field, 0)
+    return list(groups.values())
+
+
+def _project(document: dict, spec: dict) -> dict:
+    simple = all(
+        isinstance(value, (bool, int, float)) or (isinstance(value, dict) and "$meta" in value)
+        for value in spec.values()
+    )
+    if simple:
+        return apply_projection(document, spec)
+    result = {}
+    if spec.get("_id", 1) and "_id" in document:
+        result["_id"] = document["_id"]
+    for field, value in spec.items():
+        if field == "_id" and isinstance(value, (bool, int)):
+            continue
+        if isinstance(value, bool) or (isinstance(value, int) and value in (0, 1)):
+            if value:
+                _copy_path(document, result, field.split("."))
+        else:
+            _set_path(result, field, evaluate(value, document))
+    return result
+
+
+def _sort_documents(documents: List[dict], keys: List[Tuple[str, int]]) -> List[dict]:
+    for field, direction in reversed(keys):
+        if isinstance(direction, dict):
+            # {"$meta": "textScore"}: highest score first
+            documents.sort(key=lambda doc: _SortKey((doc.get("$meta") or {}).get(direction["$meta"])), reverse=True)
+        else:
+            documents.sort(key=lambda doc: _SortKey(get_path(doc, field)), reverse=direction < 0)
+    return documents
+
+
+def run_pipeline(documents: List[dict], pipeline: List[dict]) -> List[dict]:
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            documents = [document for document in documents if matches(document, spec)]
+        elif name == "$group":
+            documents = _group(documents, spec)
+        elif name == "$project":
+            documents = [_project(document, spec) for document in documents]
+        elif name == "$unwind":
+            path = spec[1:]
+            unwound = []
+            for document in documents:
+                value = get_path(document, path, _MISSING)
+                if isinstance(value, list):
+                    for item in value:
+                        item_document = copy.deepcopy(document)
+                        _set_path(item_document, path, item)
+                        unwound.append(item_document)
+                elif value is not _MISSING and value is not None:
+                    unwound.append(document)
+            documents = unwound
+        elif name == "$facet":
+            documents = [{
+                field: run_pipeline([copy.deepcopy(document) for document in documents], sub_pipeline)
+                for field, sub_pipeline in spec.items()
+            }]
+        else:
+            raise OperationFailure(f"Unsupported pipeline stage: {name}")
+    return documents
+
+
+# Indexes
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, dict):
+        return ("__dict__",) + tuple((key, _hashable(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return ("__list__",) + tuple(_hashable(item) for item in value)
+    if isinstance(value, bool):
+        return ("__bool__", value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _normalize_keys(keys: Any, direction: Any = None) -> List[Tuple[str, Any]]:
+    if isinstance(keys, str):
+        return [(keys, direction if direction is not None else 1)]
+    if isinstance(keys, dict):
+        return list(keys.items())
+    return [tuple(key) for key in keys]
+
+
+def _words(value: Any) -> List[str]:
+    """Lower-cased word tokens of a string, as indexed by a text index"""
+    return re.findall(r"\w+", value.lower()) if isinstance(value, str) else []
+
+
+def index_name(keys: List[Tuple[str, Any]]) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+class _Index:
+    def __init__(self, name: str, keys: List[Tuple[str, Any]], unique: bool = False,
+                 options: Optional[dict] = None):
+        self.name = name
+        self.keys = keys
+        self.unique = unique
+        self.options = options or {}
+        self.text = any(direction == "text" for _, direction in keys)
+        # leading field value -> {_id: full key}; for text indexes, word -> {_id: None}
+        self.entries: Dict[Any, Dict[Any, tuple]] = {}
+
+    @property
+    def leading_field(self) -> str:
+        return self.keys[0][0]
+
+    @property
+    def text_fields(self) -> List[str]:
+        return [field for field, direction in self.keys if direction == "text"]
+
+    def words_for(self, document: dict) -> set:
+        return {word for field in self.text_fields for word in _words(get_path(document, field))}
+
+    def key_for(self, document: dict) -> Optional[tuple]:
+        return tuple(_hashable(get_path(document, field)) for field, _ in self.keys)
+
+    def conflicts(self, document: dict, exclude_id: Any = _MISSING) -> Optional[tuple]:
+        if not self.unique:
+            return None
+        key = self.key_for(document)
+        if key is None:
+            return None
+        for document_id, existing in self.entries.get(key[0], {}).items():
+            if existing == key and document_id != exclude_id:
+                return key
+        return None
+
+    def add(self, document_id: Any, document: dict):
+        if self.text:
+            for word in self.words_for(document):
+                self.entries.setdefault(word, {})[document_id] = None
+            return
+        key = self.key_for(document)
+        if key is not None:
+            self.entries.setdefault(key[0], {})[document_id] = key
+
+    def remove(self, document_id: Any, document: dict):
+        if self.text:
+            leading = list(self.words_for(document))
+        else:
+            key = self.key_for(document)
+            leading = [] if key is None else [key[0]]
+        for value in leading:
+            bucket = self.entries.get(value)
+            if bucket is not None:
+                bucket.pop(document_id, None)
+                if not bucket:
+                    del self.entries[value]
+
+    def info(self) -> dict:
+        info = {"key": list(self.keys), "v": 2}
+        if self.text:
+            # MongoDB reports text indexes by their internal key and per-field weights
+            info["key"] = [("_fts", "text"), ("_ftsx", 1)]
+            info["weights"] = {field: 1 for field in self.text_fields}
+        if self.unique:
+            info["unique"] = True
+        info.update(self.options)
+        return info
+
+
+# Cursors
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query: Optional[dict], projection: Any = None):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort: List[Tuple[str, Any]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[List[dict]] = None
+        self._position = 0
+
+    def sort(self, key_or_list: Any, direction: Any = None) -> "MemoryCursor":
+        self._sort = _normalize_keys(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "MemoryCursor":
+        return self
+
+    def _evaluate(self) -> List[dict]:
+        if self._results is None:
+            documents = self._collection._select(self._query)
+            if self._sort:
+                documents = _sort_documents(documents, self._sort)
+            documents = documents[self._skip:]
+            if self._limit:
+                documents = documents[:self._limit]
+            self._results = [
+                _strip_meta(apply_projection(_round_trip_with_meta(document), self._projection))
+                for document in documents
+            ]
+        return self._results
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        results = self._evaluate()
+        if self._position >= len(results):
+            raise StopAsyncIteration
+        self._position += 1
+        return results[self._position - 1]
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        results = self._evaluate()[self._position:]
+        if length:
+            results = results[:length]
+        self._position += len(results)
+        return results
+
+    async def explain(self) -> dict:
+        return self._collection._explain(self._query, self._sort)
+
+
+class MemoryAggregateCursor:
+    def __init__(self, documents: List[dict]):
+        self._documents = documents
+        self._position = 0
+
+    def batch_size(self, size: int) -> "MemoryAggregateCursor":
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        if self._position >= len(self._documents):
+            raise StopAsyncIteration
+        self._position += 1
+        return self._documents[self._position - 1]
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        results = self._documents[self._position:]
+        if length:
+            results = results[:length]
+        self._position += len(results)
+        return results
+
+
+def _strip_meta(document: Any) -> Any:
+    if isinstance(document, dict) and "$meta" in document:
+        document = {key: value for key, value in document.items() if key != "$meta"}
+    return document
+
+
+def _round_trip_with_meta(document: dict) -> dict:
+    meta = document.get("$meta")
+    if meta is None:
+        return _round_trip(document)
+    result = _round_trip({key: value for key, value in document.items() if key != "$meta"})
+    result["$meta"] = meta
+    return result
+
+
+# Collections
+
+def _residual_filter(query: dict, index: _Index) -> Optional[dict]:
+    """The part of a query an index scan leaves to FETCH, in explain()'s ``filter`` shape"""
+    indexed = {field for field, _ in index.keys}
+    conditions = [
+        {field: condition if isinstance(condition, dict) else {"$eq": condition}}
+        if not field.startswith("$") else {field: condition}
+        for field, condition in query.items() if field not in indexed
+    ]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self._documents: Dict[Any, dict] = {}
+        self._indexes: Dict[str, _Index] = {}
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.database.name}.{self.name}"
+
+    # Reads
+
+    def _id_lookup(self, query: dict) -> Optional[List[Any]]:
+        """``_id`` values of an equality or ``$in`` condition on ``_id``, served like MongoDB's ``_id_`` index"""
+        condition = query.get("_id", _MISSING)
+        if condition is _MISSING:
+            return None
+        if not isinstance(condition, dict):
+            return [condition]
+        if set(condition) == {"$in"}:
+            return [value for value in condition["$in"] if not isinstance(value, (dict, list))]
+        return None
+
+    def _candidate_ids(self, query: dict) -> Optional[Iterable[Any]]:
+        """Use an index on an equality/$in condition to narrow the scan"""
+        document_ids = self._id_lookup(query)
+        if document_ids is not None:
+            return [document_id for document_id in document_ids if document_id in self._documents]
+        index = self._plan(query)
+        if index is None:
+            branches = self._or_plans(query)
+            if branches is None:
+                return None
+            # Every $or branch is indexed: union the branches' candidates
+            ids = []
+            for branch in query["$or"]:
+                ids.extend(self._candidate_ids(branch))
+            return ids
+        condition = query[index.leading_field]
+        options = condition["$in"] if isinstance(condition, dict) and "$in" in condition else [
+            condition["$eq"] if isinstance(condition, dict) else condition
+        ]
+        ids = []
+        for option in options:
+            ids.extend(index.entries.get(_hashable(option), {}).keys())
+        return ids
+
+    def _plan(self, query: dict, sort: Optional[List[Tuple[str, Any]]] = None) -> Optional[_Index]:
+        """Pick an index usable for the query, preferring one that provides the sort order,
+        then the longest prefix of point conditions, then a unique index"""
+        usable = [index for index in self._indexes.values() if self._usable(index, query)]
+        if not usable:
+            return None
+        return max(usable, key=lambda index: (
+            self._provides_sort(index, query, sort),
+            self._equality_prefix(index, query, allow_in=True),
+            index.unique,
+        ))
+
+    @staticmethod
+    def _equality_prefix(index: _Index, query: dict, allow_in: bool = False) -> int:
+        """Number of leading index keys with equality (and optionally ``$in``) conditions"""
+        allowed = [{"$eq"}, {"$in"}] if allow_in else [{"$eq"}]
+        length = 0
+        for field, _ in index.keys:
+            condition = query.get(field, _MISSING)
+            if condition is _MISSING or (isinstance(condition, dict) and set(condition) not in allowed):
+                break
+            length += 1
+        return length
+
+    def _provides_sort(self, index: _Index, query: dict, sort: Optional[List[Tuple[str, Any]]]) -> bool:
+        if not sort or any(isinstance(direction, dict) for _, direction in sort):
+            return False
+        prefix = self._equality_prefix(index, query)
+        following = index.keys[prefix:prefix + len(sort)]
+        if [field for field, _ in following] != [field for field, _ in sort]:
+            return False
+        # The index can be walked forwards or backwards, but not both at once
+        same = [direction == index_direction for (_, direction), (_, index_direction) in zip(sort, following)]
+        return all(same) or not any(same)
+
+    @staticmethod
+    def _usable(index: _Index, query: dict) -> bool:
+        if index.text:
+            return False
+        condition = query.get(index.leading_field, _MISSING)
+        if condition is _MISSING or condition is None or isinstance(condition, list):
+            return False
+        if isinstance(condition, dict):
+            operators = set(condition)
+            if not (operators == {"$eq"} or operators == {"$in"}):
+                return False
+            values = condition.get("$in", [condition.get("$eq")])
+            if any(isinstance(value, (dict, list)) or value is None for value in values):
+                return False
+        return True
+
+    def _or_plans(self, query: dict) -> Optional[List[_Index]]:
+        branches = query.get("$or")
+        if not isinstance(branches, list) or not branches:
+            return None
+        plans = [self._plan(branch) for branch in branches]
+        return None if any(plan is None for plan in plans) else plans
+
+    def _text_index(self) -> _Index:
+        index = next((index for index in self._indexes.values() if index.text), None)
+        if index is None:
+            raise OperationFailure("text index required for $text query", code=27)
+        return index
+
+    def _select(self, query: dict) -> List[dict]:
+        text = query.get("$text") if query else None
+        if text is not None:
+            query = {key: value for key, value in query.items() if key != "$text"}
+        candidate_ids = self._candidate_ids(query) if query else None
+        if text is not None:
+            # Only documents containing one of the search terms can match
+            index = self._text_index()
+            text_ids = {
+                document_id
+                for word in set(_words(text["$search"]))
+                for document_id in index.entries.get(word, {})
+            }
+            candidate_ids = text_ids if candidate_ids is None else text_ids.intersection(candidate_ids)
+        if candidate_ids is None:
+            documents = list(self._documents.values())
+        else:
+            order = {document_id: position for position, document_id in enumerate(self._documents)}
+            documents = [self._documents[document_id] for document_id in sorted(set(candidate_ids), key=order.get)]
+        documents = [document for document in documents if matches(document, query)]
+        if text is not None:
+            documents = self._text_search(documents, text)
+        return documents
+
+    def _text_search(self, documents: List[dict], text: dict) -> List[dict]:
+        fields = self._text_index().text_fields
+        terms = set(_words(text["$search"]))
+        results = []
+        for document in documents:
+            words = [word for field in fields for word in _words(get_path(document, field))]
+            if not words:
+                continue
+            hits = sum(1 for word in words if word in terms)
+            if hits:
+                scored = dict(document)
+                scored["$meta"] = {"textScore": hits / len(words) + hits}
+                results.append(scored)
+        return results
+
+    def _explain(self, query: dict, sort: List[Tuple[str, Any]]) -> dict:
+        query = query or {}
+        sorted_by_index = False
+        if "$text" in query:
+            index = self._text_index()
+            stage = {"stage": "TEXT_MATCH", "inputStage": {"stage": "FETCH", "inputStage": {
+                "stage": "TEXT_OR", "inputStage": {
+                    "stage": "IXSCAN", "indexName": index.name, "keyPattern": {"_fts": "text", "_ftsx": 1}
+                }
+            }}}
+        elif self._id_lookup(query) is not None:
+            stage = {"stage": "FETCH", "inputStage": {
+                "stage": "IXSCAN", "indexName": "_id_", "keyPattern": {"_id": 1}
+            }}
+        else:
+            index = self._plan(query, sort)
+            if index is None and not query and sort:
+                # An index whose leading keys match the sort can satisfy it
+                index = next((index for index in self._indexes.values()
+                              if not index.text and self._provides_sort(index, query, sort)), None)
+            branches = self._or_plans(query) if index is None else None
+            if branches is not None:
+                stage = {"stage": "SUBPLAN", "inputStage": {"stage": "OR", "inputStages": [
+                    {"stage": "FETCH", "inputStage": {
+                        "stage": "IXSCAN", "indexName": branch.name, "keyPattern": dict(branch.keys)
+                    }}
+                    for branch in branches
+                ]}}
+            elif index is None:
+                stage = {"stage": "COLLSCAN", "filter": query}
+            else:
+                sorted_by_index = self._provides_sort(index, query, sort)
+                stage = {"stage": "FETCH", "inputStage": {
+                    "stage": "IXSCAN", "indexName": index.name, "keyPattern": dict(index.keys),
+                    "isUnique": index.unique
+                }}
+                residual = _residual_filter(query, index)
+                if residual:
+                    # Conditions the index bounds do not cover are checked on every fetched document
+                    stage["filter"] = residual
+        if sort and not sorted_by_index:
+            # Blocking sort of every matching document
+            stage = {"stage": "SORT", "sortPattern": dict(sort), "inputStage": stage}
+        return {"queryPlanner": {"namespace": self.full_name, "winningPlan": stage}}
+
+    def find(self, filter: Optional[dict] = None, projection: Any = None, sort: Any = None) -> MemoryCursor:
+        cursor = MemoryCursor(self, filter, projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Any = None, sort: Any = None) -> Optional[dict]:
+        results = await self.find(filter, projection, sort).limit(1).to_list(1)
+        return results[0] if results else None
+
+    async def count_documents(self, filter: dict) -> int:
+        return len(self._select(filter))
+
+    async def distinct(self, key: str, filter: Optional[dict] = None) -> List[Any]:
+        values = []
+        for document in self._select(filter or {}):
+            for value in _expand(_path_values(document, key.split("."))):
+                if isinstance(value, list):
+                    continue
+                if not any(_values_equal(existing, value) for existing in values):
+                    values.append(value)
+        return [_round_trip({"v": value})["v"] for value in values]
+
+    def aggregate(self, pipeline: List[dict], *args, **kwargs) -> MemoryAggregateCursor:
+        documents = [_round_trip(document) for document in self._select({})] if not (
+            pipeline and "$match" in pipeline[0]
+        ) else [_round_trip_with_meta(document) for document in self._select(pipeline[0]["$match"])]
+        if pipeline and "$match" in pipeline[0]:
+            pipeline = pipeline[1:]
+        return MemoryAggregateCursor([_strip_meta(document) for document in run_pipeline(documents, pipeline)])
+
+    # Writes
+
+    def _check_unique(self, document: dict, exclude_id: Any = _MISSING):
+        for index in self._indexes.values():
+            key = index.conflicts(document, exclude_id)
+            if key is not None:
+                key_description = ", ".join(
+                    f"{field}: {get_path(document, field)!r}" for field, _ in index.keys
+                )
+                message = (
+                    f"E11000 duplicate key error collection: {self.full_name} "
+                    f"index: {index.name} dup key: {{ {key_description} }}"
+                )
+                raise DuplicateKeyError(message, DUPLICATE_KEY_ERROR, {
+                    "index": 0, "code": DUPLICATE_KEY_ERROR, "errmsg": message,
+                    "keyPattern": dict(index.keys),
+                })
+
+    def _store(self, document: dict, replacing: Optional[dict] = None):
+        document_id = document["_id"]
+        if replacing is not None:
+            for index in self._indexes.values():
+                index.remove(document_id, replacing)
+        self._documents[document_id] = document
+        for index in self._indexes.values():
+            index.add(document_id, document)
+
+    def _insert(self, document: dict) -> Any:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        stored = _round_trip(document)
+        if stored["_id"] in self._documents:
+            message = f"E11000 duplicate key error collection: {self.full_name} index: _id_ dup key"
+            raise DuplicateKeyError(message, DUPLICATE_KEY_ERROR, {
+                "index": 0, "code": DUPLICATE_KEY_ERROR, "errmsg": message,
+            })
+        self._check_unique(stored)
+        self._store(stored)
+        return stored["_id"]
+
+    async def insert_one(self, document: dict, *args, **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True, *args, **kwargs) -> InsertManyResult:
+        documents = list(documents)
+        inserted_ids = []
+        write_errors = []
+        for index, document in enumerate(documents):
+            try:
+                inserted_ids.append(self._insert(document))
+            except DuplicateKeyError as e:
+                write_errors.append(dict(e.details, index=index, op=document))
+                if ordered:
+                    break
+        if write_errors:
+            raise BulkWriteError({
+                "writeErrors": write_errors,
+                "writeConcernErrors": [],
+                "nInserted": len(inserted_ids),
+                "nUpserted": 0,
+                "nMatched": 0,
+                "nModified": 0,
+                "nRemoved": 0,
+                "upserted": [],
+            })
+        return InsertManyResult(inserted_ids, True)
+
+    def _update(self, filter: dict, update: dict, upsert: bool, replace: bool = False) -> dict:
+        if replace and any(key.startswith("$") for key in update):
+            raise ValueError("replacement can not include $ operators")
+        targets = self._select(filter)[:1]
+
+        modified = 0
+        for current in targets:
+            updated = copy.deepcopy(current)
+            if replace:
+                updated = dict(copy.deepcopy(update), _id=current["_id"])
+            else:
+                apply_update(updated, update)
+            updated = _round_trip(updated)
+            if updated["_id"] != current["_id"]:
+                raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'")
+            if updated != current:
+                self._check_unique(updated, exclude_id=current["_id"])
+                self._store(updated, replacing=current)
+                modified += 1
+
+        raw = {"n": len(targets), "nModified": modified, "ok": 1.0}
+        if not targets and upsert:
+            if replace:
+                document = copy.deepcopy(update)
+            else:
+                document = _upsert_seed(filter)
+                apply_update(document, update)
+            raw["upserted"] = self._insert(document)
+            raw["n"] = 1
+        return raw
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, *args, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert), True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, *args, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, replace=True), True)
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection: Any = None,
+                                  upsert: bool = False, return_document: bool = ReturnDocument.BEFORE,
+                                  *args, **kwargs) -> Optional[dict]:
+        targets = self._select(filter)[:1]
+        before = _round_trip(targets[0]) if targets else None
+        raw = self._update(filter, update, upsert)
+        if return_document == ReturnDocument.AFTER:
+            document_id = before["_id"] if before else raw.get("upserted")
+            after = self._documents.get(document_id)
+            return apply_projection(_round_trip(after), projection) if after else None
+        return apply_projection(before, projection) if before else None
+
+    def _delete(self, filter: dict, multi: bool) -> int:
+        targets = self._select(filter)
+        if not multi:
+            targets = targets[:1]
+        for document in targets:
+            for index in self._indexes.values():
+                index.remove(document["_id"], document)
+            del self._documents[document["_id"]]
+        return len(targets)
+
+    async def delete_one(self, filter: dict, *args, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=False), "ok": 1.0}, True)
+
+    async def delete_many(self, filter: dict, *args, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=True), "ok": 1.0}, True)
+
+    # Indexes
+
+    async def create_index(self, keys: Any, unique: bool = False, name: Optional[str] = None, **kwargs) -> str:
+        keys = _normalize_keys(keys)
+        name = name or index_name(keys)
+        existing = self._indexes.get(name)
+        if existing is not None:
+            if existing.keys != keys or existing.unique != unique:
+                raise OperationFailure(f"Index with name: {name} already exists with different options", code=86)
+            return name
+
+        kwargs.pop("background", None)
+        index = _Index(name, keys, unique=unique, options=kwargs)
+        for document_id, document in self._documents.items():
+            if index.conflicts(document) is not None:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.full_name} index: {name}",
+                    DUPLICATE_KEY_ERROR
+                )
+            index.add(document_id, document)
+        self._indexes[name] = index
+        return name
+
+    async def index_information(self) -> Dict[str, dict]:
+        information = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        for name, index in self._indexes.items():
+            information[name] = index.info()
+        return information
+
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def get_collection(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return self.get_collection(name)
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+
+class MemoryClient:
+    """Stand-in for AsyncIOMotorClient holding databases in process memory"""
+
+    def __init__(self):
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(name)
+        return database
+
+    def get_database(self, name: str) -> MemoryDatabase:
+        return self[name]
+
+    def close(self):
+        pass
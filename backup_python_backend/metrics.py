@@ -0,0 +1,224 @@
+"""Prometheus-style metrics for the API.
+
+* ``MetricsMiddleware`` records request latency per route template, method
+  and status code.
+* ``MongoCommandListener`` is a PyMongo command listener that records the
+  duration and returned/affected document counts of every Mongo command,
+  labelled by collection and command name.
+
+Everything is rendered in the Prometheus text exposition format by
+``render_metrics`` and served from ``/metrics``.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labelvalues, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                    cumulative += count
+                    le = _format_labels(self.labelnames, labelvalues, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                labels = _format_labels(self.labelnames, labelvalues)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, component: str, collect: Callable[[], dict]):
+        """Expose the numeric values of a component's ``stats()`` as gauges"""
+        self._collectors[component] = collect
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for component, collect in self._collectors.items():
+            for key, value in collect().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"feedback_{component}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template, method and status code",
+    ("route", "method", "status"),
+))
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency by collection, command and outcome",
+    ("collection", "command", "outcome"),
+))
+mongo_command_documents = registry.register(Counter(
+    "mongo_command_documents_total",
+    "Documents returned or affected by MongoDB commands",
+    ("collection", "command"),
+))
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the scope; label by its
+            # template so /api/forms/{form_id} is one series, not one per form
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe(
+                time.perf_counter() - started, route_label, scope["method"], str(status_code)
+            )
+
+
+# Commands whose target collection is named by a field other than the command name
+_COLLECTION_FIELDS = {"getMore": "collection"}
+
+
+def _documents_in_reply(reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Records timing and document counts for every Mongo command.
+
+    PyMongo invokes listeners from Motor's worker threads, so all state is
+    kept in the lock-protected metrics above.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[int, object], Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _pop(self, event) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            return self._pending.pop((event.request_id, event.connection_id), None)
+
+    def started(self, event):
+        field = _COLLECTION_FIELDS.get(event.command_name, event.command_name)
+        collection = event.command.get(field)
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (collection, event.command_name)
+
+    def succeeded(self, event):
+        labels = self._pop(event) or ("", event.command_name)
+        mongo_command_duration.observe(event.duration_micros / 1e6, *labels, "success")
+        documents = _documents_in_reply(event.reply)
+        if documents:
+            mongo_command_documents.inc(*labels, amount=documents)
+
+    def failed(self, event):
+        labels = self._pop(event) or ("", event.command_name)
+        mongo_command_duration.observe(event.duration_micros / 1e6, *labels, "failure")
+
+
+mongo_command_listener = MongoCommandListener()
@@ -46,6 +46,8 @@ class FeedbackForm(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
     shareable_link: str = ""
+    # Subject/criterion orders that packed submissions refer to (see ratings_codec)
+    rating_layouts: List[Dict[str, List[str]]] = []
 
 class FeedbackFormCreate(BaseModel):
     title: str
@@ -82,6 +84,11 @@ class StudentFeedbackCreate(BaseModel):
     ratings: Dict[str, Dict[str, int]]
     comments: Optional[str] = None
 
+class FeedbackBatchStatus(str, Enum):
+    CREATED = "created"
+    DUPLICATE = "duplicate"
+    INVALID = "invalid"
+
 # Response Models
 class FeedbackFormResponse(BaseModel):
     id: str
@@ -105,4 +112,108 @@ class FeedbackSummary(BaseModel):
     department: str
     total_responses: int
     average_ratings_per_subject: Dict[str, float]
-    feedbacks: List[StudentFeedback]
\ No newline at end of file
+    average_ratings_per_criterion: Dict[str, Dict[str, float]] = {}
+    feedbacks: List[StudentFeedback]
+    next_cursor: Optional[str] = None  # Set when more pages are available
+
+class RatingDistribution(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    std: Optional[float] = None
+    median: Optional[float] = None
+    percentiles: Dict[str, Optional[float]]  # {"p10": ..., "p90": ...}
+    histogram: Dict[str, int]  # {rating: count} for ratings 1-5
+
+class SubjectStatistics(BaseModel):
+    overall: RatingDistribution
+    criteria: Dict[str, RatingDistribution]
+
+class FormStatistics(BaseModel):
+    form_id: str
+    total_responses: int
+    subjects: Dict[str, SubjectStatistics]
+    criterion_correlations: Dict[str, Dict[str, Optional[float]]]
+
+class CommentSearchHit(BaseModel):
+    feedback_id: str
+    form_id: str
+    form_title: str
+    student_id: str
+    student_name: Optional[str] = None
+    comments: str
+    submitted_at: datetime
+    score: float  # text relevance, higher is better
+
+class CommentSearchResponse(BaseModel):
+    query: str
+    total: int
+    offset: int
+    limit: int
+    next_offset: Optional[int] = None  # None on the last page
+    results: List[CommentSearchHit]
+
+class TermCount(BaseModel):
+    term: str
+    count: int  # comments mentioning the term
+
+class TermPeriod(BaseModel):
+    period: str  # "YYYY-MM"
+    comment_count: int
+    terms: List[TermCount]
+    phrases: List[TermCount]
+
+class TermFrequencyResponse(BaseModel):
+    form_count: int
+    comment_count: int
+    terms: List[TermCount]
+    phrases: List[TermCount]
+    periods: List[TermPeriod]
+
+class ArchivedFormResponse(BaseModel):
+    form_id: str
+    title: str
+    year: str
+    section: str
+    department: str
+    created_at: datetime
+    is_active: bool  # as it was when archived
+    status: str  # archiving, archived or restoring
+    archived_at: datetime
+    submission_count: int
+    raw_bytes: int
+    compressed_bytes: int
+
+class ReportJobResponse(BaseModel):
+    job_id: str
+    form_id: str
+    format: str  # "pdf" or "xlsx"
+    version: int  # aggregate version the report was rendered for
+    status: str  # queued, running, done or failed
+    cached: bool = False
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    download_url: Optional[str] = None
+
+class RollupGroup(BaseModel):
+    key: Optional[str] = None  # department, year or section value
+    form_count: int
+    total_responses: int
+    average_ratings_per_subject: Dict[str, float]
+    average_ratings_per_criterion: Dict[str, Dict[str, float]]
+
+class RollupResponse(BaseModel):
+    group_by: str
+    groups: List[RollupGroup]
+
+class FeedbackBatchItemResult(BaseModel):
+    index: int
+    student_id: str
+    status: FeedbackBatchStatus
+    feedback_id: Optional[str] = None
+    detail: Optional[str] = None
+
+class FeedbackBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[FeedbackBatchItemResult]
\ No newline at end of file
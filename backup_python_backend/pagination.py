@@ -0,0 +1,109 @@
+"""Keyset pagination helpers for feedback submissions and form listings.
+
+Submissions are ordered by ``(submitted_at, id)``. A cursor is an opaque,
+URL-safe token encoding the sort key of the last item on a page; the next
+page starts strictly after it, so every page costs one index range scan no
+matter how deep it is.
+
+Form listings sort by ``created_at``, ``title`` or ``response_count`` with
+the form id as tie-breaker. Response counts live on ``form_aggregates``,
+so that sort pages through the aggregates (keyed by ``form_id``) and the
+forms are looked up by id afterwards.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+FEEDBACK_SORT = [("submitted_at", 1), ("id", 1)]
+
+
+def encode_cursor(submitted_at: datetime, feedback_id: str) -> str:
+    raw = json.dumps([submitted_at.isoformat(), feedback_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        submitted_at, feedback_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(submitted_at), str(feedback_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _after(field: str, value: Any, id_field: str, last_id: str, direction: int = 1) -> List[dict]:
+    """``$or`` branches selecting documents after ``(value, last_id)`` in the given direction"""
+    operator = "$gt" if direction > 0 else "$lt"
+    return [
+        {field: {operator: value}},
+        {field: value, id_field: {operator: last_id}},
+    ]
+
+
+def feedback_page_filter(form_id: str, cursor: Optional[str] = None) -> dict:
+    """Build the query selecting submissions after the given cursor"""
+    query = {"form_id": form_id}
+    if cursor:
+        submitted_at, feedback_id = decode_cursor(cursor)
+        query["$or"] = _after("submitted_at", submitted_at, "id", feedback_id)
+    return query
+
+
+FORM_SORT_FIELDS = ("created_at", "title", "response_count")
+# Newest forms and most answered forms first; titles alphabetically
+DEFAULT_FORM_DIRECTION = {"created_at": -1, "title": 1, "response_count": -1}
+FORM_FILTER_FIELDS = ("department", "year", "section")
+
+
+def form_id_field(sort: str) -> str:
+    """The form id's field name in the collection paged for this sort"""
+    return "form_id" if sort == "response_count" else "id"
+
+
+def form_sort(sort: str, direction: int) -> List[Tuple[str, int]]:
+    return [(sort, direction), (form_id_field(sort), direction)]
+
+
+# JSON types a cursor's sort value may have; anything else (an operator document
+# in a crafted cursor, say) is rejected before it reaches the query
+FORM_CURSOR_TYPES = {"created_at": (str,), "title": (str,), "response_count": (int, float)}
+
+
+def encode_form_cursor(sort: str, direction: int, value: Any, form_id: str) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, direction, value, form_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_form_cursor(cursor: str, sort: str, direction: int) -> Tuple[Any, str]:
+    """Decode a form listing cursor, raising ValueError if it is malformed or for another sort or order"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, cursor_direction, value, form_id = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_sort != sort or cursor_direction != direction:
+            raise ValueError("Cursor belongs to a different sort")
+        if isinstance(value, bool) or not isinstance(value, FORM_CURSOR_TYPES[sort]):
+            raise ValueError("Invalid cursor value")
+        if not isinstance(form_id, str):
+            raise ValueError("Invalid cursor form id")
+        if sort == "created_at":
+            value = datetime.fromisoformat(value)
+        return value, form_id
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def form_page_filter(owner_id: str, filters: Dict[str, Optional[str]], sort: str, direction: int,
+                     cursor: Optional[str] = None) -> dict:
+    """Build the query selecting the owner's active forms after the given cursor"""
+    query = {"created_by": owner_id, "is_active": True}
+    for field in FORM_FILTER_FIELDS:
+        if filters.get(field) is not None:
+            query[field] = filters[field]
+    if cursor:
+        value, form_id = decode_form_cursor(cursor, sort, direction)
+        query["$or"] = _after(sort, value, form_id_field(sort), form_id, direction)
+    return query
@@ -0,0 +1,44 @@
+"""Field selection for lean read views.
+
+Read routes accept ``?fields=a,b,c`` (and some a ``?view=`` preset). The
+selection is turned into a Mongo projection so unused fields are never
+read from the database or deserialized.
+"""
+from typing import Iterable, List, Optional
+
+# Dashboard-sized form listing: enough to render a card per form
+FORM_SUMMARY_FIELDS = ["id", "title", "year", "section", "department", "response_count"]
+
+# Form fields needed to render a feedback summary header
+FORM_HEADER_FIELDS = ["id", "title", "year", "section", "department"]
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """Split a comma separated field list, raising ValueError on unknown names"""
+    if fields is None:
+        return None
+    allowed = list(allowed)
+    selected = []
+    for name in fields.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in allowed:
+            raise ValueError(f"Unknown field: {name}")
+        if name not in selected:
+            selected.append(name)
+    if not selected:
+        raise ValueError("No fields selected")
+    return selected
+
+
+def mongo_projection(fields: Iterable[str], extra: Iterable[str] = ()) -> dict:
+    """Inclusion projection for the given fields, never returning ``_id``"""
+    projection = {"_id": 0}
+    for name in list(fields) + list(extra):
+        projection[name] = 1
+    return projection
+
+
+def select(document: dict, fields: Iterable[str]) -> dict:
+    return {name: document[name] for name in fields if name in document}
@@ -0,0 +1,211 @@
+"""Compact positional storage format for submission ratings.
+
+Submissions used to be stored with ``ratings`` as ``{subject: {criterion:
+rating}}`` and ``averages`` as ``{subject: average}``, repeating every
+subject and criterion name in every document. Packed submissions instead
+store:
+
+* ``ratings``: ``bytes`` with one unsigned byte per (subject, criterion)
+  pair in the form's order, row-major by subject; ``0`` means not rated.
+* ``averages``: ``bytes`` with one little-endian float64 per subject;
+  NaN means the subject was not rated.
+* ``layout``: index into the form's ``rating_layouts`` naming the subject
+  and criterion order the blobs were written with.
+
+A form appends a new entry to ``rating_layouts`` whenever its subjects or
+criteria change, so older submissions keep decoding against the order they
+were written in. Submissions whose ratings cannot be packed (names missing
+from the layout, values outside 1-255, or forms without layouts) are
+stored in the original dict format, which ``decode_feedback`` passes
+through unchanged. Decoding happens only where submissions leave the API.
+
+Existing documents are converted with ``python ratings_codec.py migrate``.
+"""
+import argparse
+import asyncio
+import logging
+import math
+import struct
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_FIELD = "layout"
+MIGRATE_BATCH_SIZE = 1000
+
+
+def make_layout(subjects: List[str], criteria: List[str]) -> dict:
+    return {"subjects": list(subjects), "evaluation_criteria": list(criteria)}
+
+
+def current_layout_id(form_doc: dict) -> Optional[int]:
+    """Index of the layout new submissions are packed with, if the form has one"""
+    layouts = form_doc.get("rating_layouts")
+    if not layouts:
+        return None
+    layout = layouts[-1]
+    # A layout that no longer matches the form (e.g. edited outside the API) is not used
+    if (layout["subjects"] != form_doc["subjects"]
+            or layout["evaluation_criteria"] != form_doc["evaluation_criteria"]):
+        return None
+    return len(layouts) - 1
+
+
+def layout_update(form_doc: dict, update_data: dict) -> Optional[dict]:
+    """The ``$push`` needed when an update changes the form's subjects or criteria"""
+    subjects = update_data.get("subjects", form_doc["subjects"])
+    criteria = update_data.get("evaluation_criteria", form_doc["evaluation_criteria"])
+    layouts = form_doc.get("rating_layouts") or []
+    layout = make_layout(subjects, criteria)
+    if layouts and layouts[-1] == layout:
+        return None
+    return {"rating_layouts": layout}
+
+
+def is_packed(feedback_doc: dict) -> bool:
+    return LAYOUT_FIELD in feedback_doc
+
+
+def encode_feedback(feedback_doc: dict, form_doc: dict) -> dict:
+    """Return the storage form of a submission, packed when the ratings allow it"""
+    layout_id = current_layout_id(form_doc)
+    if layout_id is None:
+        return feedback_doc
+
+    subjects = form_doc["subjects"]
+    criteria = form_doc["evaluation_criteria"]
+    subject_index = {subject: i for i, subject in enumerate(subjects)}
+    criterion_index = {criterion: j for j, criterion in enumerate(criteria)}
+
+    packed = bytearray(len(subjects) * len(criteria))
+    for subject, subject_ratings in feedback_doc["ratings"].items():
+        i = subject_index.get(subject)
+        if i is None or not subject_ratings:
+            return feedback_doc
+        for criterion, rating in subject_ratings.items():
+            j = criterion_index.get(criterion)
+            if j is None or not 1 <= rating <= 255:
+                return feedback_doc
+            packed[i * len(criteria) + j] = rating
+
+    averages = [math.nan] * len(subjects)
+    for subject, average in feedback_doc.get("averages", {}).items():
+        i = subject_index.get(subject)
+        if i is None:
+            return feedback_doc
+        averages[i] = average
+
+    return dict(
+        feedback_doc,
+        ratings=bytes(packed),
+        averages=struct.pack(f"<{len(subjects)}d", *averages),
+        **{LAYOUT_FIELD: layout_id}
+    )
+
+
+def decode_ratings(packed: bytes, layout: dict) -> Dict[str, Dict[str, int]]:
+    criteria = layout["evaluation_criteria"]
+    ratings = {}
+    for i, subject in enumerate(layout["subjects"]):
+        row = packed[i * len(criteria):(i + 1) * len(criteria)]
+        subject_ratings = {criterion: rating for criterion, rating in zip(criteria, row) if rating}
+        if subject_ratings:
+            ratings[subject] = subject_ratings
+    return ratings
+
+
+def decode_averages(packed: bytes, layout: dict) -> Dict[str, float]:
+    subjects = layout["subjects"]
+    values = struct.unpack(f"<{len(subjects)}d", packed)
+    return {subject: value for subject, value in zip(subjects, values) if not math.isnan(value)}
+
+
+def decode_feedback(feedback_doc: dict, form_doc: dict) -> dict:
+    """Return a submission in the API's dict format"""
+    if not is_packed(feedback_doc):
+        return feedback_doc
+    decoded = dict(feedback_doc)
+    layout = form_doc["rating_layouts"][decoded.pop(LAYOUT_FIELD)]
+    if "ratings" in decoded:
+        decoded["ratings"] = decode_ratings(decoded["ratings"], layout)
+    if "averages" in decoded:
+        decoded["averages"] = decode_averages(decoded["averages"], layout)
+    return decoded
+
+
+async def load_layout_forms(db, form_ids: List[str]) -> Dict[str, dict]:
+    """Fetch just enough of each form to decode its submissions"""
+    cursor = db.feedback_forms.find(
+        {"id": {"$in": form_ids}},
+        {"_id": 0, "id": 1, "subjects": 1, "evaluation_criteria": 1, "rating_layouts": 1}
+    )
+    return {form_doc["id"]: form_doc async for form_doc in cursor}
+
+
+async def migrate_form(db, form_doc: dict) -> int:
+    """Pack one form's dict-format submissions; returns how many were converted"""
+    if current_layout_id(form_doc) is None:
+        layout_push = layout_update(form_doc, {})
+        await db.feedback_forms.update_one({"id": form_doc["id"]}, {"$push": layout_push})
+        form_doc = dict(form_doc, rating_layouts=(form_doc.get("rating_layouts") or []) + [
+            layout_push["rating_layouts"]
+        ])
+
+    converted = 0
+    cursor = db.student_feedbacks.find(
+        {"form_id": form_doc["id"], LAYOUT_FIELD: {"$exists": False}},
+        {"_id": 1, "ratings": 1, "averages": 1}
+    ).batch_size(MIGRATE_BATCH_SIZE)
+    async for feedback_doc in cursor:
+        packed = encode_feedback(feedback_doc, form_doc)
+        if not is_packed(packed):
+            continue
+        await db.student_feedbacks.update_one(
+            {"_id": feedback_doc["_id"], LAYOUT_FIELD: {"$exists": False}},
+            {"$set": {
+                "ratings": packed["ratings"],
+                "averages": packed["averages"],
+                LAYOUT_FIELD: packed[LAYOUT_FIELD],
+            }}
+        )
+        converted += 1
+    return converted
+
+
+async def migrate_all(db, form_ids: Optional[List[str]] = None) -> int:
+    query = {"id": {"$in": form_ids}} if form_ids else {}
+    total = 0
+    async for form_doc in db.feedback_forms.find(query):
+        converted = await migrate_form(db, form_doc)
+        logger.info(f"Packed {converted} submissions for form {form_doc['id']}")
+        total += converted
+    return total
+
+
+async def _main(form_ids: Optional[List[str]]):
+    from database import database
+
+    await database.connect_to_mongo()
+    try:
+        total = await migrate_all(database.database, form_ids)
+        logger.info(f"Packed {total} submissions")
+    finally:
+        await database.close_mongo_connection()
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    load_dotenv(Path(__file__).parent / '.env')
+
+    parser = argparse.ArgumentParser(description="Convert stored submissions to the packed ratings format")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("--form-id", action="append", dest="form_ids",
+                        help="Form to migrate (repeatable); defaults to all forms")
+    args = parser.parse_args()
+    asyncio.run(_main(args.form_ids))
@@ -0,0 +1,387 @@
+"""Background report generation.
+
+Admins request a PDF or XLSX report for a form and get a job id back
+immediately. ``ReportQueue`` reads the form's submissions in batches into
+a ratings array (``stats.load_ratings``) on the event loop, then hands the
+array to a ``ProcessPoolExecutor`` worker that computes the statistics and
+renders the file, so seconds of chart drawing never block request handling.
+
+Finished files are kept in a local artifact cache named after the form,
+its aggregate ``version`` and the format. The version moves on every
+submission and form change, so a request for an unchanged form is served
+from the cache without rendering again. Only the newest version of each
+form's report is kept. A job renders the version it actually read: the
+submissions are loaded between two reads of the aggregate and are only
+used when neither its version nor its response count moved meanwhile.
+
+XLSX is written with ``openpyxl`` and PDF with ``matplotlib``; both are in
+requirements.txt, and a deployment without one answers 501 for its format.
+Jobs live in memory and are per process; artifacts on disk are shared by
+every worker pointed at the same ``REPORT_CACHE_DIR``.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import aggregates
+import stats
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.chart import BarChart, Reference
+    from openpyxl.styles import Font
+except ImportError:  # pragma: no cover - optional dependency
+    Workbook = None
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.backends.backend_pdf import PdfPages
+    from matplotlib.figure import Figure
+except ImportError:  # pragma: no cover - optional dependency
+    PdfPages = None
+
+logger = logging.getLogger(__name__)
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_CACHE_DIR = Path(os.getenv("REPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "feedback-reports")))
+# Finished and failed jobs kept for status lookups before the oldest are forgotten
+REPORT_MAX_JOBS = int(os.getenv("REPORT_MAX_JOBS", "1000"))
+# Reads of a form's submissions before giving up on one that keeps changing
+REPORT_SNAPSHOT_ATTEMPTS = int(os.getenv("REPORT_SNAPSHOT_ATTEMPTS", "3"))
+
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def format_available(format: str) -> bool:
+    if format == "xlsx":
+        return Workbook is not None
+    if format == "pdf":
+        return PdfPages is not None
+    return False
+
+
+def artifact_path(form_id: str, version: int, format: str) -> Path:
+    return REPORT_CACHE_DIR / f"{form_id}-v{version}.{format}"
+
+
+async def load_snapshot(db, form_id: str) -> Tuple[int, dict, np.ndarray]:
+    """Read a form and its ratings as of one aggregate version, returning that version"""
+    for _ in range(REPORT_SNAPSHOT_ATTEMPTS):
+        before = await aggregates.get_form_aggregate(db, form_id)
+        form_doc = await db.feedback_forms.find_one({"id": form_id})
+        ratings = await stats.load_ratings(db, form_doc)
+        after = await aggregates.get_form_aggregate(db, form_id)
+        version = before.get("version", 0)
+        if after.get("version", 0) == version and after.get("response_count", 0) == len(ratings):
+            return version, form_doc, ratings
+    raise RuntimeError("Form kept changing while its submissions were read; retry the report")
+
+
+def _overall_rows(statistics: dict) -> List[list]:
+    rows = []
+    for subject, subject_stats in statistics["subjects"].items():
+        overall = subject_stats["overall"]
+        rows.append([subject, overall["count"], overall["mean"], overall["median"], overall["std"]])
+    return rows
+
+
+def _criterion_rows(subject_stats: dict) -> List[list]:
+    return [
+        [criterion, dist["count"], dist["mean"], dist["median"], dist["std"]]
+        + [dist["histogram"][str(rating)] for rating in stats.RATING_VALUES]
+        for criterion, dist in subject_stats["criteria"].items()
+    ]
+
+
+STAT_HEADERS = ["Responses", "Mean", "Median", "Std"]
+HISTOGRAM_HEADERS = [f"Rated {rating}" for rating in stats.RATING_VALUES]
+
+
+def _render_xlsx(form: dict, statistics: dict, path: str):
+    workbook = Workbook()
+    bold = Font(bold=True)
+
+    summary = workbook.active
+    summary.title = "Summary"
+    summary.append([form["title"]])
+    summary["A1"].font = Font(bold=True, size=14)
+    summary.append(["Department", form.get("department"), "Year", form.get("year"), "Section", form.get("section")])
+    summary.append(["Total responses", statistics["total_responses"]])
+    summary.append([])
+    summary.append(["Subject"] + STAT_HEADERS)
+    header_row = summary.max_row
+    for cell in summary[header_row]:
+        cell.font = bold
+    for row in _overall_rows(statistics):
+        summary.append(row)
+
+    if statistics["subjects"]:
+        chart = BarChart()
+        chart.title = "Average rating per subject"
+        chart.y_axis.scaling.min = 0
+        chart.y_axis.scaling.max = 5
+        chart.legend = None
+        last_row = summary.max_row
+        chart.add_data(Reference(summary, min_col=3, min_row=header_row, max_row=last_row), titles_from_data=True)
+        chart.set_categories(Reference(summary, min_col=1, min_row=header_row + 1, max_row=last_row))
+        summary.add_chart(chart, "H2")
+
+    criteria_sheet = workbook.create_sheet("Criteria")
+    for subject, subject_stats in statistics["subjects"].items():
+        criteria_sheet.append([subject])
+        criteria_sheet.cell(row=criteria_sheet.max_row, column=1).font = bold
+        criteria_sheet.append(["Criterion"] + STAT_HEADERS + HISTOGRAM_HEADERS)
+        for cell in criteria_sheet[criteria_sheet.max_row]:
+            cell.font = bold
+        for row in _criterion_rows(subject_stats):
+            criteria_sheet.append(row)
+        criteria_sheet.append([])
+
+    workbook.save(path)
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def _bar_page(title: str, labels: List[str], values: List[Optional[float]], table_headers: List[str],
+              table_rows: List[list]) -> "Figure":
+    figure = Figure(figsize=(8.27, 11.69))  # A4 portrait
+    figure.suptitle(title, fontsize=14)
+    chart = figure.add_axes([0.12, 0.55, 0.8, 0.35])
+    positions = np.arange(len(labels))
+    chart.bar(positions, [np.nan if value is None else value for value in values], color="#4C72B0")
+    chart.set_xticks(positions)
+    chart.set_xticklabels(labels, rotation=30, ha="right")
+    chart.set_ylim(0, 5)
+    chart.set_ylabel("Average rating")
+
+    table_axes = figure.add_axes([0.05, 0.05, 0.9, 0.4])
+    table_axes.axis("off")
+    if table_rows:
+        table = table_axes.table(
+            cellText=[[_format_value(value) for value in row] for row in table_rows],
+            colLabels=table_headers,
+            loc="upper center",
+        )
+        table.auto_set_font_size(False)
+        table.set_fontsize(8)
+    return figure
+
+
+def _render_pdf(form: dict, statistics: dict, path: str):
+    with PdfPages(path) as pdf:
+        overall = _overall_rows(statistics)
+        pdf.savefig(_bar_page(
+            f"{form['title']} ({statistics['total_responses']} responses)",
+            [row[0] for row in overall],
+            [row[2] for row in overall],
+            ["Subject"] + STAT_HEADERS,
+            overall,
+        ))
+        for subject, subject_stats in statistics["subjects"].items():
+            rows = _criterion_rows(subject_stats)
+            pdf.savefig(_bar_page(
+                subject,
+                [row[0] for row in rows],
+                [row[2] for row in rows],
+                ["Criterion"] + STAT_HEADERS + HISTOGRAM_HEADERS,
+                rows,
+            ))
+
+
+def render_report(format: str, form: dict, ratings: np.ndarray, path: str):
+    """Compute statistics and write the report; runs in a worker process"""
+    statistics = stats.compute_statistics(ratings, form["subjects"], form["evaluation_criteria"])
+    # Write next to the target and rename, so readers never see a partial file
+    partial = f"{path}.{os.getpid()}.partial"
+    try:
+        if format == "xlsx":
+            _render_xlsx(form, statistics, partial)
+        else:
+            _render_pdf(form, statistics, partial)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+class ReportJob:
+    def __init__(self, form_id: str, owner_id: str, format: str, version: int):
+        self.id = str(uuid.uuid4())
+        self.form_id = form_id
+        self.owner_id = owner_id
+        self.format = format
+        self.version = version
+        self.status = QUEUED
+        self.cached = False
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def path(self) -> Path:
+        return artifact_path(self.form_id, self.version, self.format)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "form_id": self.form_id,
+            "format": self.format,
+            "version": self.version,
+            "status": self.status,
+            "cached": self.cached,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ReportQueue:
+    """Tracks report jobs and runs their rendering on a process pool"""
+
+    def __init__(self, workers: int = REPORT_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, ReportJob] = {}
+        self.rendered = 0
+        self.cache_hits = 0
+        self.failures = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            REPORT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # Forking a process with a running event loop and driver threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        return self._jobs.get(job_id)
+
+    def _find_active(self, form_id: str, version: int, format: str) -> Optional[ReportJob]:
+        for job in self._jobs.values():
+            if (job.form_id, job.version, job.format) == (form_id, version, format) and not job.finished:
+                return job
+        return None
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished[:max(0, len(self._jobs) - REPORT_MAX_JOBS)]:
+            del self._jobs[job.id]
+
+    async def submit(self, db, form_doc: dict, owner_id: str, format: str) -> ReportJob:
+        """Queue a report for the form's current version, reusing a cached file or a running job"""
+        aggregate = await aggregates.get_form_aggregate(db, form_doc["id"])
+        version = aggregate.get("version", 0)
+
+        active = self._find_active(form_doc["id"], version, format)
+        if active is not None:
+            return active
+
+        job = ReportJob(form_doc["id"], owner_id, format, version)
+        self._jobs[job.id] = job
+        self._prune()
+        # Check if this version has already been rendered
+        if job.path.exists():
+            job.status = DONE
+            job.cached = True
+            job.finished_at = datetime.utcnow()
+            self.cache_hits += 1
+            return job
+
+        job._task = asyncio.create_task(self._run(db, job))
+        return job
+
+    async def _run(self, db, job: ReportJob):
+        job.status = RUNNING
+        try:
+            # Submissions that arrived since the job was queued are in the data,
+            # so the file is named after the version that was read
+            job.version, form_doc, ratings = await load_snapshot(db, job.form_id)
+            if job.path.exists():
+                job.status = DONE
+                job.cached = True
+                self.cache_hits += 1
+                return
+            form = {
+                field: form_doc.get(field)
+                for field in ("id", "title", "department", "year", "section", "subjects", "evaluation_criteria")
+            }
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                self._pool(), render_report, job.format, form, ratings, str(job.path)
+            )
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e) or type(e).__name__
+            self.failures += 1
+            logger.exception(f"Report {job.id} for form {job.form_id} failed")
+        else:
+            job.status = DONE
+            self.rendered += 1
+            self._remove_stale(job)
+        finally:
+            job.finished_at = datetime.utcnow()
+            job._task = None
+
+    def _remove_stale(self, job: ReportJob):
+        """Delete this form's reports rendered for older versions"""
+        prefix = f"{job.form_id}-v"
+        for path in REPORT_CACHE_DIR.glob(f"{prefix}*.{job.format}"):
+            version = path.stem[len(prefix):]
+            if version.isdigit() and int(version) < job.version:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    async def shutdown(self):
+        for job in list(self._jobs.values()):
+            if job._task is not None:
+                job._task.cancel()
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": statuses.count(QUEUED),
+            "running": statuses.count(RUNNING),
+            "rendered": self.rendered,
+            "cache_hits": self.cache_hits,
+            "failures": self.failures,
+        }
+
+
+report_queue = ReportQueue()
@@ -0,0 +1,89 @@
+"""Department/year/section rollups over the per-form aggregates.
+
+Rollups run as a single aggregation pipeline over ``form_aggregates``,
+which already holds running sums per form together with the form's
+department, year, section and owner. A rollup therefore reads one small
+document per form instead of any submissions, and merging thousands of
+forms stays a single round trip.
+"""
+from typing import Dict, List, Optional
+
+from aggregates import unescape_key
+
+ROLLUP_DIMENSIONS = ("department", "year", "section")
+
+
+def rollup_pipeline(match: dict, group_by: str) -> List[dict]:
+    group = f"${group_by}"
+    subjects = [
+        {"$project": {"group": group, "subjects": {"$objectToArray": "$subjects"}}},
+        {"$unwind": "$subjects"},
+    ]
+    return [
+        {"$match": match},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": group,
+                    "form_count": {"$sum": 1},
+                    "total_responses": {"$sum": "$response_count"},
+                }},
+            ],
+            "subjects": subjects + [
+                {"$group": {
+                    "_id": {"group": "$group", "subject": "$subjects.k"},
+                    "sum": {"$sum": "$subjects.v.sum"},
+                    "count": {"$sum": "$subjects.v.count"},
+                }},
+            ],
+            "criteria": subjects + [
+                {"$project": {
+                    "group": 1,
+                    "subject": "$subjects.k",
+                    "criteria": {"$objectToArray": "$subjects.v.criteria"},
+                }},
+                {"$unwind": "$criteria"},
+                {"$group": {
+                    "_id": {"group": "$group", "subject": "$subject", "criterion": "$criteria.k"},
+                    "sum": {"$sum": "$criteria.v.sum"},
+                    "count": {"$sum": "$criteria.v.count"},
+                }},
+            ],
+        }},
+    ]
+
+
+async def compute_rollup(db, owner_id: str, group_by: str,
+                         filters: Optional[Dict[str, str]] = None) -> List[dict]:
+    """Subject and criterion averages per department, year or section"""
+    if group_by not in ROLLUP_DIMENSIONS:
+        raise ValueError(f"Cannot group by {group_by}")
+
+    match = {"created_by": owner_id, "is_active": True}
+    match.update({field: value for field, value in (filters or {}).items() if value is not None})
+
+    results = await db.form_aggregates.aggregate(rollup_pipeline(match, group_by)).to_list(length=1)
+    facets = results[0] if results else {"totals": [], "subjects": [], "criteria": []}
+
+    groups = {}
+    for row in facets["totals"]:
+        groups[row["_id"]] = {
+            "key": row["_id"],
+            "form_count": row["form_count"],
+            "total_responses": row["total_responses"],
+            "average_ratings_per_subject": {},
+            "average_ratings_per_criterion": {},
+        }
+    for row in facets["subjects"]:
+        group = groups.get(row["_id"]["group"])
+        if group is not None and row["count"]:
+            subject = unescape_key(row["_id"]["subject"])
+            group["average_ratings_per_subject"][subject] = row["sum"] / row["count"]
+    for row in facets["criteria"]:
+        group = groups.get(row["_id"]["group"])
+        if group is not None and row["count"]:
+            subject = unescape_key(row["_id"]["subject"])
+            criterion = unescape_key(row["_id"]["criterion"])
+            group["average_ratings_per_criterion"].setdefault(subject, {})[criterion] = row["sum"] / row["count"]
+
+    return sorted(groups.values(), key=lambda group: (group["key"] is None, str(group["key"])))
@@ -0,0 +1,53 @@
+"""Ranked full-text search over feedback comments.
+
+Backed by the text index on ``student_feedbacks.comments`` (declared in
+``indexes.DESIRED_INDEXES``), which the database maintains on every
+insert, so a search is one indexed ``$text`` query rather than a download
+and scan of every submission. The scope -- one form, a department, or all
+of an owner's forms -- is resolved to form ids first and applied as a
+``form_id`` filter. Results are ordered by text score, newest first on ties.
+"""
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+SEARCH_SORT = [("score", {"$meta": "textScore"}), ("submitted_at", -1), ("id", 1)]
+SEARCH_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "form_id": 1,
+    "student_id": 1,
+    "student_name": 1,
+    "comments": 1,
+    "submitted_at": 1,
+    "score": {"$meta": "textScore"},
+}
+
+
+async def scope_forms(db, owner_id: str, form_id: Optional[str] = None,
+                      department: Optional[str] = None) -> Dict[str, str]:
+    """Titles by id of the owner's active forms within the requested scope"""
+    query = {"created_by": owner_id, "is_active": True}
+    if form_id:
+        query["id"] = form_id
+    if department:
+        query["department"] = department
+    cursor = db.feedback_forms.find(query, {"_id": 0, "id": 1, "title": 1})
+    return {form_doc["id"]: form_doc["title"] async for form_doc in cursor}
+
+
+def search_filter(text: str, form_ids: List[str]) -> dict:
+    return {"$text": {"$search": text}, "form_id": {"$in": form_ids}}
+
+
+async def search_comments(db, text: str, form_ids: List[str], offset: int = 0,
+                          limit: int = 20) -> Tuple[int, List[dict]]:
+    """Return the total number of matches and one page of them, best match first"""
+    if not form_ids:
+        return 0, []
+    query = search_filter(text, form_ids)
+    cursor = db.student_feedbacks.find(query, SEARCH_PROJECTION).sort(SEARCH_SORT).skip(offset).limit(limit)
+    total, hits = await asyncio.gather(
+        db.student_feedbacks.count_documents(query),
+        cursor.to_list(limit)
+    )
+    return total, hits
@@ -0,0 +1,84 @@
+"""Trusted-read serialization for documents the server wrote itself.
+
+Forms and submissions are validated on the way in, so re-validating them
+on every read (once when building the Pydantic model, again through the
+route's ``response_model``) only burns CPU. Read routes instead build plain
+dicts shaped like the response model, filling defaults but skipping
+validation, and serialize them with ``orjson`` when it is installed.
+
+Set ``TRUSTED_READS=false`` to validate the same content against the
+route's response model before it is sent.
+"""
+import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+TRUSTED_READS = os.getenv("TRUSTED_READS", "true").lower() in ("1", "true", "yes")
+
+_MISSING = object()
+_field_defaults: Dict[Type[BaseModel], Tuple[Tuple[str, Any], ...]] = {}
+
+
+def _defaults(model_cls: Type[BaseModel]) -> Tuple[Tuple[str, Any], ...]:
+    defaults = _field_defaults.get(model_cls)
+    if defaults is None:
+        defaults = _field_defaults[model_cls] = tuple(
+            (name, _MISSING if field.is_required() or field.default_factory else field.default)
+            for name, field in model_cls.model_fields.items()
+        )
+    return defaults
+
+
+def construct(model_cls: Type[BaseModel], document: dict, **values) -> dict:
+    """Shape a stored document like ``model_cls`` without validating it.
+
+    Like ``model_cls.model_construct`` but produces a dict: unknown keys such
+    as ``_id`` are dropped and missing optional fields get their defaults.
+    """
+    result = {}
+    for name, default in _defaults(model_cls):
+        if name in values:
+            result[name] = values[name]
+        elif name in document:
+            result[name] = document[name]
+        elif default is not _MISSING:
+            result[name] = default
+    return result
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class TrustedJSONResponse(JSONResponse):
+    """JSON response rendered straight from trusted content"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def _adapter(response_model: Any) -> TypeAdapter:
+    return TypeAdapter(response_model)
+
+
+def read_response(content: Any, response_model: Any, headers: Optional[Dict[str, str]] = None):
+    """Serialize trusted content directly, or validate it against the response model first"""
+    if not TRUSTED_READS:
+        adapter = _adapter(response_model)
+        content = adapter.dump_python(adapter.validate_python(content), mode="json")
+    return TrustedJSONResponse(content, headers=headers)
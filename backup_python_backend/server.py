@@ -1,26 +1,54 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from dotenv import load_dotenv
 from pathlib import Path
+import asyncio
 import os
+from collections import Counter
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import timedelta
 
+# Load .env before local modules read their configuration from the environment
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
 from models import (
     User, UserCreate, UserLogin, Token,
     FeedbackForm, FeedbackFormCreate, FeedbackFormUpdate, FeedbackFormResponse,
     StudentFeedback, StudentFeedbackCreate, FeedbackSummary,
+    FeedbackBatchStatus, FeedbackBatchItemResult, FeedbackBatchResponse,
+    RollupResponse, FormStatistics, ReportJobResponse,
+    CommentSearchHit, CommentSearchResponse, TermFrequencyResponse, ArchivedFormResponse,
     UserRole
 )
 from auth import (
-    get_password_hash, verify_password, create_access_token,
+    password_hasher, create_access_token,
     get_current_user, get_current_admin_user, ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from database import database
-
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+from database import DUPLICATE_KEY_ERROR, INDEX_NOT_FOUND, database
+from indexes import index_manager
+import aggregates
+import archive
+import rollups
+import stats
+import search
+import terms
+from reports import report_queue
+import reports
+from cache import form_cache
+from batcher import WriteBatcher, FEEDBACK_WRITE_BEHIND
+import export
+import ratings_codec
+import projections
+import etags
+from serialization import TrustedJSONResponse, construct, dumps, read_response
+from pagination import FEEDBACK_SORT, encode_cursor, feedback_page_filter
+import pagination
+import metrics
+import admission
 
 # Create the main app
 app = FastAPI(title="Teacher Feedback Collection System API")
@@ -28,6 +56,10 @@ app = FastAPI(title="Teacher Feedback Collection System API")
 # Create API router
 api_router = APIRouter(prefix="/api")
 
+# Per-route-class concurrency limits and submission rate limits; added
+# first so it sits inside CORS and the metrics middleware
+app.add_middleware(admission.AdmissionMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,8 +67,12 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+# Per-route latency histograms
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -44,14 +80,74 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def record_submissions(feedback_docs: List[dict]):
+    """Fold inserted submissions into the rating aggregates and comment term tables"""
+    await asyncio.gather(
+        aggregates.record_inserted(database.database, feedback_docs),
+        terms.record_comments(database.database, feedback_docs)
+    )
+
+# Optional group-commit buffer for feedback submissions
+submission_batcher = WriteBatcher(
+    lambda: database.database.student_feedbacks,
+    on_flush=record_submissions
+)
+
+metrics.registry.register_stats("password_hasher", password_hasher.stats)
+metrics.registry.register_stats("form_cache", form_cache.stats)
+metrics.registry.register_stats("submission_batcher", submission_batcher.stats)
+for class_name, limiter in admission.limiters.items():
+    metrics.registry.register_stats(f"admission_{class_name}", limiter.stats)
+metrics.registry.register_stats("client_rate_limit", admission.client_rate_limiter.stats)
+metrics.registry.register_stats("form_rate_limit", admission.form_rate_limiter.stats)
+metrics.registry.register_stats("indexes", index_manager.stats)
+metrics.registry.register_stats("reports", report_queue.stats)
+
 # Startup and shutdown events
 @app.on_event("startup")
 async def startup_db_client():
     await database.connect_to_mongo()
+    # Rebuilding races submissions, so forms that predate aggregates get theirs before any are served
+    await aggregates.create_missing_aggregates(database.database)
+    if FEEDBACK_WRITE_BEHIND:
+        await submission_batcher.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await submission_batcher.stop()
+    await report_queue.shutdown()
     await database.close_mongo_connection()
+    password_hasher.shutdown()
+
+async def get_active_forms(form_ids: List[str]) -> dict:
+    """Read-through lookup of active forms by id, served from the form cache"""
+    forms = {}
+    missing = []
+    for form_id in form_ids:
+        form_doc = form_cache.get(form_id)
+        if form_doc is None:
+            missing.append(form_id)
+        else:
+            forms[form_id] = form_doc
+    
+    if missing:
+        cursor = database.database.feedback_forms.find(
+            {"id": {"$in": missing}, "is_active": True}
+        )
+        async for form_doc in cursor:
+            form_cache.set(form_doc["id"], form_doc)
+            forms[form_doc["id"]] = form_doc
+    return forms
+
+async def get_active_form(form_id: str) -> Optional[dict]:
+    form_doc = form_cache.get(form_id)
+    if form_doc is None:
+        form_doc = await database.database.feedback_forms.find_one(
+            {"id": form_id, "is_active": True}
+        )
+        if form_doc:
+            form_cache.set(form_id, form_doc)
+    return form_doc
 
 # Authentication Routes
 @api_router.post("/auth/register", response_model=Token)
@@ -71,7 +167,7 @@ async def register(user_data: UserCreate):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     user = User(
         username=user_data.username,
         email=user_data.email,
@@ -98,13 +194,25 @@ async def register(user_data: UserCreate):
 async def login(user_data: UserLogin):
     # Find user
     user_doc = await database.database.users.find_one({"username": user_data.username})
-    if not user_doc or not verify_password(user_data.password, user_doc["hashed_password"]):
+    valid, new_hash = False, None
+    if user_doc:
+        valid, new_hash = await password_hasher.verify_and_update(
+            user_data.password, user_doc["hashed_password"]
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Transparently upgrade hashes made with a different cost factor
+    if new_hash:
+        await database.database.users.update_one(
+            {"id": user_doc["id"]},
+            {"$set": {"hashed_password": new_hash}}
+        )
+    
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -145,7 +253,8 @@ async def create_feedback_form(
         department=form_data.department,
         subjects=form_data.subjects,
         evaluation_criteria=form_data.evaluation_criteria,
-        created_by=current_user["user_id"]
+        created_by=current_user["user_id"],
+        rating_layouts=[ratings_codec.make_layout(form_data.subjects, form_data.evaluation_criteria)]
     )
     
     # Generate shareable link
@@ -153,43 +262,121 @@ async def create_feedback_form(
     form.shareable_link = f"{base_url}/#/student/{form.id}"
     
     await database.database.feedback_forms.insert_one(form.dict())
+    await aggregates.create_form_aggregate(database.database, form.dict())
     
     return FeedbackFormResponse(**form.dict(), response_count=0)
 
 @api_router.get("/forms", response_model=List[FeedbackFormResponse])
-async def get_feedback_forms(current_user: dict = Depends(get_current_admin_user)):
-    forms_cursor = database.database.feedback_forms.find(
-        {"created_by": current_user["user_id"], "is_active": True}
-    )
-    forms = []
+async def get_feedback_forms(
+    request: Request,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    fields: Optional[str] = Query(None, description="Comma separated form fields to return"),
+    sort: str = Query("created_at", pattern="^(created_at|title|response_count)$"),
+    order: Optional[str] = Query(None, pattern="^(asc|desc)$", description="Defaults to desc, or asc for title"),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    department: Optional[str] = None,
+    year: Optional[str] = None,
+    section: Optional[str] = None,
+    current_user: dict = Depends(get_current_admin_user)
+):
+    try:
+        selected = projections.parse_fields(fields, FeedbackFormResponse.model_fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if selected is None and view == "summary":
+        selected = projections.FORM_SUMMARY_FIELDS
+    
+    direction = pagination.DEFAULT_FORM_DIRECTION[sort] if order is None else (1 if order == "asc" else -1)
+    try:
+        query = pagination.form_page_filter(
+            current_user["user_id"],
+            {"department": department, "year": year, "section": section},
+            sort, direction, cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # Unchanged since the client's last poll: answer from the aggregate versions alone
+    versions = await aggregates.get_form_versions(database.database, current_user["user_id"])
+    etag = etags.forms_etag(versions.items(), request.url.query)
+    if etags.matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # Only the selected fields are read; response_count is not a stored field
+    projection = None
+    if selected:
+        projection = projections.mongo_projection(
+            [field for field in selected if field != "response_count"],
+            extra=["id"] if sort == "response_count" else ["id", sort]
+        )
     
-    async for form_doc in forms_cursor:
-        # Count responses for each form
-        response_count = await database.database.student_feedbacks.count_documents(
-            {"form_id": form_doc["id"]}
+    # Counts live on the aggregates, so that sort pages through them instead of the forms
+    if sort == "response_count":
+        page_cursor = database.database.form_aggregates.find(
+            query, {"_id": 0, "form_id": 1, "response_count": 1}
+        )
+    else:
+        page_cursor = database.database.feedback_forms.find(query, projection)
+    page_cursor = page_cursor.sort(pagination.form_sort(sort, direction))
+    if limit:
+        # Fetch one extra document to know whether another page follows
+        page_cursor = page_cursor.limit(limit + 1)
+    page = await page_cursor.to_list(length=None)
+    
+    headers = {"ETag": etag}
+    if limit and len(page) > limit:
+        page = page[:limit]
+        id_field = pagination.form_id_field(sort)
+        headers["X-Next-Cursor"] = pagination.encode_form_cursor(
+            sort, direction, page[-1][sort], page[-1][id_field]
         )
-        
-        form_response = FeedbackFormResponse(**form_doc, response_count=response_count)
-        forms.append(form_response)
     
-    return forms
+    if sort == "response_count":
+        response_counts = {aggregate["form_id"]: aggregate.get("response_count", 0) for aggregate in page}
+        forms_by_id = {
+            form_doc["id"]: form_doc
+            async for form_doc in database.database.feedback_forms.find(
+                {"id": {"$in": list(response_counts)}}, projection
+            )
+        }
+        form_docs = [forms_by_id[form_id] for form_id in response_counts if form_id in forms_by_id]
+    else:
+        form_docs = page
+        response_counts = {}
+    
+    # Count responses for all forms in a single batched query
+    if sort != "response_count" and (not selected or "response_count" in selected):
+        response_counts = await aggregates.get_response_counts(
+            database.database, [form_doc["id"] for form_doc in form_docs]
+        )
+    
+    if selected:
+        return TrustedJSONResponse([
+            projections.select(dict(form_doc, response_count=response_counts.get(form_doc["id"])), selected)
+            for form_doc in form_docs
+        ], headers=headers)
+    
+    return read_response([
+        construct(FeedbackFormResponse, form_doc, response_count=response_counts[form_doc["id"]])
+        for form_doc in form_docs
+    ], List[FeedbackFormResponse], headers=headers)
 
 @api_router.get("/forms/{form_id}", response_model=FeedbackFormResponse)
 async def get_feedback_form(form_id: str):
     """Get feedback form by ID - accessible to both admin and students via shareable link"""
-    form_doc = await database.database.feedback_forms.find_one(
-        {"id": form_id, "is_active": True}
-    )
+    form_doc = await get_active_form(form_id)
     
     if not form_doc:
         raise HTTPException(status_code=404, detail="Feedback form not found")
     
     # Count responses
-    response_count = await database.database.student_feedbacks.count_documents(
-        {"form_id": form_id}
-    )
+    response_counts = await aggregates.get_response_counts(database.database, [form_id])
     
-    return FeedbackFormResponse(**form_doc, response_count=response_count)
+    return read_response(
+        construct(FeedbackFormResponse, form_doc, response_count=response_counts[form_id]),
+        FeedbackFormResponse
+    )
 
 @api_router.put("/forms/{form_id}", response_model=FeedbackFormResponse)
 async def update_feedback_form(
@@ -207,19 +394,22 @@ async def update_feedback_form(
     
     # Update form
     update_data = {k: v for k, v in form_update.dict().items() if v is not None}
+    update = {"$set": update_data}
     
-    await database.database.feedback_forms.update_one(
-        {"id": form_id},
-        {"$set": update_data}
-    )
+    # New subject/criterion orders get a new layout; older submissions keep theirs
+    layout_push = ratings_codec.layout_update(existing_form, update_data)
+    if layout_push:
+        update["$push"] = layout_push
+    
+    await database.database.feedback_forms.update_one({"id": form_id}, update)
+    form_cache.invalidate(form_id)
     
     # Get updated form
     updated_form = await database.database.feedback_forms.find_one({"id": form_id})
-    response_count = await database.database.student_feedbacks.count_documents(
-        {"form_id": form_id}
-    )
+    await aggregates.sync_form_dimensions(database.database, updated_form)
+    response_counts = await aggregates.get_response_counts(database.database, [form_id])
     
-    return FeedbackFormResponse(**updated_form, response_count=response_count)
+    return FeedbackFormResponse(**updated_form, response_count=response_counts[form_id])
 
 @api_router.delete("/forms/{form_id}")
 async def delete_feedback_form(
@@ -239,37 +429,56 @@ async def delete_feedback_form(
         {"id": form_id},
         {"$set": {"is_active": False}}
     )
+    form_cache.invalidate(form_id)
+    await aggregates.sync_form_dimensions(database.database, dict(existing_form, is_active=False))
     
     return {"message": "Feedback form deleted successfully"}
 
+def enforce_form_rate_limit(costs: Dict[str, int]):
+    """Reject submissions once a form's token bucket is exhausted; no bucket is charged then"""
+    allowed, retry_after = admission.form_rate_limiter.acquire_many(costs)
+    if not allowed:
+        admission.admission_shed.inc(admission.SUBMISSION, "form_rate")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many submissions for this form, please retry shortly",
+            headers={"Retry-After": admission.retry_after_header(retry_after)}
+        )
+
+def validate_ratings(form_doc: dict, ratings: dict) -> Optional[str]:
+    """Return an error message if the ratings do not fit the form"""
+    subjects = set(form_doc["subjects"])
+    criteria = set(form_doc["evaluation_criteria"])
+    for subject, subject_ratings in ratings.items():
+        if subject not in subjects:
+            return f"Unknown subject: {subject}"
+        for criterion, rating in subject_ratings.items():
+            if criterion not in criteria:
+                return f"Unknown evaluation criterion: {criterion}"
+            if not 1 <= rating <= 5:
+                return f"Rating out of range for {subject} / {criterion}"
+    return None
+
 # Student Feedback Routes
 @api_router.post("/feedback", response_model=StudentFeedback)
 async def submit_feedback(feedback_data: StudentFeedbackCreate):
     # Check if form exists and is active
-    form_doc = await database.database.feedback_forms.find_one(
-        {"id": feedback_data.form_id, "is_active": True}
-    )
+    form_doc = await get_active_form(feedback_data.form_id)
     
     if not form_doc:
         raise HTTPException(status_code=404, detail="Feedback form not found")
     
-    # Check if student has already submitted feedback for this form
-    existing_feedback = await database.database.student_feedbacks.find_one({
-        "form_id": feedback_data.form_id,
-        "student_id": feedback_data.student_id
-    })
+    # Charged only once the form is known to exist, so made-up form ids
+    # never create or drain a bucket
+    enforce_form_rate_limit({feedback_data.form_id: 1})
     
-    if existing_feedback:
-        raise HTTPException(
-            status_code=400,
-            detail="You have already submitted feedback for this form"
-        )
+    # Unknown names and out of range values would end up in the aggregate's $inc paths
+    error = validate_ratings(form_doc, feedback_data.ratings)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
     
     # Calculate averages for each subject
-    averages = {}
-    for subject, ratings in feedback_data.ratings.items():
-        if ratings:
-            averages[subject] = sum(ratings.values()) / len(ratings)
+    averages = aggregates.compute_averages(feedback_data.ratings)
     
     # Create feedback
     feedback = StudentFeedback(
@@ -281,57 +490,489 @@ async def submit_feedback(feedback_data: StudentFeedbackCreate):
         averages=averages
     )
     
-    await database.database.student_feedbacks.insert_one(feedback.dict())
+    # The unique (form_id, student_id) index rejects repeat submissions,
+    # so no separate duplicate lookup is needed before inserting
+    feedback_doc = feedback.dict()
+    stored_doc = ratings_codec.encode_feedback(feedback_doc, form_doc)
+    write_behind = submission_batcher.running
+    try:
+        if write_behind:
+            # Write-behind: resolves once the batch holding this submission is
+            # written; the batcher also updates the aggregate and term tables
+            await submission_batcher.submit(stored_doc)
+        else:
+            await database.database.student_feedbacks.insert_one(stored_doc)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=400,
+            detail="You have already submitted feedback for this form"
+        )
+    
+    if not write_behind:
+        # Fold the submission into the form's running aggregate and term tables
+        await record_submissions([feedback_doc])
     
     return feedback
 
+# Number of submissions fetched from Mongo per cursor batch
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "500"))
+
+# Submissions per page of a form's feedback when a cursor is given without a limit
+FEEDBACK_PAGE_SIZE = int(os.getenv("FEEDBACK_PAGE_SIZE", "100"))
+
+# Upper bound on items accepted by a single batch submission
+FEEDBACK_BATCH_MAX_ITEMS = int(os.getenv("FEEDBACK_BATCH_MAX_ITEMS", "1000"))
+
+@api_router.post("/feedback/batch", response_model=FeedbackBatchResponse)
+async def submit_feedback_batch(feedback_items: List[StudentFeedbackCreate]):
+    """Submit many feedbacks at once, e.g. when replaying offline collection"""
+    if len(feedback_items) > FEEDBACK_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch exceeds {FEEDBACK_BATCH_MAX_ITEMS} items"
+        )
+    
+    # Look up every referenced form once
+    items_per_form = Counter(item.form_id for item in feedback_items)
+    forms = await get_active_forms(list(items_per_form))
+    
+    # Each existing form's bucket is charged for all of its items in the batch,
+    # and only if every such form has the tokens; unknown forms are not charged
+    enforce_form_rate_limit({form_id: count for form_id, count in items_per_form.items() if form_id in forms})
+    
+    results = [None] * len(feedback_items)
+    feedback_docs = []
+    doc_indexes = []
+    for index, item in enumerate(feedback_items):
+        form_doc = forms.get(item.form_id)
+        error = "Feedback form not found" if not form_doc else validate_ratings(form_doc, item.ratings)
+        if error:
+            results[index] = FeedbackBatchItemResult(
+                index=index, student_id=item.student_id,
+                status=FeedbackBatchStatus.INVALID, detail=error
+            )
+            continue
+        
+        feedback = StudentFeedback(
+            form_id=item.form_id,
+            student_id=item.student_id,
+            student_name=item.student_name,
+            ratings=item.ratings,
+            comments=item.comments,
+            averages=aggregates.compute_averages(item.ratings)
+        )
+        feedback_docs.append(feedback.dict())
+        doc_indexes.append(index)
+    
+    # Unordered insert keeps going past duplicates caught by the unique index
+    write_errors = {}
+    if feedback_docs:
+        stored_docs = [
+            ratings_codec.encode_feedback(feedback_doc, forms[feedback_doc["form_id"]])
+            for feedback_doc in feedback_docs
+        ]
+        try:
+            await database.database.student_feedbacks.insert_many(stored_docs, ordered=False)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+    
+    inserted_docs = []
+    for position, (index, feedback_doc) in enumerate(zip(doc_indexes, feedback_docs)):
+        error = write_errors.get(position)
+        if error is None:
+            inserted_docs.append(feedback_doc)
+            results[index] = FeedbackBatchItemResult(
+                index=index, student_id=feedback_doc["student_id"],
+                status=FeedbackBatchStatus.CREATED, feedback_id=feedback_doc["id"]
+            )
+        elif error.get("code") == DUPLICATE_KEY_ERROR:
+            results[index] = FeedbackBatchItemResult(
+                index=index, student_id=feedback_doc["student_id"],
+                status=FeedbackBatchStatus.DUPLICATE,
+                detail="You have already submitted feedback for this form"
+            )
+        else:
+            results[index] = FeedbackBatchItemResult(
+                index=index, student_id=feedback_doc["student_id"],
+                status=FeedbackBatchStatus.INVALID, detail=error.get("errmsg")
+            )
+    
+    await record_submissions(inserted_docs)
+    
+    return FeedbackBatchResponse(
+        created=len(inserted_docs),
+        failed=len(feedback_items) - len(inserted_docs),
+        results=results
+    )
+
+# Seconds a client is told to wait while the comments text index is being built
+SEARCH_INDEX_RETRY_AFTER_SECONDS = int(os.getenv("SEARCH_INDEX_RETRY_AFTER_SECONDS", "30"))
+
+@api_router.get("/feedback/search", response_model=CommentSearchResponse)
+async def search_feedback_comments(
+    q: str = Query(..., min_length=1, max_length=200),
+    form_id: Optional[str] = None,
+    department: Optional[str] = None,
+    offset: int = Query(0, ge=0, le=10000),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """Ranked search over comments on the admin's forms, optionally within one form or department"""
+    text = q.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Search text is required")
+    
+    titles = await search.scope_forms(database.database, current_user["user_id"], form_id, department)
+    
+    # Check if the requested form exists and belongs to current user
+    if form_id and not titles:
+        raise HTTPException(status_code=404, detail="Feedback form not found")
+    
+    try:
+        total, hits = await search.search_comments(database.database, text, list(titles), offset, limit)
+    except OperationFailure as e:
+        if e.code != INDEX_NOT_FOUND:
+            raise
+        # The comments text index is built in the background after a fresh deploy
+        raise HTTPException(
+            status_code=503,
+            detail="Comment search is unavailable until its index has been built, please retry shortly",
+            headers={"Retry-After": str(SEARCH_INDEX_RETRY_AFTER_SECONDS)}
+        )
+    results = [
+        CommentSearchHit(
+            feedback_id=hit["id"],
+            form_id=hit["form_id"],
+            form_title=titles[hit["form_id"]],
+            student_id=hit["student_id"],
+            student_name=hit.get("student_name"),
+            comments=hit["comments"],
+            submitted_at=hit["submitted_at"],
+            score=hit["score"]
+        )
+        for hit in hits
+    ]
+    next_offset = offset + len(results) if offset + len(results) < total else None
+    return CommentSearchResponse(
+        query=text, total=total, offset=offset, limit=limit, next_offset=next_offset, results=results
+    )
+
 @api_router.get("/forms/{form_id}/feedback", response_model=FeedbackSummary)
 async def get_form_feedback(
+    request: Request,
     form_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    fields: Optional[str] = Query(None, description="Comma separated submission fields to return"),
     current_user: dict = Depends(get_current_admin_user)
 ):
-    # Check if form exists and belongs to current user
+    try:
+        selected = projections.parse_fields(fields, StudentFeedback.model_fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Check if form exists and belongs to current user; the summary view
+    # needs only the header fields
+    form_projection = projections.mongo_projection(projections.FORM_HEADER_FIELDS) if view == "summary" else None
     form_doc = await database.database.feedback_forms.find_one(
-        {"id": form_id, "created_by": current_user["user_id"]}
+        {"id": form_id, "created_by": current_user["user_id"]}, form_projection
     )
     
     if not form_doc:
         raise HTTPException(status_code=404, detail="Feedback form not found")
     
-    # Get all feedbacks for this form
-    feedbacks_cursor = database.database.student_feedbacks.find({"form_id": form_id})
-    feedbacks = []
-    subject_ratings = {}
+    # Averages come from the precomputed aggregate instead of a full scan
+    aggregate = await aggregates.get_form_aggregate(database.database, form_id)
     
-    async for feedback_doc in feedbacks_cursor:
-        feedback = StudentFeedback(**feedback_doc)
-        feedbacks.append(feedback)
-        
-        # Collect ratings for average calculation
-        for subject, avg_rating in feedback.averages.items():
-            if subject not in subject_ratings:
-                subject_ratings[subject] = []
-            subject_ratings[subject].append(avg_rating)
-    
-    # Calculate average ratings per subject
-    average_ratings_per_subject = {}
-    for subject, ratings in subject_ratings.items():
-        average_ratings_per_subject[subject] = sum(ratings) / len(ratings) if ratings else 0
-    
-    return FeedbackSummary(
+    # Nothing submitted or edited since the client's copy: skip student_feedbacks entirely
+    etag = etags.form_etag(form_id, aggregate.get("version", 0), request.url.query)
+    if etags.matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    total_responses, average_ratings_per_subject, average_ratings_per_criterion = (
+        aggregates.summarize(aggregate)
+    )
+    
+    summary = construct(
+        FeedbackSummary, {},
         form_id=form_id,
         form_title=form_doc["title"],
         year=form_doc["year"],
         section=form_doc["section"],
         department=form_doc["department"],
-        total_responses=len(feedbacks),
+        total_responses=total_responses,
         average_ratings_per_subject=average_ratings_per_subject,
-        feedbacks=feedbacks
+        average_ratings_per_criterion=average_ratings_per_criterion,
+        feedbacks=[]
+    )
+    
+    # Dashboard polling: the summary view never touches student_feedbacks
+    if view == "summary":
+        return read_response(summary, FeedbackSummary, headers={"ETag": etag})
+    
+    # Get feedbacks for this form one keyset page at a time when paging; without a
+    # limit or cursor every submission is returned, as existing clients expect
+    if cursor and not limit:
+        limit = FEEDBACK_PAGE_SIZE
+    try:
+        query = feedback_page_filter(form_id, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    feedback_projection = None
+    if selected:
+        # The sort key is always read so the next cursor can be built
+        extra = ["submitted_at", "id"]
+        if "ratings" in selected or "averages" in selected:
+            extra.append(ratings_codec.LAYOUT_FIELD)
+        feedback_projection = projections.mongo_projection(selected, extra)
+    
+    feedbacks_cursor = database.database.student_feedbacks.find(query, feedback_projection).sort(FEEDBACK_SORT)
+    if limit:
+        # Fetch one extra document to know whether another page follows
+        feedbacks_cursor = feedbacks_cursor.limit(limit + 1)
+    feedback_docs = [
+        ratings_codec.decode_feedback(feedback_doc, form_doc)
+        async for feedback_doc in feedbacks_cursor
+    ]
+    
+    if limit and len(feedback_docs) > limit:
+        feedback_docs = feedback_docs[:limit]
+        summary["next_cursor"] = encode_cursor(feedback_docs[-1]["submitted_at"], feedback_docs[-1]["id"])
+    
+    if selected:
+        # Partial submissions do not fit StudentFeedback, so serialize them as-is
+        summary["feedbacks"] = [projections.select(feedback_doc, selected) for feedback_doc in feedback_docs]
+        return TrustedJSONResponse(summary, headers={"ETag": etag})
+    
+    summary["feedbacks"] = [construct(StudentFeedback, feedback_doc) for feedback_doc in feedback_docs]
+    return read_response(summary, FeedbackSummary, headers={"ETag": etag})
+
+@api_router.get("/forms/{form_id}/feedback/stream")
+async def stream_form_feedback(
+    form_id: str,
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """Stream a form's submissions as NDJSON, one submission per line"""
+    form_doc = await database.database.feedback_forms.find_one(
+        {"id": form_id, "created_by": current_user["user_id"]}
+    )
+    
+    if not form_doc:
+        raise HTTPException(status_code=404, detail="Feedback form not found")
+    
+    try:
+        query = feedback_page_filter(form_id, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    feedbacks_cursor = database.database.student_feedbacks.find(query).sort(
+        FEEDBACK_SORT
+    ).batch_size(FEEDBACK_BATCH_SIZE)
+    
+    async def generate():
+        async for feedback_doc in feedbacks_cursor:
+            feedback = construct(StudentFeedback, ratings_codec.decode_feedback(feedback_doc, form_doc))
+            yield dumps(feedback) + b"\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@api_router.get("/forms/{form_id}/export")
+async def export_form_feedback(
+    form_id: str,
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """Export a form's submissions as a streamed CSV or Parquet file"""
+    form_doc = await database.database.feedback_forms.find_one(
+        {"id": form_id, "created_by": current_user["user_id"]}
+    )
+    
+    if not form_doc:
+        raise HTTPException(status_code=404, detail="Feedback form not found")
+    
+    if format == "parquet":
+        if not export.parquet_available():
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+        body = export.stream_parquet(database.database, form_doc)
+        media_type = "application/vnd.apache.parquet"
+    else:
+        body = export.stream_csv(database.database, form_doc)
+        media_type = "text/csv"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="feedback-{form_id}.{format}"'}
+    )
+
+@api_router.get("/forms/{form_id}/stats", response_model=FormStatistics)
+async def get_form_stats(form_id: str, current_user: dict = Depends(get_current_admin_user)):
+    """Rating distributions per subject and criterion, plus criterion correlations"""
+    form_doc = await database.database.feedback_forms.find_one(
+        {"id": form_id, "created_by": current_user["user_id"]}
+    )
+    
+    if not form_doc:
+        raise HTTPException(status_code=404, detail="Feedback form not found")
+    
+    ratings = await stats.load_ratings(database.database, form_doc)
+    # The reductions are CPU-bound; keep them off the event loop
+    statistics = await asyncio.to_thread(
+        stats.compute_statistics, ratings, form_doc["subjects"], form_doc["evaluation_criteria"]
     )
+    return FormStatistics(form_id=form_id, **statistics)
+
+def report_job_response(job: reports.ReportJob) -> ReportJobResponse:
+    download_url = f"/api/reports/{job.id}/download" if job.status == reports.DONE else None
+    return ReportJobResponse(**job.to_dict(), download_url=download_url)
+
+def get_owned_report_job(job_id: str, current_user: dict) -> reports.ReportJob:
+    job = report_queue.get(job_id)
+    if job is None or job.owner_id != current_user["user_id"]:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
+
+@api_router.post("/forms/{form_id}/reports", response_model=ReportJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_form_report(
+    form_id: str,
+    format: str = Query("pdf", pattern="^(pdf|xlsx)$"),
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """Queue a PDF or XLSX report for a form; returns the job to poll"""
+    form_doc = await database.database.feedback_forms.find_one(
+        {"id": form_id, "created_by": current_user["user_id"]}
+    )
+    
+    if not form_doc:
+        raise HTTPException(status_code=404, detail="Feedback form not found")
+    
+    if not reports.format_available(format):
+        dependency = "openpyxl" if format == "xlsx" else "matplotlib"
+        raise HTTPException(status_code=501, detail=f"{format.upper()} reports require {dependency}")
+    
+    job = await report_queue.submit(database.database, form_doc, current_user["user_id"], format)
+    return report_job_response(job)
+
+@api_router.get("/reports/{job_id}", response_model=ReportJobResponse)
+async def get_report_job(job_id: str, current_user: dict = Depends(get_current_admin_user)):
+    return report_job_response(get_owned_report_job(job_id, current_user))
+
+@api_router.get("/reports/{job_id}/download")
+async def download_report(job_id: str, current_user: dict = Depends(get_current_admin_user)):
+    job = get_owned_report_job(job_id, current_user)
+    
+    if job.status != reports.DONE:
+        raise HTTPException(status_code=409, detail=f"Report is {job.status}")
+    
+    # A newer version's report may have replaced this one in the cache
+    if not job.path.exists():
+        raise HTTPException(status_code=410, detail="Report has expired, request a new one")
+    
+    return FileResponse(
+        job.path,
+        media_type=reports.MEDIA_TYPES[job.format],
+        filename=f"report-{job.form_id}-v{job.version}.{job.format}"
+    )
+
+# Archive Routes (Admin Only)
+@api_router.get("/archives", response_model=List[ArchivedFormResponse])
+async def get_archived_forms(current_user: dict = Depends(get_current_admin_user)):
+    """The admin's archived forms, most recently archived first"""
+    cursor = database.database.form_archives.find(
+        {"created_by": current_user["user_id"]},
+        {"_id": 0, "form_id": 1, "status": 1, "archived_at": 1, "submission_count": 1,
+         "raw_bytes": 1, "compressed_bytes": 1, "form": 1}
+    ).sort("archived_at", -1)
+    return [
+        ArchivedFormResponse(
+            **{field: header["form"].get(field) for field in ("title", "year", "section", "department",
+                                                               "created_at", "is_active")},
+            form_id=header["form_id"],
+            status=header["status"],
+            archived_at=header["archived_at"],
+            submission_count=header["submission_count"],
+            raw_bytes=header["raw_bytes"],
+            compressed_bytes=header["compressed_bytes"]
+        )
+        async for header in cursor
+    ]
+
+@api_router.post("/archives/{form_id}/restore")
+async def restore_archived_form(form_id: str, current_user: dict = Depends(get_current_admin_user)):
+    """Move an archived form and its submissions back into the live collections"""
+    # Check if archive exists and belongs to current user
+    header = await database.database.form_archives.find_one(
+        {"form_id": form_id, "created_by": current_user["user_id"]}, {"_id": 1}
+    )
+    
+    if not header:
+        raise HTTPException(status_code=404, detail="Archived form not found")
+    
+    restored = await archive.restore_form(database.database, form_id)
+    form_cache.invalidate(form_id)
+    
+    return {"message": "Feedback form restored successfully", "restored_submissions": restored}
+
+# Analytics Routes (Admin Only)
+@api_router.get("/analytics/rollup", response_model=RollupResponse)
+async def get_rollup(
+    group_by: str = Query("department", pattern="^(department|year|section)$"),
+    department: Optional[str] = None,
+    year: Optional[str] = None,
+    section: Optional[str] = None,
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """Subject and criterion averages across the admin's forms, grouped by department, year or section"""
+    groups = await rollups.compute_rollup(
+        database.database,
+        current_user["user_id"],
+        group_by,
+        {"department": department, "year": year, "section": section}
+    )
+    return RollupResponse(group_by=group_by, groups=groups)
+
+@api_router.get("/analytics/terms", response_model=TermFrequencyResponse)
+async def get_term_frequencies(
+    form_id: Optional[str] = None,
+    department: Optional[str] = None,
+    since: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$", description="First month, YYYY-MM"),
+    until: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$", description="Last month, YYYY-MM"),
+    limit: int = Query(20, ge=1, le=200),
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """Top comment terms and phrases on the admin's forms, overall and per month"""
+    titles = await search.scope_forms(database.database, current_user["user_id"], form_id, department)
+    
+    # Check if the requested form exists and belongs to current user
+    if form_id and not titles:
+        raise HTTPException(status_code=404, detail="Feedback form not found")
+    
+    frequencies = await terms.top_terms(database.database, list(titles), since, until, limit)
+    return TermFrequencyResponse(form_count=len(titles), **frequencies)
+
+@api_router.get("/admin/stats")
+async def get_admin_stats(current_user: dict = Depends(get_current_admin_user)):
+    """Runtime statistics for capacity monitoring"""
+    return {
+        "password_hasher": password_hasher.stats(),
+        "form_cache": form_cache.stats(),
+        "submission_batcher": submission_batcher.stats(),
+        "admission": admission.stats(),
+        "indexes": index_manager.stats(),
+        "reports": report_queue.stats(),
+    }
 
 @api_router.get("/")
 async def root():
     return {"message": "Teacher Feedback Collection System API"}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
 # Include the router
 app.include_router(api_router)
\ No newline at end of file
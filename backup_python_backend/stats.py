@@ -0,0 +1,141 @@
+"""Vectorized rating statistics for a form.
+
+A form's ratings are loaded into one dense ``float64`` array shaped
+``students x subjects x criteria`` (NaN where a rating is missing), laid
+out in the order of the form's ``subjects`` and ``evaluation_criteria``.
+Every statistic is then computed with whole-array NumPy reductions rather
+than Python loops over submissions.
+"""
+import warnings
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import ratings_codec
+
+RATING_VALUES = np.arange(1, 6)
+PERCENTILES = (10, 25, 50, 75, 90)
+LOAD_BATCH_SIZE = 1000
+
+
+async def load_ratings(db, form_doc: dict, batch_size: int = LOAD_BATCH_SIZE) -> np.ndarray:
+    """Read a form's submissions in batches into a students x subjects x criteria array"""
+    subject_index = {subject: i for i, subject in enumerate(form_doc["subjects"])}
+    criterion_index = {criterion: j for j, criterion in enumerate(form_doc["evaluation_criteria"])}
+    shape = (len(subject_index), len(criterion_index))
+    current_layout = ratings_codec.current_layout_id(form_doc)
+
+    chunks = []
+    chunk = np.full((batch_size,) + shape, np.nan)
+    filled = 0
+    cursor = db.student_feedbacks.find(
+        {"form_id": form_doc["id"]}, {"_id": 0, "ratings": 1, ratings_codec.LAYOUT_FIELD: 1}
+    ).batch_size(batch_size)
+    async for feedback_doc in cursor:
+        row = chunk[filled]
+        layout = feedback_doc.get(ratings_codec.LAYOUT_FIELD)
+        if layout is not None and layout == current_layout:
+            # Packed in the form's current order: copy the blob straight in
+            packed = np.frombuffer(feedback_doc["ratings"], dtype=np.uint8).reshape(shape)
+            row[packed > 0] = packed[packed > 0]
+        else:
+            feedback_doc = ratings_codec.decode_feedback(feedback_doc, form_doc)
+            for subject, criteria in feedback_doc.get("ratings", {}).items():
+                i = subject_index.get(subject)
+                if i is None:
+                    continue
+                for criterion, rating in criteria.items():
+                    j = criterion_index.get(criterion)
+                    if j is not None:
+                        row[i, j] = rating
+        filled += 1
+        if filled == batch_size:
+            chunks.append(chunk)
+            chunk = np.full((batch_size,) + shape, np.nan)
+            filled = 0
+    chunks.append(chunk[:filled])
+    return np.concatenate(chunks)
+
+
+def _value(value) -> Optional[float]:
+    return None if value is None or np.isnan(value) else float(value)
+
+
+def _distributions(ratings: np.ndarray) -> dict:
+    """Statistics along axis 0 of an array of ratings; returns arrays shaped like the remaining axes"""
+    if ratings.shape[0] == 0:
+        # No responses yet: NumPy's nan-reductions collapse empty axes, so build the result directly
+        empty = np.full(ratings.shape[1:], np.nan)
+        return {
+            "count": np.zeros(ratings.shape[1:], dtype=int),
+            "mean": empty,
+            "std": empty,
+            "median": empty,
+            "percentiles": np.full((len(PERCENTILES),) + ratings.shape[1:], np.nan),
+            "histogram": np.zeros(ratings.shape[1:] + (len(RATING_VALUES),), dtype=int),
+        }
+
+    with warnings.catch_warnings():
+        # All-NaN slices (nobody rated a pair yet) are expected and reported as None
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return {
+            "count": np.sum(~np.isnan(ratings), axis=0),
+            "mean": np.nanmean(ratings, axis=0),
+            "std": np.nanstd(ratings, axis=0),
+            "median": np.nanmedian(ratings, axis=0),
+            "percentiles": np.nanpercentile(ratings, PERCENTILES, axis=0),
+            "histogram": np.sum(ratings[..., None] == RATING_VALUES, axis=0),
+        }
+
+
+def _distribution_at(distributions: dict, index: tuple) -> dict:
+    return {
+        "count": int(distributions["count"][index]),
+        "mean": _value(distributions["mean"][index]),
+        "std": _value(distributions["std"][index]),
+        "median": _value(distributions["median"][index]),
+        "percentiles": {
+            f"p{pct}": _value(distributions["percentiles"][(k,) + index])
+            for k, pct in enumerate(PERCENTILES)
+        },
+        "histogram": {
+            str(rating): int(distributions["histogram"][index + (k,)])
+            for k, rating in enumerate(RATING_VALUES)
+        },
+    }
+
+
+def _correlations(ratings: np.ndarray, criteria: List[str]) -> Dict[str, Dict[str, Optional[float]]]:
+    """Pearson correlation between criteria over each student's mean across subjects"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        per_student = np.nanmean(ratings, axis=1)
+        matrix = np.ma.corrcoef(np.ma.masked_invalid(per_student), rowvar=False)
+    matrix = np.ma.filled(np.ma.atleast_2d(matrix).astype(float), np.nan)
+    return {
+        a: {b: _value(matrix[i, j]) for j, b in enumerate(criteria)}
+        for i, a in enumerate(criteria)
+    }
+
+
+def compute_statistics(ratings: np.ndarray, subjects: List[str], criteria: List[str]) -> dict:
+    """Per subject and per subject x criterion distributions plus criterion correlations"""
+    students = ratings.shape[0]
+    pair_stats = _distributions(ratings)
+    # students x subjects x criteria -> (students * criteria) x subjects
+    subject_stats = _distributions(ratings.transpose(0, 2, 1).reshape(students * len(criteria), len(subjects)))
+
+    return {
+        "total_responses": students,
+        "subjects": {
+            subject: {
+                "overall": _distribution_at(subject_stats, (i,)),
+                "criteria": {
+                    criterion: _distribution_at(pair_stats, (i, j))
+                    for j, criterion in enumerate(criteria)
+                },
+            }
+            for i, subject in enumerate(subjects)
+        },
+        "criterion_correlations": _correlations(ratings, criteria) if students > 1 and criteria else {},
+    }
@@ -0,0 +1,261 @@
+"""Incremental term and phrase frequencies over feedback comments.
+
+Each form has one document per month in ``term_frequencies`` counting, for
+the comments submitted that month, how many comments mention each term and
+each two-word phrase. Submissions fold their comment in with a single
+``$inc`` upsert, so top-term queries read a handful of small precomputed
+documents (one per form and month in scope) and never tokenize comments.
+
+Document shape::
+
+    {
+        "form_id": str,
+        "period": "YYYY-MM",       # month the comments were submitted in
+        "comment_count": int,      # comments with at least one term
+        "terms": {<term>: int},
+        "phrases": {<"word word">: int},
+        "unpruned": int            # comments folded in since the last prune
+    }
+
+Terms are lower-cased words of at least two letters that are not
+stopwords; a phrase is two such words next to each other within one
+clause of the comment.
+A term repeated within one comment is counted once.
+
+Free text has a long tail of words used once, so the maps are capped:
+every ``TERM_TABLE_PRUNE_INTERVAL`` comments a table keeps its
+``TERM_TABLE_MAX_TERMS`` most frequent terms and as many phrases and drops
+the rest. That keeps each document far below MongoDB's 16MB limit and
+``top_terms`` proportional to the cap rather than the vocabulary. Counts of
+the frequent terms that make the top lists are unaffected; a rare term that
+returns after being pruned starts counting again from zero.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+TERM_REBUILD_BATCH_SIZE = 1000
+# Distinct terms, and separately phrases, kept per form and month
+TERM_TABLE_MAX_TERMS = int(os.getenv("TERM_TABLE_MAX_TERMS", "2000"))
+# Comments folded into a table between checks of its size
+TERM_TABLE_PRUNE_INTERVAL = int(os.getenv("TERM_TABLE_PRUNE_INTERVAL", "200"))
+
+_WORD = re.compile(r"[^\W\d_]+")
+# Phrases never span punctuation
+_CLAUSE_BREAK = re.compile(r"[.,;:!?()\[\]\n]+")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are aren as at be because been before being
+below between both but by can cannot could couldn did didn do does doesn doing don down during each
+even ever every few for from further get gets got had hadn has hasn have haven having he her here hers
+herself him himself his how however i if in into is isn it its itself just let ll me more most much
+must mustn my myself no nor not now of off on once one only or other ought our ours ourselves out over
+own quite rather re really same shan she should shouldn so some such than that the their theirs them
+themselves then there these they this those through to too under until up upon us ve very was wasn we
+were weren what when where which while who whom why will with won would wouldn yet you your yours
+yourself yourselves
+""".split())
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _WORD.findall(text.lower()) if text else []
+
+
+def extract(text: Optional[str]) -> Tuple[set, set]:
+    """Distinct terms and two-word phrases of one comment"""
+    terms, phrases = set(), set()
+    for clause in _CLAUSE_BREAK.split(text or ""):
+        words = tokenize(clause)
+        kept = [len(word) >= 2 and word not in STOPWORDS for word in words]
+        terms.update(word for word, keep in zip(words, kept) if keep)
+        phrases.update(
+            f"{words[i]} {words[i + 1]}"
+            for i in range(len(words) - 1)
+            if kept[i] and kept[i + 1]
+        )
+    return terms, phrases
+
+
+def period_of(submitted_at: datetime) -> str:
+    return submitted_at.strftime("%Y-%m")
+
+
+def build_increments(feedbacks: Iterable[dict]) -> Dict[Tuple[str, str], Dict[str, int]]:
+    """One ``$inc`` document per (form, month) covering the given feedbacks"""
+    increments: Dict[Tuple[str, str], Dict[str, int]] = {}
+    for feedback in feedbacks:
+        terms, phrases = extract(feedback.get("comments"))
+        if not terms:
+            continue
+        key = (feedback["form_id"], period_of(feedback.get("submitted_at") or datetime.utcnow()))
+        inc = increments.setdefault(key, {"comment_count": 0})
+        inc["comment_count"] += 1
+        for term in terms:
+            inc[f"terms.{term}"] = inc.get(f"terms.{term}", 0) + 1
+        for phrase in phrases:
+            inc[f"phrases.{phrase}"] = inc.get(f"phrases.{phrase}", 0) + 1
+    return increments
+
+
+def _pruned(counts: Dict[str, int], limit: int) -> List[str]:
+    """Keys beyond the ``limit`` most frequent, rarest last"""
+    if len(counts) <= limit:
+        return []
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [key for key, _ in ranked[limit:]]
+
+
+async def prune_table(db, form_id: str, period: str):
+    """Drop one monthly table's rarest terms and phrases beyond ``TERM_TABLE_MAX_TERMS``"""
+    table = await db.term_frequencies.find_one(
+        {"form_id": form_id, "period": period}, {"terms": 1, "phrases": 1, "unpruned": 1}
+    )
+    if table is None:
+        return
+    update = {"$inc": {"unpruned": -table.get("unpruned", 0)}}
+    # $unset of single keys leaves increments that land meanwhile on the other keys intact
+    unset = {f"terms.{term}": "" for term in _pruned(table.get("terms", {}), TERM_TABLE_MAX_TERMS)}
+    unset.update(
+        (f"phrases.{phrase}", "") for phrase in _pruned(table.get("phrases", {}), TERM_TABLE_MAX_TERMS)
+    )
+    if unset:
+        update["$unset"] = unset
+    await db.term_frequencies.update_one({"form_id": form_id, "period": period}, update)
+
+
+async def record_comments(db, feedbacks: List[dict]):
+    """Fold newly inserted feedbacks' comments into their monthly term tables"""
+    increments = build_increments(feedbacks)
+    tables = await asyncio.gather(*(
+        db.term_frequencies.find_one_and_update(
+            {"form_id": form_id, "period": period},
+            {"$inc": dict(inc, unpruned=inc["comment_count"])},
+            projection={"_id": 0, "unpruned": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        for (form_id, period), inc in increments.items()
+    ))
+    for (form_id, period), table in zip(increments, tables):
+        if table and table.get("unpruned", 0) >= TERM_TABLE_PRUNE_INTERVAL:
+            await prune_table(db, form_id, period)
+
+
+def _top(counts: Counter, limit: int) -> List[dict]:
+    # Ties are broken alphabetically so results are stable between requests
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [{"term": term, "count": count} for term, count in ranked[:limit]]
+
+
+async def top_terms(db, form_ids: List[str], since: Optional[str] = None, until: Optional[str] = None,
+                    limit: int = 20) -> dict:
+    """Top terms and phrases across the given forms, overall and per month"""
+    query = {"form_id": {"$in": form_ids}}
+    if since or until:
+        query["period"] = {}
+        if since:
+            query["period"]["$gte"] = since
+        if until:
+            query["period"]["$lte"] = until
+
+    totals = {"comment_count": 0, "terms": Counter(), "phrases": Counter()}
+    periods: Dict[str, dict] = {}
+    if form_ids:
+        async for table in db.term_frequencies.find(query, {"_id": 0}):
+            period = periods.setdefault(
+                table["period"], {"comment_count": 0, "terms": Counter(), "phrases": Counter()}
+            )
+            for bucket in (totals, period):
+                bucket["comment_count"] += table.get("comment_count", 0)
+                bucket["terms"].update(table.get("terms", {}))
+                bucket["phrases"].update(table.get("phrases", {}))
+
+    return {
+        "comment_count": totals["comment_count"],
+        "terms": _top(totals["terms"], limit),
+        "phrases": _top(totals["phrases"], limit),
+        "periods": [
+            {
+                "period": name,
+                "comment_count": period["comment_count"],
+                "terms": _top(period["terms"], limit),
+                "phrases": _top(period["phrases"], limit),
+            }
+            for name, period in sorted(periods.items())
+        ],
+    }
+
+
+async def rebuild_form_terms(db, form_id: str) -> int:
+    """Recompute one form's term tables from its raw comments"""
+    increments: Dict[Tuple[str, str], Dict[str, int]] = {}
+    cursor = db.student_feedbacks.find(
+        {"form_id": form_id}, {"_id": 0, "form_id": 1, "comments": 1, "submitted_at": 1}
+    ).batch_size(TERM_REBUILD_BATCH_SIZE)
+    comment_count = 0
+    async for feedback_doc in cursor:
+        for key, inc in build_increments([feedback_doc]).items():
+            merged = increments.setdefault(key, {})
+            for path, value in inc.items():
+                merged[path] = merged.get(path, 0) + value
+            comment_count += 1
+
+    tables = []
+    for (_, period), inc in increments.items():
+        table = {"form_id": form_id, "period": period, "comment_count": inc.pop("comment_count"),
+                 "terms": {}, "phrases": {}, "unpruned": 0}
+        for path, value in inc.items():
+            field, term = path.split(".", 1)
+            table[field][term] = value
+        for field in ("terms", "phrases"):
+            for term in _pruned(table[field], TERM_TABLE_MAX_TERMS):
+                del table[field][term]
+        tables.append(table)
+
+    await db.term_frequencies.delete_many({"form_id": form_id})
+    if tables:
+        await db.term_frequencies.insert_many(tables)
+    return comment_count
+
+
+async def _main(form_ids: Optional[List[str]]):
+    from database import database
+
+    await database.connect_to_mongo()
+    try:
+        db = database.database
+        if form_ids is None:
+            form_ids = [doc["id"] async for doc in db.feedback_forms.find({}, {"id": 1})]
+        for form_id in form_ids:
+            count = await rebuild_form_terms(db, form_id)
+            logger.info(f"Rebuilt term tables for form {form_id}: {count} comments")
+        logger.info(f"Rebuilt term tables for {len(form_ids)} forms")
+    finally:
+        await database.close_mongo_connection()
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    load_dotenv(Path(__file__).parent / '.env')
+
+    parser = argparse.ArgumentParser(description="Rebuild comment term-frequency tables")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--form-id", action="append", dest="form_ids",
+                        help="Form to rebuild (repeatable); defaults to all forms")
+    args = parser.parse_args()
+    asyncio.run(_main(args.form_ids))
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Index Coverage Test Suite
+Drives every API route of the Teacher Feedback Collection System in process,
+records the queries the routes and background jobs actually issue, and runs
+explain() on each distinct query shape. Fails if any of them needs a
+collection scan, or if a sorted query has to sort its matches in memory
+instead of reading them in index order, or if an index scan leaves an
+equality condition to be checked on each fetched document.
+
+Connects with the backend's own settings (MONGO_URL and DB_NAME), builds
+the desired indexes, creates a throwaway admin with two forms and a few
+submissions through the API, and removes everything again afterwards.
+With STORAGE_BACKEND=memory the plans come from the in-memory engine's
+simulated explain(): results are printed and marked as simulated, but never
+fail the run.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent / "backup_python_backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env")
+
+import httpx  # noqa: E402
+
+import aggregates  # noqa: E402
+import archive  # noqa: E402
+import server  # noqa: E402
+import terms  # noqa: E402
+from cache import form_cache  # noqa: E402
+from database import database  # noqa: E402
+from indexes import index_manager  # noqa: E402
+
+# Collection methods whose first argument is a query filter
+FILTER_METHODS = {
+    "find_one", "count_documents", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "find_one_and_update",
+}
+
+
+def find_stages(plan: Any, stage: str) -> List[dict]:
+    """Collect every node of an explain plan tree with the given stage name"""
+    found = []
+    if isinstance(plan, dict):
+        if plan.get("stage") == stage:
+            found.append(plan)
+        for value in plan.values():
+            found.extend(find_stages(value, stage))
+    elif isinstance(plan, list):
+        for value in plan:
+            found.extend(find_stages(value, stage))
+    return found
+
+
+def equality_fields(condition: Any) -> List[str]:
+    """Fields compared by equality in an explain plan's FETCH ``filter``"""
+    if not isinstance(condition, dict):
+        return []
+    fields = []
+    for key, value in condition.items():
+        if key == "$and":
+            for part in value:
+                fields.extend(equality_fields(part))
+        elif not key.startswith("$") and (not isinstance(value, dict) or set(value) == {"$eq"}):
+            fields.append(key)
+    return fields
+
+
+def normalize_sort(key_or_list: Any, direction: Any = None) -> Optional[list]:
+    if key_or_list is None:
+        return None
+    if isinstance(key_or_list, str):
+        return [(key_or_list, 1 if direction is None else direction)]
+    return [tuple(item) for item in key_or_list]
+
+
+def shape(value: Any) -> Any:
+    """A query with its values replaced by their types, so repeats of one query compare equal"""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        # $in lists of any length look alike; $or branches of different shapes do not
+        shapes = []
+        for item in value:
+            if shape(item) not in shapes:
+                shapes.append(shape(item))
+        return shapes
+    return type(value).__name__
+
+
+class QueryRecorder:
+    """Every query issued, labelled with the route or job that issued it"""
+
+    def __init__(self):
+        self.step = ""
+        self.calls: List[dict] = []
+
+    def add(self, collection: str, query: Optional[dict], sort: Optional[list]) -> dict:
+        call = {"step": self.step, "collection": collection, "query": query or {}, "sort": sort}
+        self.calls.append(call)
+        return call
+
+    def distinct(self) -> List[dict]:
+        """The first call of every (collection, filter shape, sort) combination"""
+        first_calls = {}
+        for call in self.calls:
+            key = json.dumps([call["collection"], shape(call["query"]), call["sort"]])
+            first_calls.setdefault(key, call)
+        return list(first_calls.values())
+
+
+class RecordingCursor:
+    def __init__(self, cursor, call: dict):
+        self._cursor = cursor
+        self._call = call
+
+    def sort(self, key_or_list, direction=None):
+        self._call["sort"] = normalize_sort(key_or_list, direction)
+        self._cursor = self._cursor.sort(key_or_list) if direction is None else self._cursor.sort(
+            key_or_list, direction
+        )
+        return self
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if name in ("limit", "skip", "batch_size"):
+            def chained(*args, **kwargs):
+                self._cursor = attr(*args, **kwargs)
+                return self
+            return chained
+        return attr
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+
+class RecordingCollection:
+    def __init__(self, collection, recorder: QueryRecorder):
+        self._collection = collection
+        self._recorder = recorder
+
+    def find(self, filter=None, *args, **kwargs):
+        call = self._recorder.add(self._collection.name, filter, normalize_sort(kwargs.get("sort")))
+        return RecordingCursor(self._collection.find(filter, *args, **kwargs), call)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        if pipeline and "$match" in pipeline[0]:
+            self._recorder.add(self._collection.name, pipeline[0]["$match"], None)
+        return self._collection.aggregate(pipeline, *args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in FILTER_METHODS:
+            def recorded(filter, *args, **kwargs):
+                self._recorder.add(self._collection.name, filter, normalize_sort(kwargs.get("sort")))
+                return attr(filter, *args, **kwargs)
+            return recorded
+        return attr
+
+
+class RecordingDatabase:
+    def __init__(self, db, recorder: QueryRecorder):
+        self._db = db
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return RecordingCollection(getattr(self._db, name), self._recorder)
+
+    def __getitem__(self, name):
+        return self.__getattr__(name)
+
+
+class IndexCoverageTester:
+    def __init__(self):
+        unique_id = str(uuid.uuid4())[:8]
+        self.username = f"coverage_{unique_id}"
+        self.email = f"coverage.{unique_id}@university.edu"
+        self.simulated = os.environ.get("STORAGE_BACKEND", "mongo") == "memory"
+        self.recorder = QueryRecorder()
+        self.user_id: Optional[str] = None
+        self.form_ids: List[str] = []
+
+    async def call(self, client: httpx.AsyncClient, step: str, method: str, url: str,
+                   expected: int = 200, **kwargs) -> httpx.Response:
+        self.recorder.step = step
+        response = await client.request(method, url, headers=self.headers, **kwargs)
+        assert response.status_code == expected, f"{step}: {response.status_code} {response.text}"
+        return response
+
+    async def exercise_routes(self, client: httpx.AsyncClient, db):
+        """Issue every route's queries, cold form cache and follow-up pages included"""
+        self.headers = {}
+        password = "SecurePassword123!"
+        response = await self.call(client, "POST /api/auth/register", "POST", "/api/auth/register", json={
+            "username": self.username, "email": self.email, "password": password, "role": "admin"
+        })
+        await self.call(client, "POST /api/auth/login", "POST", "/api/auth/login",
+                        json={"username": self.username, "password": password})
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        self.user_id = (await self.call(client, "GET /api/auth/me", "GET", "/api/auth/me")).json()["id"]
+
+        for department in ("Computer Science", "Mathematics"):
+            form = (await self.call(client, "POST /api/forms", "POST", "/api/forms", json={
+                "title": f"Index coverage {department}", "year": "2024", "section": "A",
+                "department": department, "subjects": ["Data Structures", "Algorithms"],
+                "evaluation_criteria": ["Teaching Quality", "Communication"]
+            })).json()
+            self.form_ids.append(form["id"])
+        form_id, other_form_id = self.form_ids
+
+        form_cache.clear()
+        for i in range(3):
+            await self.call(client, "POST /api/feedback", "POST", "/api/feedback", json={
+                "form_id": form_id, "student_id": f"CS{i:04d}",
+                "ratings": {"Data Structures": {"Teaching Quality": 5, "Communication": 4},
+                            "Algorithms": {"Teaching Quality": 4, "Communication": 3}},
+                "comments": "Office hours were really helpful"
+            })
+        form_cache.clear()
+        await self.call(client, "POST /api/feedback/batch", "POST", "/api/feedback/batch", json=[
+            {"form_id": other_form_id, "student_id": f"MA{i:04d}",
+             "ratings": {"Data Structures": {"Teaching Quality": 3, "Communication": 4},
+                         "Algorithms": {"Teaching Quality": 4, "Communication": 5}},
+             "comments": "Lectures moved too fast"}
+            for i in range(3)
+        ])
+
+        form_filters = ({}, {"department": "Computer Science"}, {"year": "2024"}, {"section": "A"})
+        for sort in ("created_at", "title", "response_count"):
+            for filters in form_filters:
+                params = dict(filters, sort=sort, limit=1)
+                step = f"GET /api/forms?sort={sort}" + "".join(f"&{field}=" for field in filters)
+                response = await self.call(client, step, "GET", "/api/forms", params=params)
+                cursor = response.headers.get("X-Next-Cursor")
+                if cursor:
+                    await self.call(client, f"{step}&cursor=", "GET", "/api/forms",
+                                    params=dict(params, cursor=cursor))
+        await self.call(client, "GET /api/forms", "GET", "/api/forms")
+        form_cache.clear()
+        await self.call(client, "GET /api/forms/{id}", "GET", f"/api/forms/{form_id}")
+        await self.call(client, "PUT /api/forms/{id}", "PUT", f"/api/forms/{form_id}",
+                        json={"section": "B"})
+
+        feedback_url = f"/api/forms/{form_id}/feedback"
+        response = await self.call(client, "GET /api/forms/{id}/feedback", "GET", feedback_url,
+                                   params={"limit": 1})
+        await self.call(client, "GET /api/forms/{id}/feedback?cursor=", "GET", feedback_url,
+                        params={"limit": 1, "cursor": response.json()["next_cursor"]})
+        await self.call(client, "GET /api/forms/{id}/feedback?view=summary", "GET", feedback_url,
+                        params={"view": "summary"})
+        await self.call(client, "GET /api/forms/{id}/feedback/stream", "GET", f"{feedback_url}/stream")
+        await self.call(client, "GET /api/forms/{id}/export", "GET", f"/api/forms/{form_id}/export")
+        await self.call(client, "GET /api/forms/{id}/stats", "GET", f"/api/forms/{form_id}/stats")
+
+        await self.call(client, "GET /api/feedback/search", "GET", "/api/feedback/search",
+                        params={"q": "office hours"})
+        await self.call(client, "GET /api/feedback/search?form_id=", "GET", "/api/feedback/search",
+                        params={"q": "office hours", "form_id": form_id})
+        await self.call(client, "GET /api/feedback/search?department=", "GET", "/api/feedback/search",
+                        params={"q": "office hours", "department": "Computer Science"})
+        await self.call(client, "GET /api/analytics/terms", "GET", "/api/analytics/terms",
+                        params={"since": "2024-01", "until": "2030-12"})
+        for group_by in ("department", "year", "section"):
+            await self.call(client, f"GET /api/analytics/rollup?group_by={group_by}", "GET",
+                            "/api/analytics/rollup", params={"group_by": group_by, "department": "Computer Science"})
+
+        await self.call(client, "DELETE /api/forms/{id}", "DELETE", f"/api/forms/{other_form_id}")
+
+        # Background jobs and maintenance commands
+        self.recorder.step = "Archive job"
+        await archive.archive_all(db)
+        await self.call(client, "GET /api/archives", "GET", "/api/archives")
+        await self.call(client, "POST /api/archives/{id}/restore", "POST", f"/api/archives/{other_form_id}/restore")
+        self.recorder.step = "terms.py rebuild"
+        await terms.rebuild_form_terms(db, form_id)
+        self.recorder.step = "aggregates.py rebuild"
+        await aggregates.rebuild_form_aggregate(db, form_id)
+
+    async def cleanup(self):
+        db = database.database
+        if self.user_id:
+            await db.users.delete_many({"id": self.user_id})
+        for form_id in self.form_ids:
+            await db.feedback_forms.delete_many({"id": form_id})
+            await db.student_feedbacks.delete_many({"form_id": form_id})
+            await db.form_aggregates.delete_many({"form_id": form_id})
+            await db.term_frequencies.delete_many({"form_id": form_id})
+            await db.form_archives.delete_many({"form_id": form_id})
+            await db.feedback_archive_chunks.delete_many({"form_id": form_id})
+
+    async def check(self, collection: str, query: dict, sort: Optional[list]) -> Tuple[bool, str]:
+        cursor = database.database[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        if find_stages(plan, "COLLSCAN"):
+            return False, "COLLSCAN"
+        # Relevance sorts always run in memory; every other sort must come from the index
+        if sort and not any(isinstance(direction, dict) for _, direction in sort) and find_stages(plan, "SORT"):
+            return False, "in-memory SORT"
+        # An equality filter left to FETCH reads every document the index bounds let through,
+        # unless a unique index already narrowed the scan to one document per key
+        unindexed = [
+            field for stage in find_stages(plan, "FETCH")
+            if not all(scan.get("isUnique") for scan in find_stages(stage, "IXSCAN"))
+            for field in equality_fields(stage.get("filter"))
+        ]
+        if unindexed:
+            return False, f"filtered after FETCH: {', '.join(sorted(set(unindexed)))}"
+        index_names = sorted({stage.get("indexName") for stage in find_stages(plan, "IXSCAN")})
+        return True, ", ".join(name for name in index_names if name) or "no index scan reported"
+
+    async def run_all_tests(self) -> Dict[str, bool]:
+        print("🔍 Starting Index Coverage Tests")
+        print("=" * 60)
+        if self.simulated:
+            print("ℹ️  STORAGE_BACKEND=memory: plans are simulated, results are informational only")
+
+        await database.connect_to_mongo(build_indexes=False)
+        real_db = database.database
+        results = {}
+        try:
+            await index_manager.ensure(real_db, wait=True)
+            recording_db = RecordingDatabase(real_db, self.recorder)
+            database.database = recording_db
+            transport = httpx.ASGITransport(app=server.app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://coverage") as client:
+                    await self.exercise_routes(client, recording_db)
+            finally:
+                database.database = real_db
+
+            for call in self.recorder.distinct():
+                step, collection, query, sort = call["step"], call["collection"], call["query"], call["sort"]
+                test_name = f"{step} [{collection}] {json.dumps(shape(query))}"
+                if sort:
+                    test_name += f" sort {json.dumps(sort)}"
+                try:
+                    success, details = await self.check(collection, query, sort)
+                except Exception as e:
+                    success, details = False, f"Unexpected error: {e}"
+                status = "✅ PASS" if success else "❌ FAIL"
+                if self.simulated:
+                    status += " (simulated)"
+                print(f"{status} {test_name}")
+                print(f"   Details: {details}")
+                results[test_name] = success
+        finally:
+            await self.cleanup()
+            await database.close_mongo_connection()
+
+        print()
+        print("=" * 60)
+        print("📊 TEST SUMMARY")
+        print("=" * 60)
+        passed = sum(1 for result in results.values() if result)
+        total = len(results)
+        print(f"Overall: {passed}/{total} queries use an index ({passed/total*100:.1f}%)")
+        if passed == total:
+            print("🎉 No route query needs a collection scan, in-memory sort or FETCH filter.")
+        else:
+            print(f"⚠️  {total - passed} query(ies) need a COLLSCAN, in-memory SORT or FETCH filter. "
+                  f"Add indexes to DESIRED_INDEXES.")
+        return results
+
+
+def main():
+    tester = IndexCoverageTester()
+    results = asyncio.run(tester.run_all_tests())
+    # The in-memory engine only simulates query plans; never fail on them
+    sys.exit(0 if tester.simulated or all(results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
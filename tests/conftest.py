@@ -0,0 +1,35 @@
+"""Storage backends shared by the tests.
+
+Tests taking ``make_db`` run against the in-memory engine and, when
+``TEST_MONGO_URL`` points at a MongoDB server, against MongoDB as well, so
+the memory engine is held to the same behaviour as the real database.
+"""
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backup_python_backend"))
+
+from memory_store import MemoryClient  # noqa: E402
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def make_db(request):
+    """Factory for an empty database; call it inside the test's event loop"""
+    if request.param == "memory":
+        yield lambda: MemoryClient()["feedback_test"]
+        return
+    if not TEST_MONGO_URL:
+        pytest.skip("TEST_MONGO_URL is not set")
+
+    import pymongo
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    name = f"feedback_test_{uuid.uuid4().hex[:12]}"
+    yield lambda: AsyncIOMotorClient(TEST_MONGO_URL)[name]
+    pymongo.MongoClient(TEST_MONGO_URL).drop_database(name)
@@ -0,0 +1,116 @@
+"""Running aggregates for forms created before form_aggregates existed."""
+import asyncio
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backup_python_backend"))
+
+import aggregates  # noqa: E402
+
+FORM_ID = "legacy-form"
+
+
+def make_feedback(student_id: str, ratings: dict) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "form_id": FORM_ID,
+        "student_id": student_id,
+        "ratings": ratings,
+        "averages": aggregates.compute_averages(ratings),
+        "submitted_at": datetime.utcnow(),
+    }
+
+
+async def seed_legacy_form(db):
+    """A form with three responses and no aggregate document"""
+    await db.feedback_forms.insert_one({
+        "id": FORM_ID, "title": "Legacy", "created_by": "admin-1", "is_active": True,
+        "department": "Computer Science", "year": "2023", "section": "B",
+        "subjects": ["Algorithms"], "evaluation_criteria": ["Clarity", "Pace"],
+    })
+    await db.student_feedbacks.insert_many([
+        make_feedback("CS0001", {"Algorithms": {"Clarity": 5, "Pace": 3}}),
+        make_feedback("CS0002", {"Algorithms": {"Clarity": 4, "Pace": 4}}),
+        make_feedback("CS0003", {"Algorithms": {"Clarity": 3, "Pace": 5}}),
+    ])
+
+
+def test_startup_counts_legacy_responses(make_db):
+    async def scenario():
+        db = make_db()
+        await seed_legacy_form(db)
+        assert await aggregates.create_missing_aggregates(db) == 1
+        assert await aggregates.create_missing_aggregates(db) == 0
+
+        feedback = make_feedback("CS0004", {"Algorithms": {"Clarity": 1, "Pace": 1}})
+        await db.student_feedbacks.insert_one(feedback)
+        await aggregates.record_inserted(db, [feedback])
+
+        aggregate = await aggregates.get_form_aggregate(db, FORM_ID)
+        total, subject_averages, criterion_averages = aggregates.summarize(aggregate)
+        assert total == 4
+        assert subject_averages["Algorithms"] == 3.25
+        assert criterion_averages["Algorithms"] == {"Clarity": 3.25, "Pace": 3.25}
+        assert aggregate["department"] == "Computer Science"
+        assert aggregate["created_by"] == "admin-1"
+        assert aggregate["is_active"] is True
+
+        counts = await aggregates.get_response_counts(db, [FORM_ID])
+        assert counts == {FORM_ID: 4}
+
+    asyncio.run(scenario())
+
+
+def test_submissions_never_rebuild_a_missing_aggregate(make_db):
+    async def scenario():
+        db = make_db()
+        await seed_legacy_form(db)
+
+        feedback = make_feedback("CS0004", {"Algorithms": {"Clarity": 1, "Pace": 1}})
+        await db.student_feedbacks.insert_one(feedback)
+        await aggregates.record_inserted(db, [feedback])
+        assert await db.form_aggregates.find_one({"form_id": FORM_ID}) is None
+
+        # Reads still see every submission
+        aggregate = await aggregates.get_form_aggregate(db, FORM_ID)
+        assert aggregate["response_count"] == 4
+        assert await db.form_aggregates.find_one({"form_id": FORM_ID}) is None
+
+    asyncio.run(scenario())
+
+
+def test_rebuild_moves_the_version_forward(make_db):
+    async def scenario():
+        db = make_db()
+        await seed_legacy_form(db)
+        await db.form_aggregates.insert_one(dict(aggregates.empty_aggregate(FORM_ID), version=7))
+
+        aggregate = await aggregates.rebuild_form_aggregate(db, FORM_ID)
+        assert aggregate["version"] == 8
+        stored = await db.form_aggregates.find_one({"form_id": FORM_ID})
+        assert (stored["version"], stored["response_count"]) == (8, 3)
+
+    asyncio.run(scenario())
+
+
+def test_editing_legacy_form_changes_its_version(make_db):
+    async def scenario():
+        db = make_db()
+        await seed_legacy_form(db)
+        assert await aggregates.get_form_versions(db, "admin-1") == {}
+
+        await aggregates.create_missing_aggregates(db)
+        assert await aggregates.get_form_versions(db, "admin-1") == {FORM_ID: 1}
+
+        await db.feedback_forms.update_one({"id": FORM_ID}, {"$set": {"section": "C"}})
+        form_doc = await db.feedback_forms.find_one({"id": FORM_ID})
+        await aggregates.sync_form_dimensions(db, form_doc)
+
+        assert await aggregates.get_form_versions(db, "admin-1") == {FORM_ID: 2}
+        aggregate = await db.form_aggregates.find_one({"form_id": FORM_ID})
+        assert aggregate["section"] == "C"
+        assert aggregate["response_count"] == 3
+
+    asyncio.run(scenario())
@@ -0,0 +1,37 @@
+"""Streaming exports of a form's submissions."""
+import asyncio
+import io
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backup_python_backend"))
+
+import export  # noqa: E402
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+FORM = {
+    "id": "export-form", "title": "Export", "subjects": ["Algorithms"],
+    "evaluation_criteria": ["Clarity", "Pace"],
+}
+
+
+def test_parquet_keeps_ratings_above_127(make_db):
+    async def scenario():
+        db = make_db()
+        await db.student_feedbacks.insert_many([
+            {
+                "id": f"fb-{i}", "form_id": FORM["id"], "student_id": f"CS{i:04d}",
+                "ratings": {"Algorithms": {"Clarity": clarity, "Pace": 5}},
+                "submitted_at": datetime(2024, 5, 1, 12, i),
+            }
+            for i, clarity in enumerate([1, 128, 255, 300])
+        ])
+        return b"".join([chunk async for chunk in export.stream_parquet(db, FORM)])
+
+    table = pq.read_table(io.BytesIO(asyncio.run(scenario())))
+    assert table.column("Algorithms - Clarity").to_pylist() == [1, 128, 255, 300]
+    assert table.column("Algorithms - Pace").to_pylist() == [5, 5, 5, 5]
@@ -0,0 +1,36 @@
+"""Latency percentiles reported by backend_test.py --load."""
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend_test import LoadTester, percentile  # noqa: E402
+
+
+def test_percentile_is_nearest_rank():
+    assert percentile(list(range(1, 11)), 50) == 5
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7.0], 99) == 7.0
+    assert percentile([], 95) == 0.0
+
+
+def test_rate_limited_requests_are_not_errors():
+    statuses = iter([200, 429, 500])
+
+    async def scenario():
+        tester = LoadTester("http://backend.test")
+        transport = httpx.MockTransport(lambda request: httpx.Response(next(statuses), json={}))
+        async with httpx.AsyncClient(base_url=tester.base_url, transport=transport) as client:
+            for _ in range(3):
+                await tester.request(client, "student-submit", "POST", "/api/feedback", {})
+        return tester.report(elapsed=1.0)
+
+    stats = asyncio.run(scenario())["endpoints"]["student-submit"]
+    assert (stats["requests"], stats["errors"], stats["rate_limited"]) == (3, 1, 1)
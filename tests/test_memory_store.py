@@ -0,0 +1,229 @@
+"""The query, update and aggregation shapes the application sends to storage.
+
+Every test here runs against the in-memory engine and, with
+``TEST_MONGO_URL`` set, against MongoDB, so the two stay interchangeable.
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+import aggregates
+import pagination
+import rollups
+import search
+from indexes import IndexSpec
+from memory_store import MemoryClient
+
+FORMS = [
+    {"id": "form-a", "title": "Algebra", "created_by": "admin-1", "is_active": True,
+     "created_at": datetime(2024, 1, 1), "tags": ["core", "math"], "meta": {"department": "CS"}},
+    {"id": "form-b", "title": "Biology", "created_by": "admin-1", "is_active": False,
+     "created_at": datetime(2024, 2, 1), "meta": {"department": "Bio"}},
+    {"id": "form-c", "title": "Calculus", "created_by": "admin-1", "is_active": True,
+     "created_at": datetime(2024, 3, 1), "tags": ["math"], "meta": {"department": "CS"}},
+    {"id": "form-d", "title": "Databases", "created_by": "admin-2", "is_active": True,
+     "created_at": datetime(2024, 3, 1), "meta": {"department": "CS"}},
+]
+
+
+async def ids(cursor) -> list:
+    return [document["id"] for document in await cursor.to_list(length=None)]
+
+
+def test_queries(make_db):
+    async def scenario():
+        db = make_db()
+        await db.feedback_forms.insert_many([dict(form) for form in FORMS])
+        forms = db.feedback_forms
+
+        assert sorted(await ids(forms.find({"meta.department": "CS"}))) == ["form-a", "form-c", "form-d"]
+        assert await ids(forms.find({"tags": "core"})) == ["form-a"]
+        assert sorted(await ids(forms.find({"id": {"$in": ["form-a", "form-b", "form-z"]}}))) == ["form-a", "form-b"]
+        assert sorted(await ids(forms.find({"created_at": {"$gte": datetime(2024, 2, 1), "$lt": datetime(2024, 3, 1)}}))) == ["form-b"]
+        assert await ids(forms.find({"title": {"$lte": "B"}})) == ["form-a"]
+        assert sorted(await ids(forms.find({"tags": {"$exists": False}}))) == ["form-b", "form-d"]
+        assert sorted(await ids(forms.find({"$or": [{"id": "form-a"}, {"is_active": False}]}))) == ["form-a", "form-b"]
+
+        newest = forms.find({}, {"_id": 0, "id": 1, "meta.department": 1})
+        newest = newest.sort(pagination.form_sort("created_at", -1)).skip(1).limit(2)
+        assert await newest.to_list(length=None) == [
+            {"id": "form-c", "meta": {"department": "CS"}},
+            {"id": "form-b", "meta": {"department": "Bio"}},
+        ]
+        first = await forms.find_one({"created_by": "admin-1"}, {"_id": 0, "id": 1}, sort=[("title", -1)])
+        assert first == {"id": "form-c"}
+        assert await forms.find_one({"id": "form-z"}) is None
+
+        assert await forms.count_documents({"created_by": "admin-1"}) == 3
+        assert sorted(await forms.distinct("meta.department")) == ["Bio", "CS"]
+        assert sorted(await forms.distinct("id", {"is_active": True, "created_by": "admin-1"})) == ["form-a", "form-c"]
+
+        seen = [document["id"] async for document in forms.find({"is_active": True}).sort("id", 1)]
+        assert seen == ["form-a", "form-c", "form-d"]
+
+    asyncio.run(scenario())
+
+
+def test_keyset_pages(make_db):
+    async def scenario():
+        db = make_db()
+        await db.feedback_forms.insert_many([dict(form, is_active=True, created_by="admin-1") for form in FORMS])
+
+        pages, cursor = [], None
+        while True:
+            query = pagination.form_page_filter("admin-1", {}, "created_at", -1, cursor)
+            page = await db.feedback_forms.find(query).sort(pagination.form_sort("created_at", -1)).to_list(length=2)
+            if not page:
+                break
+            pages.append([form["id"] for form in page])
+            last = page[-1]
+            cursor = pagination.encode_form_cursor("created_at", -1, last["created_at"], last["id"])
+
+        assert pages == [["form-d", "form-c"], ["form-b", "form-a"]]
+
+    asyncio.run(scenario())
+
+
+def test_updates(make_db):
+    async def scenario():
+        db = make_db()
+        aggregates_collection = db.form_aggregates
+        await aggregates_collection.insert_one({"form_id": "form-a", "response_count": 0, "subjects": {}})
+
+        result = await aggregates_collection.update_one(
+            {"form_id": "form-a"},
+            {"$inc": {"response_count": 2, "subjects.Math.sum": 9}, "$set": {"department": "CS"},
+             "$push": {"history": "first"}}
+        )
+        assert (result.matched_count, result.modified_count) == (1, 1)
+        await aggregates_collection.update_one({"form_id": "form-a"}, {"$unset": {"department": ""}, "$push": {"history": "second"}})
+        document = await aggregates_collection.find_one({"form_id": "form-a"}, {"_id": 0})
+        assert document == {"form_id": "form-a", "response_count": 2, "subjects": {"Math": {"sum": 9}},
+                            "history": ["first", "second"]}
+
+        missing = await aggregates_collection.update_one({"form_id": "form-z"}, {"$inc": {"response_count": 1}})
+        assert missing.matched_count == 0
+        assert await aggregates_collection.count_documents({"form_id": "form-z"}) == 0
+
+        upserted = await aggregates_collection.update_one(
+            {"form_id": "form-z", "period": "2024-05"}, {"$inc": {"response_count": 1}}, upsert=True
+        )
+        assert upserted.upserted_id is not None
+        assert await aggregates_collection.find_one({"form_id": "form-z"}, {"_id": 0}) == {
+            "form_id": "form-z", "period": "2024-05", "response_count": 1
+        }
+
+        for expected in (1, 2):
+            counter = await db.counters.find_one_and_update(
+                {"name": "exports"}, {"$inc": {"value": 1}}, projection={"_id": 0, "value": 1},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+            assert counter == {"value": expected}
+
+        replaced = await aggregates_collection.replace_one({"form_id": "form-a"}, {"form_id": "form-a", "version": 3})
+        assert replaced.matched_count == 1
+        assert await aggregates_collection.find_one({"form_id": "form-a"}, {"_id": 0}) == {"form_id": "form-a", "version": 3}
+        await aggregates_collection.replace_one({"form_id": "form-y"}, {"form_id": "form-y", "version": 1}, upsert=True)
+        assert await aggregates_collection.count_documents({}) == 3
+
+        assert (await aggregates_collection.delete_one({"form_id": "form-y"})).deleted_count == 1
+        assert (await aggregates_collection.delete_many({})).deleted_count == 2
+
+    asyncio.run(scenario())
+
+
+def test_datetimes_are_stored_to_the_millisecond(make_db):
+    async def scenario():
+        db = make_db()
+        await db.student_feedbacks.insert_one({"id": "fb-1", "submitted_at": datetime(2024, 5, 1, 12, 30, 15, 123456)})
+        document = await db.student_feedbacks.find_one({"id": "fb-1"})
+        assert document["submitted_at"] == datetime(2024, 5, 1, 12, 30, 15, 123000)
+
+    asyncio.run(scenario())
+
+
+def test_unique_indexes(make_db):
+    async def scenario():
+        db = make_db()
+        feedbacks = db.student_feedbacks
+        await feedbacks.create_index([("form_id", 1), ("student_id", 1)], unique=True)
+        spec = IndexSpec("student_feedbacks", [("form_id", 1), ("student_id", 1)], unique=True)
+        assert any(spec.matches(info) for info in (await feedbacks.index_information()).values())
+
+        await feedbacks.insert_one({"form_id": "form-a", "student_id": "CS0001"})
+        with pytest.raises(DuplicateKeyError) as raised:
+            await feedbacks.insert_one({"form_id": "form-a", "student_id": "CS0001"})
+        assert raised.value.code == 11000
+
+        with pytest.raises(BulkWriteError) as raised:
+            await feedbacks.insert_many([
+                {"form_id": "form-a", "student_id": "CS0002"},
+                {"form_id": "form-a", "student_id": "CS0001"},
+                {"form_id": "form-b", "student_id": "CS0001"},
+            ], ordered=False)
+        errors = raised.value.details["writeErrors"]
+        assert [(error["index"], error["code"]) for error in errors] == [(1, 11000)]
+        assert await feedbacks.count_documents({}) == 3
+
+    asyncio.run(scenario())
+
+
+def test_text_search(make_db):
+    async def scenario():
+        db = make_db()
+        await db.student_feedbacks.create_index([("comments", "text")])
+        await db.student_feedbacks.insert_many([
+            {"id": "fb-1", "form_id": "form-a", "comments": "Lectures move too fast", "submitted_at": datetime(2024, 5, 1)},
+            {"id": "fb-2", "form_id": "form-a", "comments": "Office hours helped with lectures", "submitted_at": datetime(2024, 5, 2)},
+            {"id": "fb-3", "form_id": "form-b", "comments": "Lectures recorded", "submitted_at": datetime(2024, 5, 3)},
+            {"id": "fb-4", "form_id": "form-a", "comments": "Great labs", "submitted_at": datetime(2024, 5, 4)},
+        ])
+
+        total, hits = await search.search_comments(db, "lectures", ["form-a"])
+        assert total == 2
+        assert sorted(hit["id"] for hit in hits) == ["fb-1", "fb-2"]
+        assert all(hit["score"] > 0 and "_id" not in hit for hit in hits)
+        assert await search.search_comments(db, "lectures", []) == (0, [])
+
+    asyncio.run(scenario())
+
+
+def test_rollup_pipeline(make_db):
+    async def scenario():
+        db = make_db()
+        for form_id, department, ratings in (
+            ("form-a", "CS", [{"Math": {"Clarity": 4}}, {"Math": {"Clarity": 2}}]),
+            ("form-b", "CS", [{"Math": {"Clarity": 5}}]),
+            ("form-c", "Bio", [{"Cells": {"Clarity": 3}}]),
+        ):
+            await aggregates.create_form_aggregate(db, {
+                "id": form_id, "created_by": "admin-1", "is_active": True,
+                "department": department, "year": "2024", "section": "A",
+            })
+            await aggregates.record_feedbacks(db, form_id, [{"ratings": rating} for rating in ratings])
+
+        groups = await rollups.compute_rollup(db, "admin-1", "department")
+        assert [(group["key"], group["form_count"], group["total_responses"]) for group in groups] == [
+            ("Bio", 1, 1), ("CS", 2, 3)
+        ]
+        assert groups[1]["average_ratings_per_criterion"] == {"Math": {"Clarity": 11 / 3}}
+        assert await rollups.compute_rollup(db, "admin-2", "year") == []
+
+    asyncio.run(scenario())
+
+
+def test_unsupported_operators_fail_loudly():
+    async def scenario():
+        db = MemoryClient()["feedback_test"]
+        await db.feedback_forms.insert_one({"id": "form-a", "title": "Algebra"})
+        with pytest.raises(OperationFailure):
+            await db.feedback_forms.find({"title": {"$regex": "^Al"}}).to_list(length=None)
+        with pytest.raises(OperationFailure):
+            await db.feedback_forms.update_one({"id": "form-a"}, {"$addToSet": {"tags": "math"}})
+        with pytest.raises(OperationFailure):
+            await db.feedback_forms.aggregate([{"$sort": {"title": 1}}]).to_list(length=None)
+
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+"""Form listing cursors."""
+import base64
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backup_python_backend"))
+
+import pagination  # noqa: E402
+
+
+def raw_cursor(*parts) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(parts)).encode()).decode().rstrip("=")
+
+
+def test_form_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30)
+    cursor = pagination.encode_form_cursor("created_at", -1, created_at, "form-1")
+    query = pagination.form_page_filter("admin-1", {}, "created_at", -1, cursor)
+    assert query["$or"] == [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": "form-1"}},
+    ]
+
+
+def test_form_cursor_rejects_operator_values():
+    for value in ({"$ne": None}, ["title"], True, None):
+        with pytest.raises(ValueError):
+            pagination.decode_form_cursor(raw_cursor("title", 1, value, "form-1"), "title", 1)
+    with pytest.raises(ValueError):
+        pagination.decode_form_cursor(raw_cursor("title", 1, "Algebra", {"$gt": ""}), "title", 1)
+    with pytest.raises(ValueError):
+        pagination.decode_form_cursor(raw_cursor("response_count", -1, "3", "form-1"), "response_count", -1)
+
+
+def test_form_cursor_rejects_other_order():
+    cursor = pagination.encode_form_cursor("response_count", -1, 3, "form-1")
+    assert pagination.decode_form_cursor(cursor, "response_count", -1) == (3, "form-1")
+    with pytest.raises(ValueError):
+        pagination.decode_form_cursor(cursor, "response_count", 1)
+    with pytest.raises(ValueError):
+        pagination.decode_form_cursor(cursor, "title", -1)
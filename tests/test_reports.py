@@ -0,0 +1,62 @@
+"""Report jobs render exactly the version they read."""
+import asyncio
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backup_python_backend"))
+
+import aggregates  # noqa: E402
+import reports  # noqa: E402
+
+FORM = {
+    "id": "report-form", "title": "Report", "created_by": "admin-1", "is_active": True,
+    "department": "Computer Science", "year": "2024", "section": "A",
+    "subjects": ["Algorithms"], "evaluation_criteria": ["Clarity"],
+}
+
+
+def make_feedback(student_id: str, clarity: int) -> dict:
+    ratings = {"Algorithms": {"Clarity": clarity}}
+    return {
+        "id": str(uuid.uuid4()), "form_id": FORM["id"], "student_id": student_id,
+        "ratings": ratings, "averages": aggregates.compute_averages(ratings),
+        "submitted_at": datetime.utcnow(),
+    }
+
+
+async def seed_form(db):
+    await db.feedback_forms.insert_one(dict(FORM))
+    await aggregates.create_form_aggregate(db, FORM)
+    feedbacks = [make_feedback("CS0001", 4), make_feedback("CS0002", 2)]
+    await db.student_feedbacks.insert_many([dict(feedback) for feedback in feedbacks])
+    await aggregates.record_inserted(db, feedbacks)
+
+
+def test_snapshot_returns_the_version_its_ratings_belong_to(make_db):
+    async def scenario():
+        db = make_db()
+        await seed_form(db)
+
+        version, form_doc, ratings = await reports.load_snapshot(db, FORM["id"])
+        assert version == 1
+        assert form_doc["title"] == "Report"
+        assert sorted(ratings[:, 0, 0].tolist()) == [2.0, 4.0]
+
+    asyncio.run(scenario())
+
+
+def test_snapshot_rejects_submissions_the_aggregate_has_not_counted(make_db):
+    async def scenario():
+        db = make_db()
+        await seed_form(db)
+        # Inserted, but its $inc of the aggregate (and version) has not landed yet
+        await db.student_feedbacks.insert_one(make_feedback("CS0003", 5))
+
+        with pytest.raises(RuntimeError):
+            await reports.load_snapshot(db, FORM["id"])
+
+    asyncio.run(scenario())